@@ -0,0 +1,119 @@
+from ArchiveAnalysis.GroupedStatistics import GroupedStatistics
+from ArchiveAnalysis.GroupedQuantiles import GroupedQuantiles
+from ArchiveAnalysis.GroupedDistinctCounts import GroupedDistinctCounts
+from ArchiveAnalysis.PersonAnalyser import PersonAnalyser
+
+"""This class is the base of the analysers that perform the calculations of the PersonAnalyser from statistics that
+can be merged, rather than from a single data frame with all the appearances: the PartitionedPersonAnalyser and the
+IncrementalPersonAnalyser.
+
+Calculations that need the rows themselves (e.g. query, pivotDataFrame, buildCube and the statistics that are left to
+pandas, such as first) are not available, and raise a NotImplementedError naming the calculation, as does the data
+frame itself. Subclasses provide countRowsInDataframe, countProgrammeBroadcasts and the grouped statistics, quantiles
+and distinct counts they can calculate.
+"""
+
+class AggregatedPersonAnalyser(PersonAnalyser):
+
+    DESCRIPTION = "an aggregated analyser"
+
+    @classmethod
+    def fromCsv(cls, filename, separator=PersonAnalyser.CSV_SEPARATOR, dtypes=None,
+                chunkSize=PersonAnalyser.CSV_CHUNK_SIZE):
+        """Not available, as the analyser is not created from a single data frame"""
+        raise NotImplementedError("fromCsv needs a single data frame, which %s doesn't have, use a PersonAnalyser "
+                                  "for this calculation" % cls.DESCRIPTION)
+
+    @classmethod
+    def fromCachedCsv(cls, filename, separator=PersonAnalyser.CSV_SEPARATOR, dtypes=None,
+                      chunkSize=PersonAnalyser.CSV_CHUNK_SIZE, cacheFolder=None, verifyHash=False):
+        """Not available, as the analyser is not created from a single data frame"""
+        raise NotImplementedError("fromCachedCsv needs a single data frame, which %s doesn't have, use a "
+                                  "PersonAnalyser for this calculation" % cls.DESCRIPTION)
+
+    def _raiseUnsupported(self, methodName):
+        """Raises the error for a calculation that needs the rows of a single data frame"""
+        raise NotImplementedError("%s needs a single data frame, which %s doesn't have, use a PersonAnalyser for "
+                                  "this calculation" % (methodName, self.DESCRIPTION))
+
+    @property
+    def dataframe(self):
+        """Not available, as there is no single data frame"""
+        self._raiseUnsupported("Accessing the dataframe")
+
+    def invalidateCaches(self):
+        """Clears the cached results. There are no factorised columns, as there is no single data frame"""
+        self.clearResultCache()
+
+    def countRowsInDataframe(self):
+        """Counts how many rows there are in all the data together"""
+        raise NotImplementedError("Subclasses count their rows")
+
+    def getColumnTotal(self, columnName):
+        """Not available, as there is no single data frame"""
+        self._raiseUnsupported("getColumnTotal")
+
+    def getColumnCount(self, columnName, columnValue=None):
+        """Counts the rows, the occurrences of a value are not available, as there is no single data frame"""
+        if columnValue:
+            self._raiseUnsupported("getColumnCount with a column value")
+        return self.countRowsInDataframe()
+
+    def summarizeColumns(self, columnNames, columnValues=None):
+        """Not available, as there is no single data frame"""
+        self._raiseUnsupported("summarizeColumns")
+
+    def query(self):
+        """Not available, as there is no single data frame"""
+        self._raiseUnsupported("query")
+
+    def pivotDataFrame(self, indexColumns, valueColumns, aggregationFunction):
+        """Not available, as there is no single data frame"""
+        self._raiseUnsupported("pivotDataFrame")
+
+    def calculateStatisticsPerColumnValue(self, columnName, valueColumns, statistic, excludeZeros=False, sortColumn=None,
+                                          topN=None, otherLabel=None):
+        """Calculates the specified statistic for each of the value columns, for each value in columnName, see
+        DataframeAnalyser. Only the statistics that can be merged (sum, count, mean, min, max and nonzero_count)
+        are available, the others are left to pandas, which needs a single data frame
+        Returns a list of the column values, and a list of lists of the corresponding statistics"""
+        if statistic not in GroupedStatistics.STATISTICS:
+            self._raiseUnsupported("calculateStatisticsPerColumnValue for statistic %s" % statistic)
+        return super().calculateStatisticsPerColumnValue(columnName, valueColumns, statistic, excludeZeros, sortColumn,
+                                                         topN, otherLabel)
+
+    def calculateGroupedStatistics(self, columnName, valueColumns, excludeZeros=False, statistics=None):
+        """Not available, unless the subclass keeps grouped statistics"""
+        self._raiseUnsupported("calculateGroupedStatistics")
+
+    def calculateGroupedQuantiles(self, columnName, valueColumns, exact=False,
+                                  relativeAccuracy=GroupedQuantiles.DEFAULT_ACCURACY, excludeZeros=False):
+        """Not available, unless the subclass keeps distributions"""
+        self._raiseUnsupported("calculateGroupedQuantiles")
+
+    def calculateGroupedDistinctCounts(self, columnNames, distinctColumn, approximate=False,
+                                       precision=GroupedDistinctCounts.DEFAULT_PRECISION):
+        """Not available, unless the subclass keeps distinct counts"""
+        self._raiseUnsupported("calculateGroupedDistinctCounts")
+
+    def countProgrammeBroadcasts(self, programmeColumn, dateColumn):
+        """Counts the number of broadcasts per programme"""
+        raise NotImplementedError("Subclasses count their broadcasts")
+
+    def calculateTimeSeriesPerColumnValue(self, columnName, dateColumnName, timeColumns,
+                                          period=PersonAnalyser.PERIOD_WEEK):
+        """Not available, as there is no single data frame"""
+        self._raiseUnsupported("calculateTimeSeriesPerColumnValue")
+
+    def addWeekColumns(self, weekColumn="Week", dateColumn="Date", year=None):
+        """Not available, as there is no single data frame to add the columns to"""
+        self._raiseUnsupported("addWeekColumns")
+
+    def buildCube(self, dimensions=None, valueColumns=None, rollups=None):
+        """Not available, as there is no single data frame"""
+        self._raiseUnsupported("buildCube")
+
+    def buildCoAppearanceMatrix(self, personColumn="Name", programmeColumn="Programme", dateColumn="Date",
+                                timeColumn=None):
+        """Not available, as there is no single data frame"""
+        self._raiseUnsupported("buildCoAppearanceMatrix")
@@ -0,0 +1,139 @@
+import copy
+import numpy as np
+import pandas as pd
+from ArchiveAnalysis.GroupedStatistics import GroupedStatistics
+
+"""This class records a query on the data frame of an analyser: filter -> group -> aggregate -> sort -> limit. Each
+step returns a new query, so a query can be built up and refined step by step, e.g.
+
+    query = analyser.query().filter("Party role", "government").groupBy("Name")
+    names, times = query.aggregate(PersonAnalyser.TIME_COLUMNS, "sum").sort("Total time recognised (s)").execute()
+
+Nothing is calculated until execute is called. The filters are then turned into one row mask, using the factorised
+columns of the analyser's group key index, and only the value columns of the query are read from the data frame. The
+data frame is never copied, and the results are the same as those of the analyser methods on the filtered data frame.
+"""
+
+class AnalyserQuery():
+
+    def __init__(self, analyser):
+        self.analyser = analyser
+        self.filters = []
+        self.groupColumn = None
+        self.valueColumns = None
+        self.statistics = None
+        self.excludeZeros = False
+        self.sortColumn = None
+        self.topN = None
+        self.otherLabel = None
+
+    def __withChanges(self, **changes):
+        query = copy.copy(self)
+        query.filters = list(self.filters)
+        for name, value in changes.items():
+            setattr(query, name, value)
+        return query
+
+    def filter(self, columnName, values, exclude=False):
+        """Keeps only the rows where the column has one of the values (a single value or a list). If exclude is
+        true, these rows are left out instead
+        Returns the new query"""
+        if not isinstance(values, (list, tuple, set, np.ndarray, pd.Series)):
+            values = [values]
+        query = self.__withChanges()
+        query.filters.append((columnName, list(values), exclude, None, None))
+        return query
+
+    def filterRange(self, columnName, minimum=None, maximum=None):
+        """Keeps only the rows where the (numeric) column lies between minimum and maximum, inclusive. Either bound
+        can be left out
+        Returns the new query"""
+        query = self.__withChanges()
+        query.filters.append((columnName, None, False, minimum, maximum))
+        return query
+
+    def groupBy(self, columnName):
+        """Groups the rows by the values of the column
+        Returns the new query"""
+        return self.__withChanges(groupColumn=columnName)
+
+    def aggregate(self, valueColumns, statistics, excludeZeros=False):
+        """Calculates the statistic (sum, count, mean, min, max or nonzero_count), or a list of statistics, of each of
+        the value columns per group. if excludeZeros is true, then zero values are excluded from the calculation
+        Returns the new query"""
+        return self.__withChanges(valueColumns=list(valueColumns), statistics=statistics, excludeZeros=excludeZeros)
+
+    def sort(self, sortColumn):
+        """Sorts the groups on the first statistic of the column, in descending order
+        Returns the new query"""
+        return self.__withChanges(sortColumn=sortColumn)
+
+    def limit(self, topN, otherLabel=None):
+        """Keeps only the first topN groups after sorting. If otherLabel is given, the remaining groups are combined
+        into one extra group with that label
+        Returns the new query"""
+        return self.__withChanges(topN=topN, otherLabel=otherLabel)
+
+    def execute(self):
+        """Calculates the result of the query
+        Returns a list of the group values, and for a single statistic a list of lists of the corresponding values,
+        as calculateStatisticsPerColumnValue. For a list of statistics, a dictionary with a list of lists per
+        statistic, as calculateMultipleStatisticsPerColumnValue"""
+
+        if self.groupColumn is None or self.valueColumns is None:
+            raise ValueError("A query needs a groupBy and an aggregate step")
+
+        statistics = [self.statistics] if isinstance(self.statistics, str) else list(self.statistics)
+        for statistic in statistics:
+            if statistic not in GroupedStatistics.STATISTICS:
+                raise ValueError("Statistic %s can't be used in a query" % statistic)
+
+        if self.filters:
+            groupValues, output = self.__calculateFiltered(statistics)
+        else:  # the same calculation as the analyser, which may already have the result cached
+            groupValues, output = self.analyser.calculateMultipleStatisticsPerColumnValue(
+                self.groupColumn, self.valueColumns, statistics, self.excludeZeros, self.sortColumn, self.topN,
+                self.otherLabel)
+
+        if isinstance(self.statistics, str):
+            return groupValues, output[self.statistics]
+        return groupValues, output
+
+    def getRowMask(self):
+        """Combines the filters into one mask
+        Returns a boolean array with a value per row of the data frame, or None if there are no filters"""
+
+        mask = None
+        groupKeyIndex = self.analyser.groupKeyIndex
+        for columnName, values, exclude, minimum, maximum in self.filters:
+            if values is not None:
+                codes, uniques = groupKeyIndex.getCodes(columnName)
+                valueCodes = pd.Index(uniques).get_indexer(values)
+                columnMask = np.isin(codes, valueCodes[valueCodes >= 0])
+                if exclude:
+                    columnMask = ~columnMask
+            else:
+                columnValues = self.analyser.dataframe[columnName].to_numpy()
+                columnMask = np.ones(len(columnValues), dtype=bool)
+                if minimum is not None:
+                    columnMask &= columnValues >= minimum
+                if maximum is not None:
+                    columnMask &= columnValues <= maximum
+            mask = columnMask if mask is None else mask & columnMask
+        return mask
+
+    def __calculateFiltered(self, statistics):
+        rows = np.flatnonzero(self.getRowMask())
+
+        columns = list(self.valueColumns)
+        if self.sortColumn and self.sortColumn not in columns:
+            columns.append(self.sortColumn)
+
+        codes, groupValues = self.analyser.groupKeyIndex.getCodes(self.groupColumn)
+        dataframe = self.analyser.dataframe
+        valueArrays = [dataframe[column].to_numpy()[rows] for column in columns]
+        groupedStatistics = GroupedStatistics.fromArrays(codes[rows], groupValues, columns, valueArrays,
+                                                         self.excludeZeros, statistics)
+
+        return groupedStatistics.calculateOutput(self.valueColumns, statistics, self.sortColumn, topN=self.topN,
+                                                 otherLabel=self.otherLabel)
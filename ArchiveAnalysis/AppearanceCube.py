@@ -0,0 +1,166 @@
+import itertools
+import numpy as np
+import pandas as pd
+from ArchiveAnalysis.GroupedStatistics import GroupedStatistics
+
+"""This class is a precomputed OLAP cube of appearance statistics. It holds the sums, counts, minimums and maximums of
+the value columns (e.g. the times) for every combination of dimension values that occurs (e.g. every combination of
+gender, party, party ideology, programme and type), and the rollups of these to combinations of fewer dimensions.
+
+The cube is built with one pass over the data frame. After that, every breakdown, slice or drill-down is answered
+from the cube, which has a row per combination rather than per appearance.
+
+Missing dimension values are kept as a separate value in the cube, so they still count towards rollups over other
+dimensions, but they are left out of the results when grouping by that dimension (as in a pivot table).
+"""
+
+class AppearanceCube():
+
+    TOTAL_LABEL = "Total"
+
+    def __init__(self, dimensions, dimensionValues, cuboids):
+        """Initialises the cube from its cuboids. cuboids is a dictionary with a tuple of dimensions as key, and as
+        value an array with the codes of the dimension values of each cell together with the GroupedStatistics of
+        the cells. Usually you will want to use fromDataframe instead"""
+        self.dimensions = list(dimensions)
+        self.dimensionValues = dimensionValues
+        self.cuboids = cuboids
+
+    @classmethod
+    def fromDataframe(cls, dataframe, dimensions, valueColumns, rollups=None, groupKeyIndex=None):
+        """Builds the cube for the dimensions and value columns of the data frame. rollups is an optional list of
+        combinations of dimensions to precompute, by default every combination is precomputed. Combinations that
+        are not precomputed are rolled up from the full cube when they are queried.
+        If a GroupKeyIndex is given, the dimension columns that it has already factorised are reused
+        Returns the cube"""
+
+        if not dimensions:
+            raise ValueError("A cube needs at least one dimension")
+
+        dimensionValues = {}
+        rowCodes = []
+        for dimension in dimensions:
+            if groupKeyIndex is not None:
+                codes, values = groupKeyIndex.getCodes(dimension)
+            else:
+                codes, values = GroupedStatistics.factorizeValues(dataframe[dimension])
+            dimensionValues[dimension] = values
+            rowCodes.append(np.where(codes >= 0, codes, len(values)))  # missing values get a code of their own
+
+        cellCodes, rowCells = cls.__combineCodes(rowCodes, [len(dimensionValues[dimension]) + 1
+                                                            for dimension in dimensions], len(dataframe.index))
+        valueArrays = [dataframe[column].to_numpy() for column in valueColumns]
+        cellStatistics = GroupedStatistics.fromArrays(rowCells, np.arange(len(cellCodes)), valueColumns, valueArrays)
+
+        cube = cls(dimensions, dimensionValues, {tuple(dimensions): (cellCodes, cellStatistics)})
+
+        if rollups is None:
+            rollups = [combination for size in range(len(dimensions))
+                       for combination in itertools.combinations(dimensions, size)]
+        for rollup in rollups:
+            cube.cuboids[cube.__getCuboidKey(rollup)] = cube.__rollUp(rollup)
+
+        return cube
+
+    @staticmethod
+    def __combineCodes(codesList, sizes, numberOfRows):
+        """Combines the codes of several dimensions into one code per distinct combination
+        Returns an array with the codes of each dimension per combination, and the combination of each row"""
+        if not codesList:
+            return np.zeros((1, 0), dtype=np.intp), np.zeros(numberOfRows, dtype=np.intp)
+
+        if np.prod([float(size) for size in sizes]) < 2 ** 62:
+            combined = np.zeros(numberOfRows, dtype=np.int64)
+            for codes, size in zip(codesList, sizes):
+                combined = combined * size + codes
+            uniqueCombined, inverse = np.unique(combined, return_inverse=True)
+            combinationCodes = np.zeros((len(uniqueCombined), len(codesList)), dtype=np.intp)
+            for i in range(len(codesList) - 1, -1, -1):
+                combinationCodes[:, i] = uniqueCombined % sizes[i]
+                uniqueCombined = uniqueCombined // sizes[i]
+        else:  # too many combinations for one integer code
+            combinationCodes, inverse = np.unique(np.stack(codesList, axis=1), axis=0, return_inverse=True)
+        return combinationCodes, inverse.reshape(-1)
+
+    def __getCuboidKey(self, dimensions):
+        for dimension in dimensions:
+            if dimension not in self.dimensions:
+                raise ValueError("%s is not a dimension of this cube" % dimension)
+        return tuple(dimension for dimension in self.dimensions if dimension in dimensions)
+
+    def __rollUp(self, dimensions):
+        """Rolls the smallest precomputed cuboid that contains the dimensions up to those dimensions
+        Returns the codes of the cells, and their statistics"""
+        key = self.__getCuboidKey(dimensions)
+        if key in self.cuboids:
+            return self.cuboids[key]
+
+        sourceKey = min((cuboidKey for cuboidKey in self.cuboids if set(key) <= set(cuboidKey)),
+                        key=lambda cuboidKey: len(self.cuboids[cuboidKey][0]))
+        sourceCodes, sourceStatistics = self.cuboids[sourceKey]
+        columns = [sourceKey.index(dimension) for dimension in key]
+        sizes = [len(self.dimensionValues[dimension]) + 1 for dimension in key]
+
+        cellCodes, sourceCells = self.__combineCodes([sourceCodes[:, column] for column in columns], sizes,
+                                                     len(sourceCodes))
+        return cellCodes, sourceStatistics.regroup(sourceCells, np.arange(len(cellCodes)))
+
+    def __getLabels(self, dimensions, cellCodes):
+        if not dimensions:
+            return np.array([self.TOTAL_LABEL] * len(cellCodes), dtype=object)
+        columns = []
+        for i, dimension in enumerate(dimensions):
+            values = np.concatenate((self.dimensionValues[dimension].astype(object), [np.nan]))
+            columns.append(values[cellCodes[:, i]])
+        if len(dimensions) == 1:
+            return columns[0]
+        labels = np.empty(len(cellCodes), dtype=object)
+        labels[:] = list(zip(*columns))
+        return labels
+
+    def query(self, groupBy, valueColumns, statistic, filters=None, excludeZeros=False, sortColumn=None, topN=None,
+              otherLabel=None):
+        """Calculates the statistic (sum, count, mean, min, max or nonzero_count) of each of the value columns, for
+        each combination of values of the groupBy dimensions, from the cube. E.g. groupBy ["Party", "Gender"] gives
+        the statistics per party per gender. With an empty groupBy the statistic is calculated over everything.
+        filters is an optional dictionary with, for some dimensions, a value or list of values to keep (a slice)
+        if excludeZeros is true, then zero values in the value columns will be excluded from the calculation (not
+        possible for min and max)
+        sortColumn, topN and otherLabel sort and limit the results, as for the analyser methods
+        Returns a list of the dimension values (tuples if grouping by more than one dimension), and a list of lists
+        of the corresponding statistics"""
+
+        if filters is None:
+            filters = {}
+        groupKey = tuple(groupBy)
+        cuboidKey = self.__getCuboidKey(set(groupKey) | set(filters.keys()))
+        cellCodes, cellStatistics = self.__rollUp(cuboidKey)
+
+        keep = np.ones(len(cellCodes), dtype=bool)
+        for dimension, values in filters.items():
+            if not isinstance(values, (list, tuple, set, np.ndarray)):
+                values = [values]
+            valueCodes = pd.Index(self.dimensionValues[dimension]).get_indexer(list(values))
+            keep &= np.isin(cellCodes[:, cuboidKey.index(dimension)], valueCodes[valueCodes >= 0])
+        for dimension in groupKey:  # missing values are not a group of their own
+            keep &= cellCodes[:, cuboidKey.index(dimension)] < len(self.dimensionValues[dimension])
+
+        cellCodes = cellCodes[keep]
+        cellStatistics = cellStatistics.selectGroups(np.flatnonzero(keep))
+        if groupKey != cuboidKey:  # roll the filtered cells up to the grouping dimensions, in the order given
+            columns = [cuboidKey.index(dimension) for dimension in groupKey]
+            cellCodes, groupCells = self.__combineCodes([cellCodes[:, column] for column in columns],
+                                                        [len(self.dimensionValues[dimension]) + 1
+                                                         for dimension in groupKey], len(cellCodes))
+            cellStatistics = cellStatistics.regroup(groupCells, np.arange(len(cellCodes)))
+
+        if excludeZeros:
+            cellStatistics = cellStatistics.excludingZeros()
+        cellStatistics.groupValues = self.__getLabels(groupKey, cellCodes)
+
+        columns = list(valueColumns)
+        if sortColumn and sortColumn not in columns:
+            columns.append(sortColumn)
+        groupValues, output = cellStatistics.selectColumns(columns).calculateOutput(
+            valueColumns, [statistic], sortColumn, topN=topN, otherLabel=otherLabel)
+        return groupValues, output[statistic]
@@ -0,0 +1,110 @@
+import numpy as np
+from scipy import sparse
+from ArchiveAnalysis.GroupedStatistics import GroupedStatistics
+
+"""This class holds for every pair of persons how often they appeared in the same broadcast (the same programme on
+the same date), and optionally how much time they were recognised in these shared broadcasts.
+
+It is calculated from a sparse person x broadcast incidence matrix, which is multiplied with its own transpose. Only
+pairs of persons that share at least one broadcast are stored, so it stays small even for the whole archive, unlike
+a merge of the appearances with themselves.
+"""
+
+class CoAppearanceMatrix():
+
+    def __init__(self, persons, counts, times=None):
+        """Initialises the matrix. counts is a sparse matrix with the number of shared broadcasts per pair of
+        persons, times optionally a sparse matrix with, per pair, the time the first person was recognised in the
+        broadcasts they shared with the second. times stores the same pairs as counts, including pairs with a shared
+        time of zero. Usually you will want to use fromDataframe instead"""
+        self.persons = persons
+        self.counts = counts
+        self.times = times
+
+    @classmethod
+    def fromDataframe(cls, dataframe, personColumn, programmeColumn, dateColumn, timeColumn=None, groupKeyIndex=None):
+        """Calculates the co-appearances of the persons in personColumn, where a broadcast is a combination of
+        programme and date. If a time column is given, the co-occurring time is calculated as well.
+        If a GroupKeyIndex is given, the columns that it has already factorised are reused
+        Returns the CoAppearanceMatrix"""
+
+        def getCodes(column):
+            if groupKeyIndex is not None:
+                return groupKeyIndex.getCodes(column)
+            return GroupedStatistics.factorizeValues(dataframe[column])
+
+        personCodes, persons = getCodes(personColumn)
+        programmeCodes, programmes = getCodes(programmeColumn)
+        dateCodes, dates = getCodes(dateColumn)
+
+        isComplete = (personCodes >= 0) & (programmeCodes >= 0) & (dateCodes >= 0)
+        broadcasts = programmeCodes[isComplete].astype(np.int64) * len(dates) + dateCodes[isComplete]
+        broadcastCodes, broadcastIndex = np.unique(broadcasts, return_inverse=True)
+        personCodes = personCodes[isComplete]
+        shape = (len(persons), len(broadcastCodes))
+
+        # a person appears in a broadcast or not, however many rows there are for it
+        incidence = sparse.csr_matrix((np.ones(len(personCodes)), (personCodes, broadcastIndex.reshape(-1))),
+                                      shape=shape)
+        incidence.data[:] = 1
+
+        counts = cls.__withoutDiagonal(incidence @ incidence.T)
+        counts.data = np.rint(counts.data).astype(np.int64)
+
+        times = None
+        if timeColumn:
+            timeValues = np.nan_to_num(dataframe[timeColumn].to_numpy(dtype=np.float64)[isComplete])
+            personTimes = sparse.csr_matrix((timeValues, (personCodes, broadcastIndex.reshape(-1))), shape=shape)
+            sharedTimes = sparse.csr_matrix(personTimes @ incidence.T)
+
+            # the times are stored for the same pairs as the counts, also when the shared time is zero
+            rows, columns = counts.nonzero()
+            times = sparse.csr_matrix((np.asarray(sharedTimes[rows, columns]).reshape(-1), (rows, columns)),
+                                      shape=counts.shape)
+
+        return cls(persons, counts, times)
+
+    @staticmethod
+    def __withoutDiagonal(matrix):
+        matrix = sparse.csr_matrix(matrix)
+        matrix.setdiag(0)
+        matrix.eliminate_zeros()
+        return matrix
+
+    def getPartners(self, person, byTime=False):
+        """Gets the persons that appeared in the same broadcasts as the given person
+        Returns a list of the partners, and a list of the numbers of shared broadcasts (or co-occurring times if
+        byTime is true), in descending order"""
+        partners, values = self.__selectTopPartners(np.array([self.__getPersonIndex(person)]), None, byTime)
+        return partners[0], values[0]
+
+    def getTopPartners(self, k=None, byTime=False):
+        """Gets for each person the k persons they appeared with most often (or with most time if byTime is true).
+        Ties are ordered by the order of the persons
+        Returns a list of the persons, a list of lists of their partners, and a list of lists of the corresponding
+        numbers of shared broadcasts (or co-occurring times)"""
+        partners, values = self.__selectTopPartners(np.arange(len(self.persons)), k, byTime)
+        return list(self.persons), partners, values
+
+    def __selectTopPartners(self, rows, k, byTime):
+        matrix = self.times if byTime else self.counts
+        if matrix is None:
+            raise ValueError("No time column was given when calculating the co-appearances")
+        matrix = matrix[rows].tocsr()
+
+        # sort the partners of every row by descending value, and keep the first k of each row
+        rowIndex = np.repeat(np.arange(len(rows)), np.diff(matrix.indptr))
+        order = np.lexsort((matrix.indices, -matrix.data, rowIndex))
+        if k is not None:
+            order = order[np.arange(len(order)) - matrix.indptr[rowIndex[order]] < k]
+        splits = np.cumsum(np.bincount(rowIndex[order], minlength=len(rows)))[:-1]
+
+        partners = np.split(np.asarray(self.persons)[matrix.indices[order]], splits)
+        values = np.split(matrix.data[order], splits)
+        return [list(row) for row in partners], [list(row) for row in values]
+
+    def __getPersonIndex(self, person):
+        positions = np.flatnonzero(np.asarray(self.persons) == person)
+        if len(positions) == 0:
+            raise ValueError("%s does not appear in the data" % person)
+        return positions[0]
@@ -0,0 +1,118 @@
+import numpy as np
+import pandas as pd
+
+"""This class holds a summary of several columns of a data frame: the number of rows, and per column the total, the
+number of values that are not missing, the number of values equal to a chosen value, and the minimum and maximum.
+The summary is calculated with a few NumPy reductions per column (the missing values, total, minimum and maximum are
+each one pass in compiled code), rather than by looping over the values in Python. Non-numeric columns (text and
+categories) are only counted: asking for their total, minimum or maximum raises a ValueError.
+"""
+
+class ColumnSummary():
+
+    def __init__(self, columns, rowCount, totals, nonNullCounts, valueCounts, minimums, maximums):
+        """Initialises the summary from dictionaries with a value per column. Usually you will want to use
+        fromDataframe instead"""
+        self.columns = list(columns)
+        self.rowCount = rowCount
+        self.totals = totals
+        self.nonNullCounts = nonNullCounts
+        self.valueCounts = valueCounts
+        self.minimums = minimums
+        self.maximums = maximums
+
+    @classmethod
+    def fromDataframe(cls, dataframe, columns, columnValues=None):
+        """Summarises the columns of the data frame. columnValues is an optional dictionary with, for some of the
+        columns, a value to count the occurrences of
+        Totals, minimums and maximums are only calculated for numeric columns, for other columns they are None and
+        only the counts are available
+        Returns the ColumnSummary"""
+
+        if columnValues is None:
+            columnValues = {}
+
+        totals = {}
+        nonNullCounts = {}
+        valueCounts = {}
+        minimums = {}
+        maximums = {}
+
+        for column in columns:
+            series = dataframe[column]
+
+            if isinstance(series.dtype, pd.CategoricalDtype):
+                # work on the integer codes, rather than converting the categories back to values
+                codes = series.cat.codes.to_numpy()
+                nonNullCounts[column] = int(np.count_nonzero(codes >= 0))
+                if column in columnValues:
+                    categories = series.cat.categories
+                    valueCounts[column] = int(np.count_nonzero(codes == categories.get_loc(columnValues[column]))) \
+                        if columnValues[column] in categories else 0
+                totals[column] = minimums[column] = maximums[column] = None
+                continue
+
+            values = series.to_numpy()
+            if values.dtype.kind in "biuf":
+                nonNullCounts[column] = int(len(values) - np.count_nonzero(np.isnan(values))) \
+                    if values.dtype.kind == "f" else len(values)
+                totals[column] = values.sum()
+                if nonNullCounts[column] > 0:
+                    minimums[column] = np.fmin.reduce(values)  # fmin and fmax skip missing values
+                    maximums[column] = np.fmax.reduce(values)
+                else:
+                    minimums[column] = maximums[column] = np.nan
+            else:
+                nonNullCounts[column] = int(np.count_nonzero(pd.notna(values)))
+                totals[column] = minimums[column] = maximums[column] = None
+
+            if column in columnValues:
+                valueCounts[column] = int(np.count_nonzero(values == columnValues[column]))
+
+        return cls(columns, len(dataframe.index), totals, nonNullCounts, valueCounts, minimums, maximums)
+
+    def __checkColumn(self, column):
+        if column not in self.columns:
+            raise ValueError("Column %s was not summarised" % column)
+
+    def __checkNumericColumn(self, column):
+        self.__checkColumn(column)
+        if self.totals[column] is None:
+            raise ValueError("Column %s is not numeric, only its counts were summarised" % column)
+
+    def getTotal(self, column):
+        """Returns the total of the values in the column"""
+        self.__checkNumericColumn(column)
+        return self.totals[column]
+
+    def getNonNullCount(self, column):
+        """Returns the number of values in the column that are not missing"""
+        self.__checkColumn(column)
+        return self.nonNullCounts[column]
+
+    def getValueCount(self, column):
+        """Returns the number of values in the column that are equal to the value given for it"""
+        self.__checkColumn(column)
+        if column not in self.valueCounts:
+            raise ValueError("No value was given to count for column %s" % column)
+        return self.valueCounts[column]
+
+    def getMinimum(self, column):
+        """Returns the smallest value in the column"""
+        self.__checkNumericColumn(column)
+        return self.minimums[column]
+
+    def getMaximum(self, column):
+        """Returns the largest value in the column"""
+        self.__checkNumericColumn(column)
+        return self.maximums[column]
+
+    def toDataframe(self):
+        """Returns the summary as a data frame, with a row per column"""
+        return pd.DataFrame({"total": [self.totals[column] for column in self.columns],
+                             "count": [self.rowCount] * len(self.columns),
+                             "non-null count": [self.nonNullCounts[column] for column in self.columns],
+                             "value count": [self.valueCounts.get(column) for column in self.columns],
+                             "min": [self.minimums[column] for column in self.columns],
+                             "max": [self.maximums[column] for column in self.columns]},
+                            index=self.columns)
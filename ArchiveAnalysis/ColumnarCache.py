@@ -0,0 +1,170 @@
+import hashlib
+import json
+import os
+import numpy as np
+import pandas as pd
+
+"""This class stores a data frame loaded from a csv file as a set of NumPy column files, in a folder next to the csv
+file. Loading the columns again is much faster than parsing the csv file. Numeric columns are read through a memory map
+and copied straight into the data frame, so they aren't held in memory twice while loading.
+
+Text columns are stored as integer codes plus an array of the distinct values. Categorical columns come back as
+categories, other text columns as objects.
+
+The cache is only used while the csv file is unchanged and is read with the same options. The size of the file must
+match, and if its modification time has changed, its content hash must still match. The separator and column types the
+cache was made with must be the same as those of the current read, as they change the columns that are parsed.
+"""
+
+class ColumnarCache():
+
+    CACHE_FOLDER_SUFFIX = ".cache"
+    METADATA_FILENAME = "metadata.json"
+    FORMAT_VERSION = 2
+    HASH_BLOCK_SIZE = 1 << 20
+
+    NUMERIC = "numeric"
+    CATEGORY = "category"
+    TEXT = "text"
+
+    def __init__(self, sourceFilename, cacheFolder=None):
+        """Initialises the cache for the csv file. By default the cache is kept in a folder with the name of the csv
+        file followed by .cache"""
+        self.sourceFilename = sourceFilename
+        self.cacheFolder = cacheFolder if cacheFolder else sourceFilename + self.CACHE_FOLDER_SUFFIX
+
+    @classmethod
+    def hashFile(cls, filename):
+        """Calculates the content hash of the file, reading it a block at a time
+        Returns the hash as a hexadecimal string"""
+        fileHash = hashlib.blake2b()
+        with open(filename, "rb") as file:
+            for block in iter(lambda: file.read(cls.HASH_BLOCK_SIZE), b""):
+                fileHash.update(block)
+        return fileHash.hexdigest()
+
+    @staticmethod
+    def getReadOptions(separator, dtypes):
+        """Normalises the options the csv file is read with, so they can be stored in and compared with the metadata.
+        dtypes can be None, one type for all columns, or a dictionary with a type per column
+        Returns a dictionary with the separator and the type names"""
+        if dtypes is None:
+            dtypeNames = None
+        elif isinstance(dtypes, dict):
+            dtypeNames = {str(column): str(pd.api.types.pandas_dtype(dtype)) for column, dtype in dtypes.items()}
+        else:
+            dtypeNames = str(pd.api.types.pandas_dtype(dtypes))
+        return {"separator": separator, "dtypes": dtypeNames}
+
+    def __getMetadataFilename(self):
+        return os.path.join(self.cacheFolder, self.METADATA_FILENAME)
+
+    def __readMetadata(self):
+        try:
+            with open(self.__getMetadataFilename(), "r") as file:
+                return json.load(file)
+        except (OSError, ValueError):
+            return None
+
+    def __writeMetadata(self, metadata):
+        temporaryFilename = self.__getMetadataFilename() + ".tmp"
+        with open(temporaryFilename, "w") as file:
+            json.dump(metadata, file)
+        os.replace(temporaryFilename, self.__getMetadataFilename())
+
+    def isValid(self, verifyHash=False, separator=None, dtypes=None):
+        """Checks whether the cache exists and was made from the current version of the csv file, read with the
+        same separator and dtypes. The hash of the csv file is only calculated if its modification time has changed,
+        or if verifyHash is true
+        Returns true if the cache can be used"""
+
+        metadata = self.__readMetadata()
+        if not metadata or metadata.get("version") != self.FORMAT_VERSION:
+            return False
+        if metadata.get("options") != self.getReadOptions(separator, dtypes):
+            return False
+
+        sourceStatus = os.stat(self.sourceFilename)
+        if sourceStatus.st_size != metadata["size"]:
+            return False
+        if sourceStatus.st_mtime_ns == metadata["mtime"] and not verifyHash:
+            return True
+
+        if self.hashFile(self.sourceFilename) != metadata["hash"]:
+            return False
+
+        # the contents are the same (e.g. the file was copied), so remember the new modification time
+        metadata["mtime"] = sourceStatus.st_mtime_ns
+        self.__writeMetadata(metadata)
+        return True
+
+    def write(self, dataframe, separator=None, dtypes=None):
+        """Writes each column of the data frame to the cache, together with the size, modification time and hash of
+        the csv file the data frame was loaded from, and the separator and dtypes it was read with
+        Returns no values"""
+
+        if not os.path.isdir(self.cacheFolder):
+            os.makedirs(self.cacheFolder)
+        if os.path.exists(self.__getMetadataFilename()):  # invalidate the old cache while the columns are replaced
+            os.remove(self.__getMetadataFilename())
+
+        sourceStatus = os.stat(self.sourceFilename)
+        sourceHash = self.hashFile(self.sourceFilename)
+
+        columns = []
+        for i, column in enumerate(dataframe.columns):
+            values = dataframe[column]
+            basename = os.path.join(self.cacheFolder, "column%d" % i)
+
+            if isinstance(values.dtype, pd.CategoricalDtype):
+                columnType = self.CATEGORY
+                codes = values.cat.codes.to_numpy()
+                categories = np.asarray(values.cat.categories)
+            elif isinstance(values.dtype, np.dtype) and values.dtype.kind in "biufmM":
+                columnType = self.NUMERIC
+            else:
+                columnType = self.TEXT
+                codes, categories = pd.factorize(values)
+                categories = np.asarray(categories)
+
+            if columnType == self.NUMERIC:
+                np.save(basename + ".npy", values.to_numpy())
+            else:
+                np.save(basename + ".codes.npy", codes)
+                np.save(basename + ".categories.npy", categories, allow_pickle=categories.dtype.kind == "O")
+
+            columns.append({"name": str(column), "type": columnType,
+                            "ordered": bool(columnType == self.CATEGORY and values.cat.ordered)})
+
+        self.__writeMetadata({"version": self.FORMAT_VERSION, "size": sourceStatus.st_size,
+                              "mtime": sourceStatus.st_mtime_ns, "hash": sourceHash,
+                              "options": self.getReadOptions(separator, dtypes), "columns": columns})
+
+    def read(self):
+        """Reads the data frame from the cache. Numeric columns are read through a memory map and copied into the
+        data frame, which holds all its columns in memory. Check first with isValid that the cache is up to date
+        Returns the data frame"""
+
+        metadata = self.__readMetadata()
+        if not metadata:
+            raise ValueError("There is no cache for %s" % self.sourceFilename)
+
+        columns = {}
+        for i, column in enumerate(metadata["columns"]):
+            basename = os.path.join(self.cacheFolder, "column%d" % i)
+
+            if column["type"] == self.NUMERIC:
+                columns[column["name"]] = np.load(basename + ".npy", mmap_mode="r")
+                continue
+
+            codes = np.load(basename + ".codes.npy")
+            categories = np.load(basename + ".categories.npy", allow_pickle=True)
+            if column["type"] == self.CATEGORY:
+                columns[column["name"]] = pd.Categorical.from_codes(codes, categories, ordered=column["ordered"])
+            else:
+                values = np.empty(len(codes), dtype=object)
+                values[codes >= 0] = categories.astype(object)[codes[codes >= 0]]
+                values[codes < 0] = np.nan
+                columns[column["name"]] = values
+
+        return pd.DataFrame(columns)
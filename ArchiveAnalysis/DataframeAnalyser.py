@@ -1,5 +1,13 @@
+import collections
 import pandas as pd
 import numpy as np
+from ArchiveAnalysis.GroupedStatistics import GroupedStatistics
+from ArchiveAnalysis.GroupedQuantiles import GroupedQuantiles
+from ArchiveAnalysis.GroupedDistinctCounts import GroupedDistinctCounts
+from ArchiveAnalysis.GroupKeyIndex import GroupKeyIndex
+from ArchiveAnalysis.ColumnarCache import ColumnarCache
+from ArchiveAnalysis.ColumnSummary import ColumnSummary
+from ArchiveAnalysis.AnalyserQuery import AnalyserQuery
 
 """This class contains functions for doing basic statistical analysis on a data frame in pandas"""
 
@@ -9,11 +17,190 @@ class DataframeAnalyser():
     PANDAS_SUM = "sum"
     PANDAS_COUNT = "count"
     PANDAS_FIRST = "first"
+    PANDAS_MIN = "min"
+    PANDAS_MAX = "max"
+    NONZERO_COUNT = GroupedStatistics.NONZERO_COUNT
+
+    CSV_SEPARATOR = ";"
+    CSV_CHUNK_SIZE = 1000000
+    CSV_DTYPES = None  # subclasses can set the types of the columns they expect
 
     def __init__(self, dataframe):
+        self._resultCache = None
         self.dataframe= dataframe
 
-        ## TODO: add initialisation from csv, dicts etc.
+        ## TODO: add initialisation from dicts etc.
+
+    @classmethod
+    def fromCsv(cls, filename, separator=CSV_SEPARATOR, dtypes=None, chunkSize=CSV_CHUNK_SIZE):
+        """Creates an analyser for the data frame in a csv file. The file is read chunkSize rows at a time, using
+        the given dtypes (by default those of the class). Columns with the type "category" are stored as codes, which
+        for repetitive text columns such as names takes a fraction of the memory. The whole data frame is kept in
+        memory, and while the chunks are combined it is briefly held twice. Only the stream classmethods (e.g.
+        streamStatisticsPerColumnValue) run in bounded memory, for files that are too large to load
+        Returns the analyser"""
+        if dtypes is None:
+            dtypes = cls.CSV_DTYPES
+
+        chunks = list(pd.read_csv(filename, sep=separator, dtype=dtypes, chunksize=chunkSize))
+        if not chunks:
+            return cls(pd.read_csv(filename, sep=separator, dtype=dtypes))
+
+        # the categories can differ per chunk, so combine them before concatenating, or pandas falls back to objects
+        columns = {}
+        for column in chunks[0].columns:
+            if isinstance(chunks[0][column].dtype, pd.CategoricalDtype):
+                columns[column] = pd.api.types.union_categoricals([chunk[column] for chunk in chunks])
+            else:
+                columns[column] = np.concatenate([chunk[column].to_numpy() for chunk in chunks])
+        del chunks
+
+        return cls(pd.DataFrame(columns))
+
+    @classmethod
+    def fromCachedCsv(cls, filename, separator=CSV_SEPARATOR, dtypes=None, chunkSize=CSV_CHUNK_SIZE, cacheFolder=None,
+                      verifyHash=False):
+        """Creates an analyser for the data frame in a csv file, like fromCsv. The first time, the parsed columns are
+        written to a columnar cache next to the csv file (or in cacheFolder). After that the data frame is loaded
+        from the cache, as long as the csv file has not changed and is read with the same separator and dtypes (by
+        default those of the class). See ColumnarCache
+        Returns the analyser"""
+        if dtypes is None:
+            dtypes = cls.CSV_DTYPES
+
+        cache = ColumnarCache(filename, cacheFolder)
+        if cache.isValid(verifyHash, separator, dtypes):
+            return cls(cache.read())
+
+        analyser = cls.fromCsv(filename, separator, dtypes, chunkSize)
+        cache.write(analyser.dataframe, separator, dtypes)
+        return analyser
+
+    @classmethod
+    def streamStatisticsPerColumnValue(cls, filename, columnName, valueColumns, statistics, excludeZeros=False,
+                                       sortColumn=None, separator=CSV_SEPARATOR, dtypes=None, chunkSize=CSV_CHUNK_SIZE,
+                                       topN=None, otherLabel=None):
+        """Calculates each of the statistics for each of the value columns, for each value in columnName, for a
+        csv file that is too large to load as a data frame. The file is read chunkSize rows at a time, and only the
+        columns that are needed are read. The results are the same as for calculateMultipleStatisticsPerColumnValue
+        sortColumn is an optional column on which the results should be sorted, using the first statistic
+        topN and otherLabel can be used to keep only the first results, see calculateMultipleStatisticsPerColumnValue
+        Returns a list of the column values, and a dictionary with a list of lists of the corresponding values for
+        each statistic"""
+        if dtypes is None:
+            dtypes = cls.CSV_DTYPES
+
+        columns = list(valueColumns)
+        if sortColumn and sortColumn not in columns:
+            columns.append(sortColumn)
+
+        groupedStatistics = GroupedStatistics.fromCsv(filename, columnName, columns, excludeZeros, statistics,
+                                                      separator, dtypes, chunkSize)
+
+        return groupedStatistics.calculateOutput(valueColumns, statistics, sortColumn, topN=topN, otherLabel=otherLabel)
+
+    @classmethod
+    def streamQuantilesPerColumnValue(cls, filename, columnName, valueColumns, quantiles, exact=False,
+                                      relativeAccuracy=GroupedQuantiles.DEFAULT_ACCURACY, excludeZeros=False,
+                                      sortColumn=None, separator=CSV_SEPARATOR, dtypes=None, chunkSize=CSV_CHUNK_SIZE):
+        """Calculates the quantiles of each of the value columns, for each value in columnName, for a csv file that
+        is too large to load as a data frame, see calculateQuantilesPerColumnValue. The file is read chunkSize rows
+        at a time, and the distributions of the chunks are merged
+        Returns a list of the column values, and a dictionary with a list of lists of the corresponding values for
+        each quantile"""
+        if dtypes is None:
+            dtypes = cls.CSV_DTYPES
+
+        columns = list(valueColumns)
+        if sortColumn and sortColumn not in columns:
+            columns.append(sortColumn)
+
+        groupedQuantiles = GroupedQuantiles.fromCsv(filename, columnName, columns, exact, relativeAccuracy,
+                                                    excludeZeros, separator, dtypes, chunkSize)
+
+        return groupedQuantiles.calculateOutput(valueColumns, quantiles, sortColumn)
+
+    @classmethod
+    def streamDistinctCountsPerColumnValue(cls, filename, columnNames, distinctColumn, approximate=False,
+                                           precision=GroupedDistinctCounts.DEFAULT_PRECISION, sort=False,
+                                           separator=CSV_SEPARATOR, dtypes=None, chunkSize=CSV_CHUNK_SIZE):
+        """Counts the distinct values of distinctColumn per group, for a csv file that is too large to load as a data
+        frame, see countDistinctValuesPerColumnValue. The file is read chunkSize rows at a time, and the counts of the
+        chunks are merged
+        Returns a list of the groups, and a list of the corresponding counts"""
+        if dtypes is None:
+            dtypes = cls.CSV_DTYPES
+
+        distinctCounts = GroupedDistinctCounts.fromCsv(filename, columnNames, distinctColumn, approximate, precision,
+                                                       separator, dtypes, chunkSize)
+
+        return distinctCounts.calculateOutput(sort)
+
+    @property
+    def dataframe(self):
+        """The data frame that is analysed. After changing it in place, call invalidateCaches, as the factorised
+        grouping columns and cached results are only renewed when the data frame is replaced"""
+        return self._dataframe
+
+    @dataframe.setter
+    def dataframe(self, dataframe):
+        """Replaces the data frame. The grouping columns of the new data frame will be factorised again when
+        they are first used"""
+        self._dataframe = dataframe
+        self.groupKeyIndex = GroupKeyIndex(dataframe)
+        self.clearResultCache()
+
+    def invalidateCaches(self):
+        """Clears the factorised grouping columns and the cached results. Needed if the data frame has been changed
+        in place, rather than replaced"""
+        self.groupKeyIndex.clear()
+        self.clearResultCache()
+
+    def enableResultCache(self, maxSize=128):
+        """Turns on caching of the results of the per-column-value calculations, so repeating the same calculation
+        only costs a lookup. At most maxSize results are kept, when there are more the least recently used is
+        removed. The cache is emptied whenever the data frame is replaced, but changes made to the data frame in
+        place (e.g. analyser.dataframe.loc[0, column] = value) are not detected, and the cached results from before
+        the change would be returned. Call invalidateCaches (or clearResultCache) after changing it in place"""
+        if maxSize < 1:
+            raise ValueError("The result cache must be able to hold at least one result")
+        self._resultCache = collections.OrderedDict()
+        self._resultCacheSize = maxSize
+
+    def disableResultCache(self):
+        """Turns off caching of results, and removes the cached results"""
+        self._resultCache = None
+
+    def clearResultCache(self):
+        """Removes the cached results, if caching is turned on"""
+        if getattr(self, "_resultCache", None) is not None:
+            self._resultCache.clear()
+
+    def _getCachedResult(self, key, calculateResult):
+        """Gets the result for the key from the result cache, or calculates it with calculateResult if it is not
+        there (or caching is turned off). The key should contain the method name and all its arguments
+        Returns a copy of the result, so callers can't change the cached result"""
+        resultCache = getattr(self, "_resultCache", None)
+        if resultCache is None:
+            return calculateResult()
+
+        if key in resultCache:
+            resultCache.move_to_end(key)
+        else:
+            resultCache[key] = calculateResult()
+            if len(resultCache) > self._resultCacheSize:
+                resultCache.popitem(last=False)
+
+        return self.__copyResult(resultCache[key])
+
+    def __copyResult(self, result):
+        if isinstance(result, list):
+            return [self.__copyResult(value) for value in result]
+        if isinstance(result, tuple):
+            return tuple(self.__copyResult(value) for value in result)
+        if isinstance(result, dict):
+            return {key: self.__copyResult(value) for key, value in result.items()}
+        return result
 
     def countRowsInDataframe(self):
         """Counts how many rows there are in the data frame"""
@@ -21,13 +208,26 @@ class DataframeAnalyser():
 
     def getColumnTotal(self, columnName):
         """Adds up the values in a column"""
-        return sum(self.dataframe[columnName])
+        return self.summarizeColumns([columnName]).getTotal(columnName)
 
     def getColumnCount(self, columnName, columnValue=None):
         """Counts values in a column, optionally only those equal to a certain value"""
         if columnValue:
-            return len(self.dataframe[self.dataframe[columnName] == columnValue].index)
-        return len(list(self.dataframe[columnName]))
+            return self.summarizeColumns([columnName], {columnName: columnValue}).getValueCount(columnName)
+        return len(self.dataframe.index)
+
+    def summarizeColumns(self, columnNames, columnValues=None):
+        """Summarises several columns at once: the number of rows, and for each column the total, the number of
+        values that are not missing, and the minimum and maximum. columnValues is an optional dictionary with, for
+        some of the columns, a value to count the occurrences of
+        Returns a ColumnSummary"""
+        return ColumnSummary.fromDataframe(self.dataframe, columnNames, columnValues)
+
+    def query(self):
+        """Starts a lazy query on the data frame, which can be filtered, grouped, aggregated, sorted and limited
+        without copying the data frame. See AnalyserQuery
+        Returns the AnalyserQuery"""
+        return AnalyserQuery(self)
 
     def pivotDataFrame(self, indexColumns, valueColumns, aggregationFunction):
         """Pivots the data frame using the indexcolumn or columns as identifiers. Value columns are aggregated using the
@@ -45,15 +245,74 @@ class DataframeAnalyser():
         pivoted_frame = pivoted_frame.reset_index()
         return pivoted_frame
 
-    def calculateStatisticsPerColumnValue(self, columnName, valueColumns, statistic, excludeZeros=False, sortColumn=None):
+    def calculateMultipleStatisticsPerColumnValue(self, columnName, valueColumns, statistics, excludeZeros=False,
+                                                  sortColumn=None, topN=None, otherLabel=None):
+        """Calculates each of the statistics for each of the value columns, for each value in columnName, in one pass
+        over the data frame. The statistics can be any of sum, count, mean, min, max and nonzero_count (the number
+        of values that are not zero). E.g. if columnName is the name of a person, and valueColumns of the
+        times that person appeared onscreen or spoke, then for each person the total and average onscreen time and
+        speaking time can be calculated together
+        if excludeZeros is true, then zero values in the value columns will be excluded from the calculation
+        sortColumn is an optional column on which the results should be sorted, using the first statistic
+        topN optionally keeps only the first topN values after sorting (this needs a sortColumn). The top values are
+        selected without sorting all the others. If otherLabel is given, then the remaining values are combined into
+        one extra value with that label, e.g. "other"
+        Returns a list of the column values, and a dictionary with a list of lists of the corresponding values for
+        each statistic
+        """
+        def calculateResult():
+            columns = list(valueColumns)
+            if sortColumn and sortColumn not in columns:
+                columns.append(sortColumn)
+
+            groupedStatistics = self.calculateGroupedStatistics(columnName, columns, excludeZeros, statistics)
+
+            return groupedStatistics.calculateOutput(valueColumns, statistics, sortColumn, topN=topN,
+                                                     otherLabel=otherLabel)
+
+        key = ("calculateMultipleStatisticsPerColumnValue", columnName, tuple(valueColumns), tuple(statistics),
+               excludeZeros, sortColumn, topN, otherLabel)
+        return self._getCachedResult(key, calculateResult)
+
+    def calculateGroupedStatistics(self, columnName, valueColumns, excludeZeros=False, statistics=None):
+        """Calculates the statistics of the value columns for each value in columnName. The grouping column is
+        only factorised the first time it is used, after that its codes are reused from the group key index
+        statistics optionally restricts which statistics are calculated, by default all are
+        Returns the GroupedStatistics"""
+        codes, groupValues = self.groupKeyIndex.getCodes(columnName)
+        groupOrder = None
+        if statistics is None or self.PANDAS_MIN in statistics or self.PANDAS_MAX in statistics:
+            groupOrder = self.groupKeyIndex.getGroupOrder(columnName)
+        valueArrays = [self.dataframe[column].to_numpy() for column in valueColumns]
+
+        return GroupedStatistics.fromArrays(codes, groupValues, valueColumns, valueArrays, excludeZeros, statistics,
+                                            groupOrder)
+
+    def calculateStatisticsPerColumnValue(self, columnName, valueColumns, statistic, excludeZeros=False, sortColumn=None,
+                                          topN=None, otherLabel=None):
         """Calculates the specified statistic for each of the value columns, for each
         value in columnName. E.g. if columnName is the name of a person, and valueColumns of the
         times that person appeared onscreen or spoke, then for each person the statistic
         will be calculated for onscreen time and speaking time
         if excludeZeros is true, then zero values in the value columns will be excluded from the calculation
         sortColumn is an optional column on which the results should be sorted
+        topN optionally keeps only the first topN values after sorting, and if otherLabel is given the remaining
+        values are combined into one extra value with that label
         Returns a list of the column values, and a list of lists of the corresponding statistics
         """
+        if statistic in GroupedStatistics.STATISTICS:
+            columnValues, output_statistics = self.calculateMultipleStatisticsPerColumnValue(
+                columnName, valueColumns, [statistic], excludeZeros, sortColumn, topN, otherLabel)
+            return columnValues, output_statistics[statistic]
+
+        if otherLabel is not None:
+            raise ValueError("Can't combine the remaining values for statistic %s" % statistic)
+        if topN is not None and not sortColumn:
+            raise ValueError("A sort column is needed to select the top %d values" % topN)
+        if topN is not None and topN < 1:
+            raise ValueError("topN must be at least 1, not %d" % topN)
+
+        # other statistics, e.g. first, are left to pandas
         values = []
         values.extend(valueColumns)
         values.append(columnName)
@@ -71,6 +330,8 @@ class DataframeAnalyser():
 
         if sortColumn:
             statistics = statistics.reindex(statistics[sortColumn].sort_values(ascending=False).index)
+            if topN is not None:
+                statistics = statistics.iloc[:topN]
 
         output_statistics = []
         for column in valueColumns:
@@ -78,27 +339,98 @@ class DataframeAnalyser():
 
         return list(statistics.index.values), output_statistics
 
-
-    def calculateTotalsPerColumnValue(self, columnName, valueColumns, excludeZeros=False, sortColumn=None):
+    def calculateTotalsPerColumnValue(self, columnName, valueColumns, excludeZeros=False, sortColumn=None, topN=None,
+                                      otherLabel=None):
         """Calculates the total for each of the value columns, for each
         value in columnName. E.g. if columnName is the name of a person, and valueColumns of the
         times that person appeared onscreen or spoke, then for each person the total onscreen time and
         total speaking time will be calculated
         if excludeZeros is true, then zero values in the value columns will be excluded from the calculation
         sortColumn is an optional column on which the results should be sorted
+        topN optionally keeps only the first topN values after sorting, and if otherLabel is given the remaining
+        values are combined into one extra value with that label
         Returns a list of the column values, and a list of lists of the corresponding totals
         """
-        return self.calculateStatisticsPerColumnValue(columnName, valueColumns, self.PANDAS_SUM, excludeZeros, sortColumn)
+        return self.calculateStatisticsPerColumnValue(columnName, valueColumns, self.PANDAS_SUM, excludeZeros, sortColumn,
+                                                      topN, otherLabel)
 
-    def calculateAveragesPerColumnValue(self, columnName, valueColumns, excludeZeros=False, sortColumn=None):
+    def calculateAveragesPerColumnValue(self, columnName, valueColumns, excludeZeros=False, sortColumn=None, topN=None,
+                                        otherLabel=None):
         """Calculates the average for each of the value columns, for each
         value in columnName. E.g. if columnName is the name of a person, and valueColumns of the
         times that person appeared onscreen or spoke, then for each person the total onscreen time and
         total speaking time will be calculated
         if excludeZeros is true, then zero values in the value columns will be excluded from the calculation
         sortColumn is an optional column on which the results should be sorted
+        topN optionally keeps only the first topN values after sorting, and if otherLabel is given the remaining
+        values are combined into one extra value with that label
         Returns a list of the column values, and a list of lists of the corresponding totals
         """
 
-        return self.calculateStatisticsPerColumnValue(columnName, valueColumns, self.PANDAS_AVERAGE, excludeZeros, sortColumn)
+        return self.calculateStatisticsPerColumnValue(columnName, valueColumns, self.PANDAS_AVERAGE, excludeZeros, sortColumn,
+                                                      topN, otherLabel)
+
+    def calculateQuantilesPerColumnValue(self, columnName, valueColumns, quantiles, exact=False,
+                                         relativeAccuracy=GroupedQuantiles.DEFAULT_ACCURACY, excludeZeros=False,
+                                         sortColumn=None):
+        """Calculates the quantiles (between 0 and 1, e.g. 0.5 for the median and 0.9 for the 90th percentile) of
+        each of the value columns, for each value in columnName. By default the quantiles are estimated from a
+        sketch of each distribution, interpolated between ranks like pandas, and are within relativeAccuracy (e.g. 1%)
+        of the pandas quantiles. If exact is true, the exact quantiles are calculated, as pandas does. See
+        GroupedQuantiles
+        if excludeZeros is true, then zero values in the value columns will be excluded from the calculation
+        sortColumn is an optional column on which the results should be sorted, using the first quantile
+        Returns a list of the column values, and a dictionary with a list of lists of the corresponding values for
+        each quantile"""
+        def calculateResult():
+            columns = list(valueColumns)
+            if sortColumn and sortColumn not in columns:
+                columns.append(sortColumn)
+
+            groupedQuantiles = self.calculateGroupedQuantiles(columnName, columns, exact, relativeAccuracy,
+                                                              excludeZeros)
+            return groupedQuantiles.calculateOutput(valueColumns, quantiles, sortColumn)
+
+        key = ("calculateQuantilesPerColumnValue", columnName, tuple(valueColumns), tuple(quantiles), exact,
+               relativeAccuracy, excludeZeros, sortColumn)
+        return self._getCachedResult(key, calculateResult)
+
+    def calculateGroupedQuantiles(self, columnName, valueColumns, exact=False,
+                                  relativeAccuracy=GroupedQuantiles.DEFAULT_ACCURACY, excludeZeros=False):
+        """Calculates the distribution of the value columns for each value in columnName, from which quantiles can
+        be calculated. The distributions can be merged with those of other data, and saved
+        Returns the GroupedQuantiles"""
+        codes, groupValues = self.groupKeyIndex.getCodes(columnName)
+        valueArrays = [self.dataframe[column].to_numpy() for column in valueColumns]
+
+        return GroupedQuantiles.fromArrays(codes, groupValues, valueColumns, valueArrays, exact, relativeAccuracy,
+                                           excludeZeros)
+
+    def countDistinctValuesPerColumnValue(self, columnNames, distinctColumn, approximate=False,
+                                          precision=GroupedDistinctCounts.DEFAULT_PRECISION, sort=False):
+        """Counts the distinct values of distinctColumn for each value in a column, or for each combination of
+        values if a list of columns is given (e.g. the number of different persons per programme per week). By
+        default the counts are exact. If approximate is true, they are estimated with a HyperLogLog sketch of
+        2^precision bytes per group, see GroupedDistinctCounts
+        if sort is true, the groups are sorted by their count, in descending order
+        Returns a list of the groups (tuples of values for several columns), and a list of the corresponding counts"""
+        columnNames = [columnNames] if isinstance(columnNames, str) else list(columnNames)
+
+        def calculateResult():
+            distinctCounts = self.calculateGroupedDistinctCounts(columnNames, distinctColumn, approximate, precision)
+            return distinctCounts.calculateOutput(sort)
+
+        key = ("countDistinctValuesPerColumnValue", tuple(columnNames), distinctColumn, approximate, precision, sort)
+        return self._getCachedResult(key, calculateResult)
+
+    def calculateGroupedDistinctCounts(self, columnNames, distinctColumn, approximate=False,
+                                       precision=GroupedDistinctCounts.DEFAULT_PRECISION):
+        """Calculates the distinct values of distinctColumn for each group of the columns, which can be merged with
+        those of other data, and saved
+        Returns the GroupedDistinctCounts"""
+        columnNames = [columnNames] if isinstance(columnNames, str) else columnNames
+        factorisedColumns = [self.groupKeyIndex.getCodes(column) for column in columnNames]
+        factorisedDistinctColumn = self.groupKeyIndex.getCodes(distinctColumn)
 
+        return GroupedDistinctCounts.fromFactorizedColumns(factorisedColumns, factorisedDistinctColumn, approximate,
+                                                           precision)
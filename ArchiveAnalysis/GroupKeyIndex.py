@@ -0,0 +1,41 @@
+from ArchiveAnalysis.GroupedStatistics import GroupedStatistics
+
+"""This class keeps the factorised form of the grouping columns of a data frame: for each column, an integer code per
+row and an array of the unique values. Converting a column of strings such as names or parties into codes means
+hashing every value, so each column is only factorised the first time it is used to group by, and then reused.
+
+The index belongs to one data frame. When the data frame is replaced a new index should be made, and if the data
+frame is changed in place, the index should be cleared.
+"""
+
+class GroupKeyIndex():
+
+    def __init__(self, dataframe):
+        self.dataframe = dataframe
+        self.__codes = {}
+        self.__groupOrders = {}
+
+    def getCodes(self, columnName):
+        """Gets the integer code of each row for the column, factorising it if this hasn't been done yet.
+        Missing values get the code -1
+        Returns the codes and an array of the unique values in sorted order"""
+        if columnName not in self.__codes:
+            self.__codes[columnName] = GroupedStatistics.factorizeValues(self.dataframe[columnName])
+        return self.__codes[columnName]
+
+    def getGroupOrder(self, columnName):
+        """Gets the order of the rows that puts the rows with the same value in the column next to each other
+        Returns the row order, and the position in that order where each value starts"""
+        if columnName not in self.__groupOrders:
+            codes, uniques = self.getCodes(columnName)
+            self.__groupOrders[columnName] = GroupedStatistics.getGroupOrder(codes)
+        return self.__groupOrders[columnName]
+
+    def isIndexed(self, columnName):
+        """Checks whether the column has already been factorised"""
+        return columnName in self.__codes
+
+    def clear(self):
+        """Removes all factorised columns, e.g. after the data frame has been changed in place"""
+        self.__codes = {}
+        self.__groupOrders = {}
@@ -0,0 +1,331 @@
+import json
+import numpy as np
+import pandas as pd
+from ArchiveAnalysis.GroupedStatistics import GroupedStatistics
+
+"""This class counts the number of distinct values of a column (e.g. the number of different persons) for each group,
+where a group is a value of one grouping column or a combination of values of several (e.g. programme and week).
+
+Values are hashed to 64 bits, so the counts of different parts of the data can be merged without keeping the values
+themselves. In exact mode the distinct hashes of each group are kept. In approximate mode each group has a
+HyperLogLog sketch of 2^precision registers, which estimates the count with a standard error of about
+1.04 / sqrt(2^precision), e.g. 1.6% for the default precision of 12.
+
+Most groups are small (e.g. a person who appeared once), so the registers are kept sparse: only the registers that are
+set, as sorted (group, register) keys with their ranks, 9 bytes each. A group is only given a dense row of
+2^precision bytes once it has more set registers than fit in that many bytes. A sketch therefore never takes more
+memory than the exact hashes of its group (16 bytes per value), nor more than 2^precision bytes per group.
+
+Both forms can be merged, and saved to and loaded from JSON files, e.g. one per week or per partition.
+"""
+
+class GroupedDistinctCounts():
+
+    DEFAULT_PRECISION = 12
+    HASH_BITS = 64
+    SPARSE_ENTRY_BYTES = 9  # an int64 key and a uint8 rank
+
+    def __init__(self, groupValues, hashes=None, sparseRegisters=None, denseRegisters=None, precision=None):
+        """Initialises the counts. In exact mode, hashes is a tuple of two arrays: the group code and the hash of each
+        distinct value per group, ordered by group and hash. In approximate mode (when a precision is given),
+        sparseRegisters is a tuple of two arrays: the key (group code * 2^precision + register) and the rank of each
+        set register of the sparse groups, ordered by key. denseRegisters is a tuple of the ordered codes of the
+        dense groups, and an array with a row of registers for each of them. Usually you will want to use
+        fromArrays or fromDataframe instead"""
+        self.groupValues = np.asarray(groupValues)
+        self.hashes = hashes
+        self.precision = precision
+        if precision is not None:
+            numberOfRegisters = 1 << precision
+            self.sparseRegisters = sparseRegisters if sparseRegisters is not None else \
+                (np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.uint8))
+            self.denseRegisters = denseRegisters if denseRegisters is not None else \
+                (np.zeros(0, dtype=np.intp), np.zeros((0, numberOfRegisters), dtype=np.uint8))
+        else:
+            self.sparseRegisters = self.denseRegisters = None
+
+    @property
+    def isExact(self):
+        return self.precision is None
+
+    def getMemoryUsage(self):
+        """Gets the number of bytes taken by the hashes or registers, not counting the group values
+        Returns the number of bytes"""
+        arrays = self.hashes if self.isExact else self.sparseRegisters + self.denseRegisters
+        return sum(array.nbytes for array in arrays)
+
+    @staticmethod
+    def hashValues(codes, uniques):
+        """Hashes factorised values to unsigned 64 bit integers, so that only the unique values are hashed
+        Returns an array with a hash per value, and whether the value is missing"""
+        uniqueHashes = pd.util.hash_array(np.asarray(uniques, dtype=object))
+        return uniqueHashes[np.maximum(codes, 0)] if len(uniques) else np.zeros(len(codes), np.uint64), codes < 0
+
+    @staticmethod
+    def combineGroupCodes(codesList, valuesList):
+        """Combines the codes of several grouping columns into one code per combination of values that occurs.
+        Rows with a missing value in any of the columns get the code -1
+        Returns the combined codes, and an array with a tuple of values per combination"""
+        isComplete = np.ones(len(codesList[0]), dtype=bool)
+        for codes in codesList:
+            isComplete &= codes >= 0
+        completeCodes = [np.asarray(codes)[isComplete] for codes in codesList]
+        sizes = [len(values) for values in valuesList]
+
+        if np.prod([float(size) for size in sizes]) < 2 ** 62:
+            combined = np.zeros(np.count_nonzero(isComplete), dtype=np.int64)
+            for codes, size in zip(completeCodes, sizes):
+                combined = combined * size + codes
+            uniqueCombined, inverse = np.unique(combined, return_inverse=True)
+            combinationCodes = np.zeros((len(uniqueCombined), len(codesList)), dtype=np.intp)
+            for i in range(len(codesList) - 1, -1, -1):
+                combinationCodes[:, i] = uniqueCombined % sizes[i]
+                uniqueCombined = uniqueCombined // sizes[i]
+        else:  # too many combinations for one integer code
+            combinationCodes, inverse = np.unique(np.stack(completeCodes, axis=1), axis=0, return_inverse=True)
+
+        groupValues = np.empty(len(combinationCodes), dtype=object)
+        groupValues[:] = list(zip(*[np.asarray(values)[combinationCodes[:, i]]
+                                    for i, values in enumerate(valuesList)]))
+
+        codes = np.full(len(isComplete), -1, dtype=np.intp)
+        codes[isComplete] = inverse.reshape(-1)
+        return codes, groupValues
+
+    @classmethod
+    def fromArrays(cls, codes, groupValues, hashes, approximate=False, precision=DEFAULT_PRECISION):
+        """Counts the distinct hashes for each group. codes gives the position of each row's group in groupValues
+        (-1 for rows that should be left out)
+        Returns the grouped distinct counts"""
+
+        keep = np.asarray(codes) >= 0
+        codes = np.asarray(codes)[keep].astype(np.intp)
+        hashes = np.asarray(hashes, dtype=np.uint64)[keep]
+
+        if not approximate:
+            return cls(groupValues, cls.__uniquePairs(codes, hashes))
+
+        if not 4 <= precision <= 18:
+            raise ValueError("The precision must be between 4 and 18")
+        numberOfRegisters = 1 << precision
+        remainingBits = cls.HASH_BITS - precision
+
+        # the first bits choose the register, the position of the first 1 in the other bits is the rank
+        registerIndex = (hashes >> np.uint64(remainingBits)).astype(np.int64)
+        remainder = hashes & np.uint64((1 << remainingBits) - 1)
+        ranks = (remainingBits - cls.getBitLengths(remainder) + 1).astype(np.uint8)
+
+        return cls.__fromRegisterEntries(groupValues, codes.astype(np.int64) * numberOfRegisters + registerIndex,
+                                         ranks, precision)
+
+    @classmethod
+    def __fromRegisterEntries(cls, groupValues, keys, ranks, precision):
+        """Keeps the highest rank per register key, and gives the groups with many set registers a dense row
+        Returns the grouped distinct counts"""
+        numberOfRegisters = 1 << precision
+
+        # the highest rank per register, from the ranks sorted by key (much faster than np.maximum.at)
+        order = np.argsort(keys)
+        keys, ranks = keys[order], ranks[order]
+        if len(keys):
+            starts = np.flatnonzero(np.concatenate(([True], keys[1:] != keys[:-1])))
+            keys, ranks = keys[starts], np.maximum.reduceat(ranks, starts)
+
+        groupCodes = keys // numberOfRegisters
+        isDenseGroup = np.bincount(groupCodes, minlength=len(groupValues)) > \
+            numberOfRegisters // cls.SPARSE_ENTRY_BYTES
+        denseGroups = np.flatnonzero(isDenseGroup)
+        isDenseEntry = isDenseGroup[groupCodes]
+        denseRegisters = np.zeros((len(denseGroups), numberOfRegisters), dtype=np.uint8)
+        denseRows = np.searchsorted(denseGroups, groupCodes[isDenseEntry])
+        denseRegisters[denseRows, keys[isDenseEntry] % numberOfRegisters] = ranks[isDenseEntry]
+
+        return cls(groupValues, sparseRegisters=(keys[~isDenseEntry], ranks[~isDenseEntry]),
+                   denseRegisters=(denseGroups, denseRegisters), precision=precision)
+
+    def __getRegisterEntries(self):
+        """Gets the set registers of all groups, sparse and dense, as keys and ranks (not in order)
+        Returns the keys and the ranks"""
+        numberOfRegisters = 1 << self.precision
+        denseGroups, denseRegisters = self.denseRegisters
+        rows, registers = np.nonzero(denseRegisters)
+        denseKeys = denseGroups[rows].astype(np.int64) * numberOfRegisters + registers
+        return np.concatenate((self.sparseRegisters[0], denseKeys)), \
+            np.concatenate((self.sparseRegisters[1], denseRegisters[rows, registers]))
+
+    @classmethod
+    def fromDataframe(cls, dataframe, groupColumns, distinctColumn, approximate=False, precision=DEFAULT_PRECISION):
+        """Counts the distinct values of distinctColumn for each value of the grouping column, or each combination
+        of values if a list of grouping columns is given
+        Returns the grouped distinct counts"""
+        groupColumns = [groupColumns] if isinstance(groupColumns, str) else groupColumns
+        factorisedColumns = [GroupedStatistics.factorizeValues(dataframe[column]) for column in groupColumns]
+        factorisedDistinctColumn = GroupedStatistics.factorizeValues(dataframe[distinctColumn])
+        return cls.fromFactorizedColumns(factorisedColumns, factorisedDistinctColumn, approximate, precision)
+
+    @classmethod
+    def fromFactorizedColumns(cls, factorisedColumns, factorisedDistinctColumn, approximate=False,
+                              precision=DEFAULT_PRECISION):
+        """Counts the distinct values for each group, from the (codes, unique values) pairs of the grouping columns
+        and of the column whose values are counted. With one grouping column the groups are its values, with
+        several they are tuples of values
+        Returns the grouped distinct counts"""
+        if len(factorisedColumns) == 1:
+            codes, groupValues = factorisedColumns[0]
+        else:
+            codes, groupValues = cls.combineGroupCodes([codes for codes, values in factorisedColumns],
+                                                       [values for codes, values in factorisedColumns])
+        hashes, isMissing = cls.hashValues(*factorisedDistinctColumn)
+        return cls.fromArrays(np.where(isMissing, -1, codes), groupValues, hashes, approximate, precision)
+
+    @classmethod
+    def fromCsv(cls, filename, groupColumns, distinctColumn, approximate=False, precision=DEFAULT_PRECISION,
+                separator=";", dtypes=None, chunkSize=1000000):
+        """Counts the distinct values for each group of a csv file, reading only the columns that are needed,
+        chunkSize rows at a time, and merging the counts of the chunks
+        Returns the grouped distinct counts"""
+        groupColumns = [groupColumns] if isinstance(groupColumns, str) else list(groupColumns)
+        columns = groupColumns + [distinctColumn] if distinctColumn not in groupColumns else groupColumns
+        if dtypes:
+            dtypes = {column: dtype for column, dtype in dtypes.items() if column in columns}
+
+        distinctCounts = None
+        for chunk in pd.read_csv(filename, sep=separator, usecols=columns, dtype=dtypes, chunksize=chunkSize):
+            chunkCounts = cls.fromDataframe(chunk, groupColumns, distinctColumn, approximate, precision)
+            distinctCounts = chunkCounts if distinctCounts is None else distinctCounts.merge(chunkCounts)
+
+        if distinctCounts is None:  # file without rows
+            distinctCounts = cls.fromArrays(np.zeros(0, dtype=np.intp), np.zeros(0, dtype=object),
+                                            np.zeros(0, dtype=np.uint64), approximate, precision)
+        return distinctCounts
+
+    @staticmethod
+    def getBitLengths(values):
+        """Gets the number of bits needed for each unsigned 64 bit integer, without converting to floats (which
+        would round large values)
+        Returns an array of bit lengths"""
+        values = np.asarray(values, dtype=np.uint64).copy()
+        lengths = np.zeros(len(values), dtype=np.int64)
+        for shift in (32, 16, 8, 4, 2, 1):
+            isLonger = values >= np.uint64(1 << shift)
+            lengths += shift * isLonger
+            values = np.where(isLonger, values >> np.uint64(shift), values)
+        return lengths + (values > 0)
+
+    @staticmethod
+    def __uniquePairs(codes, hashes):
+        order = np.lexsort((hashes, codes))
+        codes, hashes = codes[order], hashes[order]
+        if len(order) == 0:
+            return codes, hashes
+        isFirst = np.concatenate(([True], (codes[1:] != codes[:-1]) | (hashes[1:] != hashes[:-1])))
+        return codes[isFirst], hashes[isFirst]
+
+    def merge(self, other):
+        """Combines these counts with the counts of another part of the data. Both must be exact, or approximate
+        with the same precision
+        Returns the combined counts"""
+
+        if self.isExact != other.isExact or self.precision != other.precision:
+            raise ValueError("Can't merge exact and approximate counts, or counts with a different precision")
+
+        groupValues = pd.Index(self.groupValues, tupleize_cols=False).append(
+            pd.Index(other.groupValues, tupleize_cols=False)).unique()
+        try:
+            groupValues = groupValues.sort_values()
+        except TypeError:
+            pass
+        selfPositions = np.asarray(groupValues.get_indexer(self.groupValues), dtype=np.intp)
+        otherPositions = np.asarray(groupValues.get_indexer(other.groupValues), dtype=np.intp)
+        groupValues = np.asarray(groupValues)
+
+        if self.isExact:
+            (selfCodes, selfHashes), (otherCodes, otherHashes) = self.hashes, other.hashes
+            return GroupedDistinctCounts(groupValues, self.__uniquePairs(
+                np.concatenate((selfPositions[selfCodes], otherPositions[otherCodes])),
+                np.concatenate((selfHashes, otherHashes))))
+
+        numberOfRegisters = 1 << self.precision
+        (selfKeys, selfRanks), (otherKeys, otherRanks) = self.__getRegisterEntries(), other.__getRegisterEntries()
+        keys = np.concatenate((selfPositions[selfKeys // numberOfRegisters] * numberOfRegisters
+                               + selfKeys % numberOfRegisters,
+                               otherPositions[otherKeys // numberOfRegisters] * numberOfRegisters
+                               + otherKeys % numberOfRegisters))
+        return self.__fromRegisterEntries(groupValues, keys.astype(np.int64), np.concatenate((selfRanks, otherRanks)),
+                                          self.precision)
+
+    def getCounts(self):
+        """Gets the (estimated) number of distinct values of each group
+        Returns an array with a count per group"""
+
+        if self.isExact:
+            return np.bincount(self.hashes[0], minlength=len(self.groupValues)).astype(np.int64)
+
+        # registers that are not set have rank 0, and add 2^0 = 1 each to the harmonic sum
+        numberOfRegisters = 1 << self.precision
+        keys, ranks = self.__getRegisterEntries()
+        groupCodes = keys // numberOfRegisters
+        emptyRegisters = numberOfRegisters - np.bincount(groupCodes, minlength=len(self.groupValues))
+        harmonicSums = np.bincount(groupCodes, weights=np.power(2.0, -ranks.astype(np.float64)),
+                                   minlength=len(self.groupValues)) + emptyRegisters
+        alpha = 0.7213 / (1 + 1.079 / numberOfRegisters)
+        estimates = alpha * numberOfRegisters ** 2 / harmonicSums
+
+        # small counts are estimated better from the number of empty registers
+        useLinearCounting = (estimates <= 2.5 * numberOfRegisters) & (emptyRegisters > 0)
+        with np.errstate(divide="ignore"):
+            linearCounts = numberOfRegisters * np.log(numberOfRegisters / np.maximum(emptyRegisters, 1))
+        estimates = np.where(useLinearCounting, linearCounts, estimates)
+        return np.rint(estimates).astype(np.int64)
+
+    def calculateOutput(self, sort=False):
+        """Gets the distinct counts of the groups that have any values
+        if sort is true, the groups are sorted by their count, in descending order
+        Returns a list of the group values, and a list of the corresponding counts"""
+        counts = self.getCounts()
+        positions = np.flatnonzero(counts > 0)
+        if sort:
+            positions = positions[np.argsort(-counts[positions], kind="stable")]
+        return list(self.groupValues[positions]), counts[positions].tolist()
+
+    def toDict(self):
+        """Converts the counts into a dictionary of lists, which can be written as JSON. Tuples of group values
+        become lists
+        Returns the dictionary"""
+        dictionary = {"groupValues": [list(value) if isinstance(value, tuple) else value
+                                      for value in self.groupValues.tolist()],
+                      "precision": self.precision}
+        if self.isExact:
+            dictionary["codes"] = self.hashes[0].tolist()
+            dictionary["hashes"] = [str(value) for value in self.hashes[1].tolist()]  # JSON can't hold 64 bits
+        else:
+            keys, ranks = self.__getRegisterEntries()
+            dictionary["registerKeys"] = keys.tolist()
+            dictionary["registerRanks"] = ranks.tolist()
+        return dictionary
+
+    @classmethod
+    def fromDict(cls, dictionary):
+        """Converts a dictionary made by toDict back into counts
+        Returns the grouped distinct counts"""
+        groupValues = np.empty(len(dictionary["groupValues"]), dtype=object)
+        groupValues[:] = [tuple(value) if isinstance(value, list) else value for value in dictionary["groupValues"]]
+        if dictionary["precision"] is None:
+            return cls(groupValues, (np.asarray(dictionary["codes"], dtype=np.intp),
+                                     np.asarray([int(value) for value in dictionary["hashes"]], dtype=np.uint64)))
+        return cls.__fromRegisterEntries(groupValues, np.asarray(dictionary["registerKeys"], dtype=np.int64),
+                                         np.asarray(dictionary["registerRanks"], dtype=np.uint8),
+                                         dictionary["precision"])
+
+    def save(self, filename):
+        """Writes the counts to a JSON file
+        Returns no values"""
+        with open(filename, "w") as file:
+            json.dump(self.toDict(), file)
+
+    @classmethod
+    def load(cls, filename):
+        """Reads counts written by save
+        Returns the grouped distinct counts"""
+        with open(filename) as file:
+            return cls.fromDict(json.load(file))
@@ -0,0 +1,253 @@
+import json
+import numpy as np
+import pandas as pd
+from ArchiveAnalysis.GroupedStatistics import GroupedStatistics
+
+"""This class holds the distribution of one or more value columns for each value of a grouping column, from which
+quantiles such as the median or the 90th percentile can be calculated per group.
+
+By default each distribution is kept as a sketch: the values are counted in buckets whose width grows with the value
+(as in DDSketch), so every value is known within the relative accuracy (e.g. 1%), while a group needs at most a few
+hundred buckets however many values it has. Quantiles between two values are interpolated with the same rank rule as
+pandas in both modes, so e.g. the median of a group with two values is close to their average, not the lower value. In exact mode the distinct values themselves are
+counted instead, which gives the same quantiles as pandas, but needs memory for every distinct value.
+
+Both forms can be merged (the counts of the same bucket or value are added up), so the distributions of chunks of a
+csv file or of partitions can be combined, and they can be saved to and loaded from JSON files, e.g. one per week.
+"""
+
+class GroupedQuantiles():
+
+    DEFAULT_ACCURACY = 0.01
+    MINIMUM_INDEXABLE = 1e-9  # smaller absolute values are counted as zero
+    KEY_OFFSET = 2 ** 30  # keeps the bucket keys of positive values positive, and of negative values negative
+
+    def __init__(self, groupValues, valueColumns, entries, relativeAccuracy=DEFAULT_ACCURACY, excludeZeros=False):
+        """Initialises the distributions. entries has, for each value column, a tuple of three arrays: the group
+        code, the bucket key (or value in exact mode) and the count of each bucket, ordered by group and bucket.
+        relativeAccuracy is None in exact mode. Usually you will want to use fromArrays or fromDataframe instead"""
+        self.groupValues = np.asarray(groupValues)
+        self.valueColumns = list(valueColumns)
+        self.entries = entries
+        self.relativeAccuracy = relativeAccuracy
+        self.excludeZeros = excludeZeros
+
+    @property
+    def isExact(self):
+        return self.relativeAccuracy is None
+
+    @classmethod
+    def fromArrays(cls, codes, groupValues, valueColumns, valueArrays, exact=False,
+                   relativeAccuracy=DEFAULT_ACCURACY, excludeZeros=False):
+        """Calculates the distribution of each of the value arrays, for each group. codes gives the position of
+        each row's group in groupValues (-1 for rows without a group). Missing values are left out, as are zeros if
+        excludeZeros is true
+        Returns the grouped quantiles"""
+
+        if exact:
+            relativeAccuracy = None
+        elif not 0 < relativeAccuracy < 1:
+            raise ValueError("The relative accuracy must be between 0 and 1")
+
+        codes = np.asarray(codes)
+        entries = []
+        for values in valueArrays:
+            values = np.asarray(values, dtype=np.float64)
+            keep = (codes >= 0) & ~np.isnan(values)
+            if excludeZeros:
+                keep &= values != 0
+            points = values[keep] if exact else cls.__toBucketKeys(values[keep], relativeAccuracy)
+            entries.append(cls.__aggregate(codes[keep], points, np.ones(len(points), dtype=np.int64)))
+
+        return cls(groupValues, valueColumns, entries, relativeAccuracy, excludeZeros)
+
+    @classmethod
+    def fromDataframe(cls, dataframe, columnName, valueColumns, exact=False, relativeAccuracy=DEFAULT_ACCURACY,
+                      excludeZeros=False):
+        """Calculates the distribution of the value columns for each value in columnName of the data frame
+        Returns the grouped quantiles"""
+        codes, groupValues = GroupedStatistics.factorizeValues(dataframe[columnName])
+        valueArrays = [dataframe[column].to_numpy() for column in valueColumns]
+        return cls.fromArrays(codes, groupValues, valueColumns, valueArrays, exact, relativeAccuracy, excludeZeros)
+
+    @classmethod
+    def fromCsv(cls, filename, columnName, valueColumns, exact=False, relativeAccuracy=DEFAULT_ACCURACY,
+                excludeZeros=False, separator=";", dtypes=None, chunkSize=1000000):
+        """Calculates the distribution of the value columns for each value in columnName of a csv file, reading only
+        those columns, chunkSize rows at a time, and merging the distributions of the chunks
+        Returns the grouped quantiles"""
+
+        columns = [columnName] + [column for column in valueColumns if column != columnName]
+        if dtypes:
+            dtypes = {column: dtype for column, dtype in dtypes.items() if column in columns}
+
+        groupedQuantiles = cls.fromArrays(np.zeros(0, dtype=np.intp), [], valueColumns,
+                                          [np.zeros(0) for column in valueColumns], exact, relativeAccuracy,
+                                          excludeZeros)
+        for chunk in pd.read_csv(filename, sep=separator, usecols=columns, dtype=dtypes, chunksize=chunkSize):
+            groupedQuantiles = groupedQuantiles.merge(cls.fromDataframe(chunk, columnName, valueColumns, exact,
+                                                                        relativeAccuracy, excludeZeros))
+        return groupedQuantiles
+
+    @classmethod
+    def __toBucketKeys(cls, values, relativeAccuracy):
+        """Gets the key of the bucket of each value. Buckets of larger absolute values have larger keys, negative
+        values get negative keys, and values close to zero get key 0
+        Returns an array of keys"""
+        logGamma = np.log((1 + relativeAccuracy) / (1 - relativeAccuracy))
+        magnitudes = np.abs(values)
+        isIndexable = magnitudes >= cls.MINIMUM_INDEXABLE
+        keys = np.zeros(len(values), dtype=np.int64)
+        keys[isIndexable] = np.ceil(np.log(magnitudes[isIndexable]) / logGamma).astype(np.int64) + cls.KEY_OFFSET
+        return np.where(values < 0, -keys, keys)
+
+    def __fromBucketKeys(self, keys):
+        """Gets the value that represents each bucket, which is within the relative accuracy of every value in it
+        Returns an array of values"""
+        gamma = (1 + self.relativeAccuracy) / (1 - self.relativeAccuracy)
+        indices = np.abs(keys) - self.KEY_OFFSET
+        values = np.where(keys == 0, 0.0, 2 * np.power(gamma, indices.astype(np.float64)) / (gamma + 1))
+        return np.where(keys < 0, -values, values)
+
+    @staticmethod
+    def __aggregate(groupCodes, points, counts):
+        """Adds up the counts of the same group and bucket (or value)
+        Returns the group codes, buckets and counts, ordered by group and bucket"""
+        order = np.lexsort((points, groupCodes))
+        groupCodes, points, counts = groupCodes[order], points[order], counts[order]
+        if len(order) == 0:
+            return groupCodes.astype(np.intp), points, counts
+        starts = np.flatnonzero(np.concatenate(([True], (groupCodes[1:] != groupCodes[:-1]) |
+                                                (points[1:] != points[:-1]))))
+        return groupCodes[starts].astype(np.intp), points[starts], np.add.reduceat(counts, starts)
+
+    def __getColumnIndex(self, column):
+        if column not in self.valueColumns:
+            raise ValueError("No distribution was calculated for column %s" % column)
+        return self.valueColumns.index(column)
+
+    def merge(self, other):
+        """Combines these distributions with the distributions of another part of the data. Both must have been
+        calculated for the same value columns, with the same accuracy and setting for excludeZeros
+        Returns the combined distributions"""
+
+        if self.valueColumns != other.valueColumns:
+            raise ValueError("Can't merge distributions for different value columns")
+        if self.relativeAccuracy != other.relativeAccuracy:
+            raise ValueError("Can't merge distributions with a different accuracy")
+        if self.excludeZeros != other.excludeZeros:
+            raise ValueError("Can't merge distributions with and without excluded zeros")
+
+        groupValues = pd.Index(self.groupValues).append(pd.Index(other.groupValues)).unique()
+        try:
+            groupValues = groupValues.sort_values()
+        except TypeError:
+            pass
+        selfPositions = np.asarray(groupValues.get_indexer(self.groupValues), dtype=np.intp)
+        otherPositions = np.asarray(groupValues.get_indexer(other.groupValues), dtype=np.intp)
+
+        entries = []
+        for (selfCodes, selfPoints, selfCounts), (otherCodes, otherPoints, otherCounts) in zip(self.entries,
+                                                                                                 other.entries):
+            entries.append(self.__aggregate(np.concatenate((selfPositions[selfCodes], otherPositions[otherCodes])),
+                                            np.concatenate((selfPoints, otherPoints)),
+                                            np.concatenate((selfCounts, otherCounts))))
+
+        return GroupedQuantiles(np.asarray(groupValues), self.valueColumns, entries, self.relativeAccuracy,
+                                self.excludeZeros)
+
+    def getCounts(self, column):
+        """Gets the number of values in the distribution of each group
+        Returns an array with a count per group"""
+        groupCodes, points, counts = self.entries[self.__getColumnIndex(column)]
+        return np.bincount(groupCodes, weights=counts, minlength=len(self.groupValues)).astype(np.int64)
+
+    def getQuantiles(self, column, quantiles):
+        """Gets the quantiles (between 0 and 1, e.g. 0.5 for the median) of the column for each group. Quantiles
+        that fall between two values are interpolated linearly, as pandas does. In exact mode this gives the same
+        quantiles as pandas, in sketch mode the values at the two ranks are the representatives of their buckets, so
+        the quantile is within the relative accuracy of the pandas quantile when both values have the same sign
+        Returns an array with a row per group and a column per quantile, with NaN for groups without values"""
+
+        quantiles = np.asarray(quantiles, dtype=np.float64)
+        if ((quantiles < 0) | (quantiles > 1)).any():
+            raise ValueError("Quantiles must be between 0 and 1")
+
+        groupCodes, points, counts = self.entries[self.__getColumnIndex(column)]
+        groupCounts = self.getCounts(column)
+        groupOffsets = np.concatenate(([0], np.cumsum(groupCounts)[:-1]))
+        cumulativeCounts = np.cumsum(counts)
+        result = np.full((len(self.groupValues), len(quantiles)), np.nan)
+        hasValues = groupCounts > 0
+        if not hasValues.any():
+            return result
+
+        def getValuesAtRanks(ranks):
+            """Gets the value at the given rank (from 0) within each group that has values"""
+            positions = np.searchsorted(cumulativeCounts, groupOffsets[hasValues, np.newaxis] + ranks, side="right")
+            return points[positions] if self.isExact else self.__fromBucketKeys(points[positions])
+
+        # in both modes, a quantile between two ranks is interpolated linearly between the values at those ranks
+        ranks = quantiles[np.newaxis, :] * (groupCounts[hasValues, np.newaxis] - 1)
+        lowerRanks = np.floor(ranks).astype(np.int64)
+        lowerValues = getValuesAtRanks(lowerRanks)
+        upperValues = getValuesAtRanks(np.ceil(ranks).astype(np.int64))
+        result[hasValues] = lowerValues + (upperValues - lowerValues) * (ranks - lowerRanks)
+        return result
+
+    def calculateOutput(self, valueColumns, quantiles, sortColumn=None):
+        """Gets the quantiles for each of the value columns, in the same form as the other statistics. Groups without
+        any values are left out
+        sortColumn is an optional column on which the results should be sorted (in descending order), using the
+        first of the quantiles
+        Returns a list of the group values, and a dictionary with a list of lists of the corresponding values for
+        each quantile"""
+
+        columnQuantiles = [self.getQuantiles(column, quantiles) for column in valueColumns]
+        keep = np.zeros(len(self.groupValues), dtype=bool)
+        for column in valueColumns:
+            keep |= self.getCounts(column) > 0
+        positions = np.flatnonzero(keep)
+
+        if sortColumn:
+            sortValues = self.getQuantiles(sortColumn, quantiles[:1])[positions, 0]
+            order = np.argsort(-sortValues, kind="stable")  # NaN stays last
+            positions = positions[order]
+
+        output = {}
+        for i, quantile in enumerate(quantiles):
+            output[quantile] = [values[positions, i].tolist() for values in columnQuantiles]
+        return list(self.groupValues[positions]), output
+
+    def toDict(self):
+        """Converts the distributions into a dictionary of lists, which can be written as JSON
+        Returns the dictionary"""
+        return {"groupValues": self.groupValues.tolist(),
+                "valueColumns": self.valueColumns,
+                "relativeAccuracy": self.relativeAccuracy,
+                "excludeZeros": self.excludeZeros,
+                "entries": [[groupCodes.tolist(), points.tolist(), counts.tolist()]
+                            for groupCodes, points, counts in self.entries]}
+
+    @classmethod
+    def fromDict(cls, dictionary):
+        """Converts a dictionary made by toDict back into distributions
+        Returns the grouped quantiles"""
+        exact = dictionary["relativeAccuracy"] is None
+        entries = [(np.asarray(groupCodes, dtype=np.intp), np.asarray(points, dtype=np.float64 if exact else np.int64),
+                    np.asarray(counts, dtype=np.int64)) for groupCodes, points, counts in dictionary["entries"]]
+        return cls(np.asarray(dictionary["groupValues"], dtype=object), dictionary["valueColumns"], entries,
+                   dictionary["relativeAccuracy"], dictionary["excludeZeros"])
+
+    def save(self, filename):
+        """Writes the distributions to a JSON file
+        Returns no values"""
+        with open(filename, "w") as file:
+            json.dump(self.toDict(), file)
+
+    @classmethod
+    def load(cls, filename):
+        """Reads distributions written by save
+        Returns the grouped quantiles"""
+        with open(filename) as file:
+            return cls.fromDict(json.load(file))
@@ -0,0 +1,423 @@
+import pandas as pd
+import numpy as np
+
+"""This class holds the per-group statistics (sums, counts, minimums etc.) of one or more value columns, for each value
+of a grouping column. The statistics are calculated in a single vectorised pass over integer group codes, rather than
+with a pivot table per statistic.
+
+The statistics are stored in a mergeable form (e.g. an average is kept as a sum and a count), so the statistics for
+different parts of a dataset can be combined afterwards.
+"""
+
+class GroupedStatistics():
+
+    SUM = "sum"
+    COUNT = "count"
+    AVERAGE = "mean"
+    MINIMUM = "min"
+    MAXIMUM = "max"
+    NONZERO_COUNT = "nonzero_count"
+
+    STATISTICS = [SUM, COUNT, AVERAGE, MINIMUM, MAXIMUM, NONZERO_COUNT]
+    NUMERIC_STATISTICS = [SUM, AVERAGE, MINIMUM, MAXIMUM]
+
+    def __init__(self, groupValues, valueColumns, rowCounts, sums, counts, nonzeroCounts, minimums, maximums,
+                 columnKinds, excludeZeros=False):
+        """Initialises the statistics from arrays that are already aggregated per group. Every statistics array has
+        a row per group value and a column per value column. minimums and maximums may be None if they were not
+        calculated. Usually you will want to use fromArrays or fromDataframe instead"""
+        self.groupValues = np.asarray(groupValues)
+        self.valueColumns = list(valueColumns)
+        self.rowCounts = rowCounts
+        self.sums = sums
+        self.counts = counts
+        self.nonzeroCounts = nonzeroCounts
+        self.minimums = minimums
+        self.maximums = maximums
+        self.columnKinds = list(columnKinds)
+        self.excludeZeros = excludeZeros
+
+    @staticmethod
+    def factorizeValues(values):
+        """Converts the values into integer codes, and an array of the unique values in sorted order.
+        Missing values get the code -1
+        Returns the codes and the unique values"""
+        if isinstance(getattr(values, "dtype", None), pd.CategoricalDtype):
+            # categories are already factorised, but unless they are ordered they need to be put in sorted order
+            categorical = pd.Categorical(values)
+            categories = categorical.categories
+            if categorical.ordered:
+                return np.asarray(categorical.codes, dtype=np.intp), np.asarray(categories)
+            try:
+                order = np.asarray(categories.argsort())
+            except TypeError:
+                order = np.arange(len(categories))
+            positions = np.empty(len(order) + 1, dtype=np.intp)
+            positions[order] = np.arange(len(order))
+            positions[-1] = -1  # missing values have code -1, which picks the last position
+            return positions[categorical.codes], np.asarray(categories[order])
+        try:
+            codes, uniques = pd.factorize(values, sort=True)
+        except TypeError:  # values of mixed types can't be sorted, so keep them in order of appearance
+            codes, uniques = pd.factorize(values)
+        return np.asarray(codes), np.asarray(uniques)
+
+    @staticmethod
+    def getGroupOrder(codes):
+        """Orders the rows so that the rows of each group are next to each other. Needed for the minimum and
+        maximum, which can't be calculated with a bincount
+        Returns the row order, and the position in that order where each group present in the codes starts"""
+        order = np.argsort(codes, kind="mergesort")
+        sortedCodes = codes[order]
+        if len(sortedCodes) == 0:
+            return order, np.zeros(0, dtype=np.intp)
+        starts = np.flatnonzero(np.concatenate(([True], sortedCodes[1:] != sortedCodes[:-1])))
+        return order, starts
+
+    @classmethod
+    def fromArrays(cls, codes, groupValues, valueColumns, valueArrays, excludeZeros=False, statistics=None,
+                   groupOrder=None):
+        """Calculates the statistics for each of the value arrays, for each group. codes gives the position of
+        the group of each row in groupValues, or -1 if the row has no group. valueArrays contains an array of
+        values (one per row) for each of the value columns.
+        if excludeZeros is true, then zero values in the value columns will be excluded from the calculation
+        statistics optionally restricts which statistics are calculated. The minimum and maximum need the rows to
+        be ordered by group, which is the most expensive step, so are only calculated if requested. groupOrder can
+        be given if the order has already been calculated (see getGroupOrder)
+        Returns the grouped statistics"""
+
+        if statistics is None:
+            statistics = cls.STATISTICS
+        for statistic in statistics:
+            if statistic not in cls.STATISTICS:
+                raise ValueError("Unknown statistic %s, should be one of %s" % (statistic, ", ".join(cls.STATISTICS)))
+        calculateExtremes = cls.MINIMUM in statistics or cls.MAXIMUM in statistics
+
+        codes = np.asarray(codes)
+        numberOfGroups = len(groupValues)
+        numberOfColumns = len(valueColumns)
+
+        hasGroup = codes >= 0
+        if not hasGroup.all():  # rows without a group are left out, and the group order is no longer valid
+            codes = codes[hasGroup]
+            valueArrays = [np.asarray(values)[hasGroup] for values in valueArrays]
+            groupOrder = None
+
+        rowCounts = np.bincount(codes, minlength=numberOfGroups)
+        sums = np.zeros((numberOfGroups, numberOfColumns))
+        counts = np.zeros((numberOfGroups, numberOfColumns), dtype=np.int64)
+        nonzeroCounts = np.zeros((numberOfGroups, numberOfColumns), dtype=np.int64)
+        minimums = np.full((numberOfGroups, numberOfColumns), np.nan) if calculateExtremes else None
+        maximums = np.full((numberOfGroups, numberOfColumns), np.nan) if calculateExtremes else None
+        columnKinds = []
+
+        if calculateExtremes:
+            order, starts = groupOrder if groupOrder is not None else cls.getGroupOrder(codes)
+            groupsPresent = codes[order[starts]]
+
+        for i in range(numberOfColumns):
+            values = np.asarray(valueArrays[i])
+            kind = values.dtype.kind
+            columnKinds.append(kind)
+
+            if kind in "biuf":
+                valid = ~np.isnan(values) if kind == "f" else None
+                nonzero = values != 0
+                if valid is not None:
+                    nonzero &= valid
+            else:  # non-numeric columns can only be counted
+                valid = np.asarray(pd.notna(values))
+                nonzero = valid
+            included = nonzero if excludeZeros else valid
+
+            if included is None:
+                counts[:, i] = rowCounts
+            else:
+                counts[:, i] = np.bincount(codes[included], minlength=numberOfGroups)
+            nonzeroCounts[:, i] = np.bincount(codes[nonzero], minlength=numberOfGroups)
+
+            if kind not in "biuf":
+                sums[:, i] = np.nan
+                continue
+
+            # excluded values are masked to zero for the sum, and to +/- infinity for the extremes
+            sums[:, i] = np.bincount(codes, weights=values if included is None else np.where(included, values, 0),
+                                     minlength=numberOfGroups)
+            if calculateExtremes and len(starts):
+                orderedValues = values[order].astype(np.float64)
+                orderedIncluded = None if included is None else included[order]
+                minimums[groupsPresent, i] = np.minimum.reduceat(
+                    orderedValues if orderedIncluded is None else np.where(orderedIncluded, orderedValues, np.inf),
+                    starts)
+                maximums[groupsPresent, i] = np.maximum.reduceat(
+                    orderedValues if orderedIncluded is None else np.where(orderedIncluded, orderedValues, -np.inf),
+                    starts)
+
+        if calculateExtremes:  # groups without any included values have no minimum or maximum
+            minimums[counts == 0] = np.nan
+            maximums[counts == 0] = np.nan
+
+        return cls(groupValues, valueColumns, rowCounts, sums, counts, nonzeroCounts, minimums, maximums,
+                   columnKinds, excludeZeros)
+
+    @classmethod
+    def fromDataframe(cls, dataframe, columnName, valueColumns, excludeZeros=False, statistics=None):
+        """Calculates the statistics of the value columns for each value in columnName of the data frame
+        Returns the grouped statistics"""
+        codes, groupValues = cls.factorizeValues(dataframe[columnName])
+        valueArrays = [dataframe[column].to_numpy() for column in valueColumns]
+        return cls.fromArrays(codes, groupValues, valueColumns, valueArrays, excludeZeros, statistics)
+
+    @classmethod
+    def fromCsv(cls, filename, columnName, valueColumns, excludeZeros=False, statistics=None, separator=";",
+                dtypes=None, chunkSize=1000000):
+        """Calculates the statistics of the value columns for each value in columnName of a csv file, reading only
+        those columns, chunkSize rows at a time. The statistics of each chunk are merged into the total, so the
+        file never has to fit in memory.
+        dtypes is an optional dictionary with the type of each column, which saves pandas having to guess them
+        Returns the grouped statistics"""
+
+        columns = [columnName] + [column for column in valueColumns if column != columnName]
+        if dtypes:
+            dtypes = {column: dtype for column, dtype in dtypes.items() if column in columns}
+
+        groupedStatistics = None
+        for chunk in pd.read_csv(filename, sep=separator, usecols=columns, dtype=dtypes, chunksize=chunkSize):
+            chunkStatistics = cls.fromDataframe(chunk, columnName, valueColumns, excludeZeros, statistics)
+            groupedStatistics = chunkStatistics if groupedStatistics is None else groupedStatistics.merge(chunkStatistics)
+
+        if groupedStatistics is None:  # file without rows
+            groupedStatistics = cls.fromArrays(np.zeros(0, dtype=np.intp), [], valueColumns,
+                                               [np.zeros(0) for column in valueColumns], excludeZeros, statistics)
+        return groupedStatistics
+
+    def __getColumnIndex(self, column):
+        if column not in self.valueColumns:
+            raise ValueError("No statistics were calculated for column %s" % column)
+        return self.valueColumns.index(column)
+
+    def getStatistic(self, statistic, column):
+        """Gets the values of the statistic for the column, with a value per group
+        Returns an array of the statistic values"""
+
+        i = self.__getColumnIndex(column)
+        kind = self.columnKinds[i]
+        if statistic in self.NUMERIC_STATISTICS and kind not in "biuf":
+            raise ValueError("Can't calculate the %s of non-numeric column %s" % (statistic, column))
+        # integer columns keep their type, unless zeros are excluded (as zeros are then treated as missing values)
+        keepIntegers = kind in "biu" and not self.excludeZeros
+
+        if statistic == self.SUM:
+            return self.sums[:, i].astype(np.int64) if keepIntegers else self.sums[:, i]
+        elif statistic == self.COUNT:
+            return self.counts[:, i]
+        elif statistic == self.NONZERO_COUNT:
+            return self.nonzeroCounts[:, i]
+        elif statistic == self.AVERAGE:
+            with np.errstate(invalid="ignore", divide="ignore"):
+                return np.where(self.counts[:, i] > 0, self.sums[:, i] / self.counts[:, i], np.nan)
+        elif statistic in (self.MINIMUM, self.MAXIMUM):
+            extremes = self.minimums if statistic == self.MINIMUM else self.maximums
+            if extremes is None:
+                raise ValueError("The %s was not calculated for these statistics" % statistic)
+            return extremes[:, i].astype(np.int64) if keepIntegers else extremes[:, i]
+        raise ValueError("Unknown statistic %s, should be one of %s" % (statistic, ", ".join(self.STATISTICS)))
+
+    def merge(self, other):
+        """Combines these statistics with the statistics of another part of the data. Both must have been calculated
+        for the same value columns, and with the same setting for excludeZeros
+        Returns the combined statistics"""
+
+        if self.valueColumns != other.valueColumns:
+            raise ValueError("Can't merge statistics for different value columns")
+        if self.excludeZeros != other.excludeZeros:
+            raise ValueError("Can't merge statistics with and without excluded zeros")
+
+        if len(self.groupValues) == len(other.groupValues) and (self.groupValues == other.groupValues).all():
+            groupValues = self.groupValues
+            selfPositions = otherPositions = np.arange(len(groupValues))
+        else:
+            groupValues = pd.Index(self.groupValues).append(pd.Index(other.groupValues)).unique()
+            try:
+                groupValues = groupValues.sort_values()
+            except TypeError:
+                pass
+            selfPositions = groupValues.get_indexer(self.groupValues)
+            otherPositions = groupValues.get_indexer(other.groupValues)
+            groupValues = np.asarray(groupValues)
+
+        def combine(selfValues, otherValues, function, fillValue):
+            combined = np.full((len(groupValues),) + selfValues.shape[1:], fillValue, dtype=selfValues.dtype)
+            combined[selfPositions] = selfValues
+            combined[otherPositions] = function(combined[otherPositions], otherValues)
+            return combined
+
+        hasExtremes = self.minimums is not None and other.minimums is not None
+        columnKinds = [kind if kind == otherKind else "f" for kind, otherKind in zip(self.columnKinds, other.columnKinds)]
+
+        return GroupedStatistics(groupValues, self.valueColumns,
+                                 combine(self.rowCounts, other.rowCounts, np.add, 0),
+                                 combine(self.sums, other.sums, np.add, 0),
+                                 combine(self.counts, other.counts, np.add, 0),
+                                 combine(self.nonzeroCounts, other.nonzeroCounts, np.add, 0),
+                                 combine(self.minimums, other.minimums, np.fmin, np.nan) if hasExtremes else None,
+                                 combine(self.maximums, other.maximums, np.fmax, np.nan) if hasExtremes else None,
+                                 columnKinds, self.excludeZeros)
+
+    def selectGroups(self, groupPositions):
+        """Selects the groups at the given positions, in the given order
+        Returns the statistics of the selected groups"""
+        return GroupedStatistics(self.groupValues[groupPositions], self.valueColumns,
+                                 self.rowCounts[groupPositions],
+                                 self.sums[groupPositions],
+                                 self.counts[groupPositions],
+                                 self.nonzeroCounts[groupPositions],
+                                 None if self.minimums is None else self.minimums[groupPositions],
+                                 None if self.maximums is None else self.maximums[groupPositions],
+                                 self.columnKinds, self.excludeZeros)
+
+    def selectColumns(self, valueColumns):
+        """Selects the statistics of some of the value columns
+        Returns the statistics of the selected columns"""
+        positions = [self.__getColumnIndex(column) for column in valueColumns]
+        return GroupedStatistics(self.groupValues, valueColumns, self.rowCounts,
+                                 self.sums[:, positions],
+                                 self.counts[:, positions],
+                                 self.nonzeroCounts[:, positions],
+                                 None if self.minimums is None else self.minimums[:, positions],
+                                 None if self.maximums is None else self.maximums[:, positions],
+                                 [self.columnKinds[i] for i in positions], self.excludeZeros)
+
+    def regroup(self, codes, groupValues):
+        """Combines the groups into larger groups. codes gives, for each current group, the position of the group it
+        belongs to in groupValues. Sums and counts are added up, and the smallest minimum and largest maximum kept
+        Returns the statistics of the larger groups"""
+
+        codes = np.asarray(codes)
+        numberOfGroups = len(groupValues)
+
+        def add(values):
+            if values.ndim == 1:
+                return np.bincount(codes, weights=values, minlength=numberOfGroups)
+            combined = np.zeros((numberOfGroups, values.shape[1]))
+            for i in range(values.shape[1]):
+                combined[:, i] = np.bincount(codes, weights=values[:, i], minlength=numberOfGroups)
+            return combined
+
+        minimums = maximums = None
+        if self.minimums is not None:
+            order, starts = self.getGroupOrder(codes)
+            minimums = np.full((numberOfGroups, len(self.valueColumns)), np.nan)
+            maximums = np.full((numberOfGroups, len(self.valueColumns)), np.nan)
+            if len(starts):
+                groupsPresent = codes[order[starts]]
+                minimums[groupsPresent] = np.fmin.reduceat(self.minimums[order], starts, axis=0)
+                maximums[groupsPresent] = np.fmax.reduceat(self.maximums[order], starts, axis=0)
+
+        return GroupedStatistics(groupValues, self.valueColumns,
+                                 add(self.rowCounts).astype(np.int64),
+                                 add(self.sums),
+                                 add(self.counts).astype(np.int64),
+                                 add(self.nonzeroCounts).astype(np.int64),
+                                 minimums, maximums, self.columnKinds, self.excludeZeros)
+
+    def excludingZeros(self):
+        """Converts statistics calculated with zeros into statistics without zeros. Zeros don't change the sums, so
+        only the counts need to be replaced by the nonzero counts. The minimum and maximum can't be converted
+        Returns the statistics without zeros"""
+        if self.excludeZeros:
+            return self
+        return GroupedStatistics(self.groupValues, self.valueColumns, self.rowCounts, self.sums, self.nonzeroCounts,
+                                 self.nonzeroCounts, None, None, self.columnKinds, True)
+
+    def foldGroups(self, groupPositions, otherPositions, otherLabel):
+        """Selects the groups at groupPositions, and combines the groups at otherPositions into one extra group
+        with the label otherLabel, which is added at the end. Sums and counts of the other groups are added up,
+        so e.g. the average of the extra group is the average over all its rows
+        Returns the statistics of the selected groups and the extra group"""
+
+        def fold(values, function):
+            return np.concatenate((values[groupPositions], function(values[otherPositions], axis=0)[np.newaxis]))
+
+        hasExtremes = self.minimums is not None and len(otherPositions)
+        with np.errstate(invalid="ignore"):
+            return GroupedStatistics(np.concatenate((self.groupValues[groupPositions].astype(object), [otherLabel])),
+                                     self.valueColumns,
+                                     fold(self.rowCounts, np.sum),
+                                     fold(self.sums, np.sum),
+                                     fold(self.counts, np.sum),
+                                     fold(self.nonzeroCounts, np.sum),
+                                     fold(self.minimums, np.nanmin) if hasExtremes else None,
+                                     fold(self.maximums, np.nanmax) if hasExtremes else None,
+                                     self.columnKinds, self.excludeZeros)
+
+    @staticmethod
+    def selectLargest(values, number):
+        """Selects the positions of the largest values, in descending order, without sorting all the values. Ties are
+        broken by position, and missing values come last, so the result is the same as the first values of a stable
+        descending sort
+        Returns the positions of the largest values"""
+
+        keys = np.where(np.isnan(values), -np.inf, values) if values.dtype.kind == "f" else values
+        if number >= len(keys):
+            selected = np.arange(len(keys))
+        else:
+            # everything above the threshold is selected, and as many values equal to it as are still needed
+            threshold = keys[np.argpartition(-keys, number - 1)[number - 1]]
+            above = np.flatnonzero(keys > threshold)
+            equal = np.flatnonzero(keys == threshold)[:number - len(above)]
+            selected = np.concatenate((above, equal))
+
+        return selected[np.lexsort((selected, -keys[selected]))]
+
+    def calculateOutput(self, valueColumns, statistics, sortColumn=None, sortStatistic=None, topN=None,
+                        otherLabel=None):
+        """Gets the statistics for each of the value columns, in the same form as a pivot table. Groups without
+        any rows are left out, as are groups for which every statistic is missing
+        sortColumn is an optional column on which the results should be sorted (in descending order), using
+        sortStatistic, which defaults to the first of the statistics
+        topN optionally limits the results to the first topN groups (at least 1) after sorting. If otherLabel is
+        given, the remaining groups are combined into one extra group with that label
+        Returns a list of the group values, and a dictionary with a list of lists of the corresponding values for
+        each statistic"""
+
+        if topN is not None and not sortColumn:
+            raise ValueError("A sort column is needed to select the top %d values" % topN)
+        if topN is not None and topN < 1:
+            raise ValueError("topN must be at least 1, not %d" % topN)
+
+        columnStatistics = {}
+        for statistic in statistics:
+            columnStatistics[statistic] = [self.getStatistic(statistic, column) for column in valueColumns]
+
+        keep = self.rowCounts > 0
+        allMissing = np.ones(len(self.groupValues), dtype=bool)
+        for statistic in statistics:
+            for values in columnStatistics[statistic]:
+                if values.dtype.kind == "f":
+                    allMissing &= np.isnan(values)
+                else:
+                    allMissing[:] = False
+        if statistics and valueColumns:
+            keep &= ~allMissing
+        positions = np.flatnonzero(keep)
+
+        if sortColumn:
+            sortValues = self.getStatistic(sortStatistic or statistics[0], sortColumn)[positions]
+            if topN is not None:
+                selected = self.selectLargest(sortValues, topN)
+                if otherLabel is not None and len(selected) < len(positions):
+                    remaining = np.ones(len(positions), dtype=bool)
+                    remaining[selected] = False
+                    folded = self.foldGroups(positions[selected], positions[remaining], otherLabel)
+                    return folded.calculateOutput(valueColumns, statistics)
+                positions = positions[selected]
+            else:
+                # a stable sort on the negated values gives descending order, with missing values last
+                positions = positions[np.argsort(-sortValues, kind="mergesort")]
+
+        output = {}
+        for statistic in statistics:
+            output[statistic] = [values[positions].tolist() for values in columnStatistics[statistic]]
+
+        return list(self.groupValues[positions]), output
@@ -0,0 +1,144 @@
+import numpy as np
+from ArchiveAnalysis.GroupedStatistics import GroupedStatistics
+from ArchiveAnalysis.GroupedDistinctCounts import GroupedDistinctCounts
+from ArchiveAnalysis.StatisticsAccumulator import StatisticsAccumulator
+from ArchiveAnalysis.AggregatedPersonAnalyser import AggregatedPersonAnalyser
+
+"""This class performs the same statistical calculations as the PersonAnalyser, for appearance data that keeps
+growing, e.g. with new face and voice recognition results every day. New rows are added with appendRows, which
+updates the per-group sums, counts, minimums and maximums and the broadcasts per programme, without looking at the
+rows that were added before. The statistics are kept in a StatisticsAccumulator per grouping column, and the
+broadcasts as the sorted 64 bit hashes of the distinct dates of each programme (see GroupedDistinctCounts), so a
+batch only updates the groups and programmes that occur in it.
+
+The grouping columns (e.g. "Name", "Party") and value columns (e.g. the times) must be chosen when the analyser is
+created, as the rows themselves are not kept. Averages with zeros excluded are calculated from the nonzero counts, but
+minimums and maximums with zeros excluded are not available. Calculations that need the rows themselves, such as
+quantiles, time series and queries, raise a NotImplementedError, see AggregatedPersonAnalyser.
+
+Distinct counts (e.g. the number of different persons per programme per week) are kept for the groupings given as
+distinctCounts, by default as HyperLogLog sketches, so their memory doesn't grow with the number of rows added. They
+are not updated in place: the counts of each batch are merged with those of all earlier rows, which takes time in
+proportion to the size of all the sketches (or in exact mode, all the distinct values) kept so far.
+"""
+
+class IncrementalPersonAnalyser(AggregatedPersonAnalyser):
+
+    DESCRIPTION = "an incremental analyser"
+
+    def __init__(self, groupColumns, valueColumns, dateColumn="Date", programmeColumn="Programme", dataframe=None,
+                 distinctCounts=None, approximateDistinctCounts=True,
+                 precision=GroupedDistinctCounts.DEFAULT_PRECISION):
+        """Initialises the analyser for the grouping columns and value columns. The date column is counted as well,
+        for countAppearancesPerColumnValue. If a programme column is given, the broadcasts (distinct dates) per
+        programme are also kept up to date. Optionally, a data frame with the first rows can be given.
+        distinctCounts is an optional list of (grouping columns, distinct column) pairs, e.g.
+        [(["Programme", "Week"], "Name")], for countDistinctValuesPerColumnValue. They are HyperLogLog estimates
+        unless approximateDistinctCounts is false"""
+        self._resultCache = None
+        self.groupColumns = list(groupColumns)
+        self.valueColumns = list(valueColumns)
+        if dateColumn and dateColumn not in self.valueColumns:
+            self.valueColumns.append(dateColumn)
+        self.dateColumn = dateColumn
+        self.programmeColumn = programmeColumn
+        self.distinctCounts = [(self.__getGroupingKey(columnNames), distinctColumn)
+                               for columnNames, distinctColumn in (distinctCounts or [])]
+        self.approximateDistinctCounts = approximateDistinctCounts
+        self.precision = precision
+
+        self.rowCount = 0
+        self.__statisticsAccumulators = {columnName: StatisticsAccumulator(self.valueColumns)
+                                         for columnName in self.groupColumns}
+        self.__groupedDistinctCounts = {}
+        self.__programmeDates = {}
+
+        if dataframe is not None:
+            self.appendRows(dataframe)
+
+    def appendRows(self, dataframe):
+        """Adds a batch of new rows to the statistics. Only the new rows are processed, and only the groups and
+        programmes in the batch are updated. The distinct counts are merged with those of the earlier rows, which
+        takes time in proportion to all the counts kept so far
+        Returns no values"""
+
+        for columnName in self.groupColumns:
+            batchStatistics = GroupedStatistics.fromDataframe(dataframe, columnName, self.valueColumns)
+            self.__statisticsAccumulators[columnName].add(batchStatistics)
+
+        for key in self.distinctCounts:
+            columnNames, distinctColumn = key
+            batchCounts = GroupedDistinctCounts.fromDataframe(dataframe, list(columnNames), distinctColumn,
+                                                              self.approximateDistinctCounts, self.precision)
+            if key in self.__groupedDistinctCounts:
+                batchCounts = self.__groupedDistinctCounts[key].merge(batchCounts)
+            self.__groupedDistinctCounts[key] = batchCounts
+
+        if self.programmeColumn and self.dateColumn:
+            self.__addProgrammeDates(dataframe)
+
+        self.rowCount += len(dataframe.index)
+        self.clearResultCache()
+
+    def __addProgrammeDates(self, dataframe):
+        batchDates = GroupedDistinctCounts.fromDataframe(dataframe, self.programmeColumn, self.dateColumn)
+        codes, hashes = batchDates.hashes
+        starts = np.searchsorted(codes, np.arange(len(batchDates.groupValues) + 1))
+        for i, programme in enumerate(batchDates.groupValues):
+            if starts[i] == starts[i + 1]:
+                continue
+            dates = hashes[starts[i]:starts[i + 1]]
+            if programme in self.__programmeDates:
+                dates = np.union1d(self.__programmeDates[programme], dates)
+            self.__programmeDates[programme] = dates
+
+    def countRowsInDataframe(self):
+        """Counts how many rows have been added"""
+        return self.rowCount
+
+    def calculateGroupedStatistics(self, columnName, valueColumns, excludeZeros=False, statistics=None):
+        """Gets the statistics of the value columns for each value in columnName, as kept up to date by appendRows
+        Returns the GroupedStatistics"""
+
+        if columnName not in self.groupColumns:
+            raise ValueError("Column %s is not one of the grouping columns of this analyser" % columnName)
+        if self.rowCount == 0:
+            raise ValueError("No rows have been added yet")
+        for column in valueColumns:
+            if column not in self.valueColumns:
+                raise ValueError("Column %s is not one of the value columns of this analyser" % column)
+
+        groupedStatistics = self.__statisticsAccumulators[columnName].toGroupedStatistics().selectColumns(valueColumns)
+        return groupedStatistics.excludingZeros() if excludeZeros else groupedStatistics
+
+    def calculateGroupedDistinctCounts(self, columnNames, distinctColumn, approximate=False,
+                                       precision=GroupedDistinctCounts.DEFAULT_PRECISION):
+        """Gets the distinct values of distinctColumn for each group of the columns, as kept up to date by appendRows.
+        The counts are kept in the form chosen when the analyser was created, so approximate and precision are
+        ignored
+        Returns the GroupedDistinctCounts"""
+
+        key = (self.__getGroupingKey(columnNames), distinctColumn)
+        if key not in self.distinctCounts:
+            raise ValueError("Distinct values of %s per %s are not counted by this analyser"
+                             % (distinctColumn, ", ".join(key[0])))
+        if key not in self.__groupedDistinctCounts:
+            raise ValueError("No rows have been added yet")
+        return self.__groupedDistinctCounts[key]
+
+    def __getGroupingKey(self, columnNames):
+        return (columnNames,) if isinstance(columnNames, str) else tuple(columnNames)
+
+    def countProgrammeBroadcasts(self, programmeColumn, dateColumn):
+        """Counts the number of broadcasts per programme"""
+
+        if programmeColumn != self.programmeColumn or dateColumn != self.dateColumn:
+            raise ValueError("Broadcasts are only counted for programme column %s and date column %s"
+                             % (self.programmeColumn, self.dateColumn))
+
+        programmes = list(self.__programmeDates)
+        try:
+            programmes.sort()
+        except TypeError:
+            pass
+        return programmes, [len(self.__programmeDates[programme]) for programme in programmes]
@@ -0,0 +1,147 @@
+import unicodedata
+import numpy as np
+import pandas as pd
+from scipy import sparse
+
+"""This class links the names of persons in one dataset to the names in another dataset, when the names are written
+differently. E.g. the appearances have "Zanen, Jan van" while the speaker times have "Jan van Zanen".
+
+Names are first normalised: "surname, first names tussenvoegsel" is put in the normal Dutch order, accents,
+punctuation and capitals are removed. Identical normalised names always match. Other names are only compared with the
+candidates that share a blocking key with them: a word of the name that is not a tussenvoegsel (e.g. "zanen", but not
+"van"), and optionally character n-grams of these words. Candidates are scored by the overlap of the character
+trigrams of the normalised names (the Dice coefficient), so small spelling differences still give a high score.
+"""
+
+class NameMatcher():
+
+    TUSSENVOEGSELS = {"van", "de", "der", "den", "het", "t", "ter", "ten", "te", "in", "op", "aan", "bij", "d", "da",
+                      "di", "du", "la", "le", "el", "al", "von", "vom", "zu", "vd"}
+    PUNCTUATION_TO_SPACES = str.maketrans({character: " " for character in map(chr, range(128))
+                                           if not character.isalnum()})
+    NAME_COLUMN = "Name"
+    MATCH_COLUMN = "Matched name"
+    SCORE_COLUMN = "Match score"
+
+    def __init__(self, names, ngramSize=None, maxBlockSize=1000):
+        """Initialises the matcher with the names to match against. If ngramSize is given, character n-grams of the
+        words of the names are used as blocking keys as well, which finds more misspelt names but gives more
+        candidates. Keys that are shared by more than maxBlockSize names (e.g. common first names) are not used"""
+        self.ngramSize = ngramSize
+        self.maxBlockSize = maxBlockSize
+        self.names, self.normalisedNames = self.__getUniqueNames(names)
+        self.__keyIndex = self.__buildKeys(self.normalisedNames)
+        self.__trigramMatrix = self.getTrigramMatrix(self.normalisedNames)
+
+    @classmethod
+    def normaliseName(cls, name):
+        """Normalises a name to lower case words in first name to surname order, without accents or punctuation.
+        E.g. "Zanen, Jan van" and "Jan van Zanen" both become "jan van zanen"
+        Returns the normalised name"""
+        if not isinstance(name, str):
+            return ""
+        surname, comma, firstNames = name.partition(",")
+        if comma:
+            name = firstNames + " " + surname
+        name = unicodedata.normalize("NFKD", name).encode("ascii", "ignore").decode("ascii")
+        return " ".join(name.lower().translate(cls.PUNCTUATION_TO_SPACES).split())
+
+    @classmethod
+    def normaliseNames(cls, names):
+        """Normalises a list or series of names, see normaliseName
+        Returns an array with the normalised names"""
+        return np.array([cls.normaliseName(name) for name in names], dtype=object)
+
+    def getBlockingKeys(self, normalisedNames):
+        """Gets the blocking keys of normalised names: their words that are not tussenvoegsels, and if ngramSize was
+        given the character n-grams of these words
+        Returns a data frame with the position of the name and a key per row"""
+        words = pd.Series(normalisedNames, dtype=object).str.split().explode().dropna()
+        words = words[~words.isin(self.TUSSENVOEGSELS) & (words.str.len() > 1)]
+        keys = [words]
+        if self.ngramSize:
+            keys.append(("#" + words.map(lambda word: [word[i:i + self.ngramSize]
+                                                       for i in range(len(word) - self.ngramSize + 1)])
+                         .explode().dropna()))
+        keys = pd.concat(keys)
+        return pd.DataFrame({"name": keys.index.to_numpy(dtype=np.intp), "key": keys.to_numpy()}).drop_duplicates()
+
+    @staticmethod
+    def getTrigramMatrix(normalisedNames):
+        """Gets the character trigrams of normalised names, padded with spaces, as a sparse binary matrix with a row
+        per name and a column per possible trigram of ASCII characters
+        Returns the matrix"""
+        padded = np.array(["  " + name + " " for name in normalisedNames], dtype=bytes)
+        if padded.dtype.itemsize < 3:
+            return sparse.csr_matrix((len(padded), 2 ** 24))
+        characters = padded.view(np.uint8).reshape(len(padded), padded.dtype.itemsize).astype(np.int32)
+        lengths = np.char.str_len(padded)
+
+        trigrams = (characters[:, :-2] << 16) | (characters[:, 1:-1] << 8) | characters[:, 2:]
+        rows, positions = np.nonzero(np.arange(trigrams.shape[1]) < (lengths - 2)[:, np.newaxis])
+        matrix = sparse.csr_matrix((np.ones(len(rows)), (rows, trigrams[rows, positions])),
+                                   shape=(len(padded), 2 ** 24))
+        matrix.data[:] = 1
+        return matrix
+
+    def __getUniqueNames(self, names):
+        names = np.asarray(pd.unique(pd.Series(names).dropna().astype(str)), dtype=object)
+        return names, self.normaliseNames(names)
+
+    def __buildKeys(self, normalisedNames):
+        keys = self.getBlockingKeys(normalisedNames)
+        blockSizes = keys.groupby("key")["name"].transform("size")
+        return keys[blockSizes <= self.maxBlockSize]
+
+    def __findCandidates(self, normalisedNames):
+        """Finds the pairs of names that share a blocking key, or have the same normalised name
+        Returns arrays with the positions of the pairs in normalisedNames and in the names of the matcher"""
+        keys = self.__buildKeys(normalisedNames)
+        pairs = keys.merge(self.__keyIndex, on="key", suffixes=("", "_candidate"))[["name", "name_candidate"]]
+        identical = pd.DataFrame({"name": np.arange(len(normalisedNames)),
+                                  "name_candidate": pd.Index(self.normalisedNames).get_indexer(normalisedNames)})
+        pairs = pd.concat([pairs, identical[identical["name_candidate"] >= 0]]).drop_duplicates()
+        return pairs["name"].to_numpy(dtype=np.intp), pairs["name_candidate"].to_numpy(dtype=np.intp)
+
+    def __calculateScores(self, normalisedNames, positions, candidatePositions):
+        """Calculates the Dice coefficient of the trigrams of each pair of names
+        Returns an array with a score per pair"""
+        matrix = self.getTrigramMatrix(normalisedNames)
+        shared = np.asarray(matrix[positions].multiply(self.__trigramMatrix[candidatePositions]).sum(axis=1))
+        sizes = np.diff(matrix.indptr)[positions] + np.diff(self.__trigramMatrix.indptr)[candidatePositions]
+        scores = 2 * shared.reshape(-1) / np.maximum(sizes, 1)
+        scores[normalisedNames[positions] == self.normalisedNames[candidatePositions]] = 1.0
+        return scores
+
+    def match(self, names, minScore=0.8):
+        """Finds for each of the names the best matching name of the matcher, with a score between 0 and 1 (1 for
+        names that are the same after normalisation). Names without a match of at least minScore are left out
+        Returns a data frame with the name, the matched name and the score"""
+
+        names, normalisedNames = self.__getUniqueNames(names)
+        positions, candidatePositions = self.__findCandidates(normalisedNames)
+        scores = self.__calculateScores(normalisedNames, positions, candidatePositions)
+
+        # keep the best candidate per name, the first one of the matcher if there are several
+        order = np.lexsort((candidatePositions, -scores, positions))
+        positions, candidatePositions, scores = positions[order], candidatePositions[order], scores[order]
+        isBest = np.concatenate(([True], positions[1:] != positions[:-1])) & (scores >= minScore)
+
+        return pd.DataFrame({self.NAME_COLUMN: names[positions[isBest]],
+                             self.MATCH_COLUMN: self.names[candidatePositions[isBest]],
+                             self.SCORE_COLUMN: scores[isBest]})
+
+    @classmethod
+    def joinDataframes(cls, left, right, leftColumn, rightColumn, minScore=0.8, how="inner", ngramSize=None):
+        """Joins two data frames on name columns that are written differently, e.g. the appearances on "Name" and
+        the speaker times on "Naam". Each name in the left frame is joined to the rows of its best match in the right
+        frame. how is "inner" or "left", as for pandas merge
+        Returns the joined data frame, with the score of the match in the column "Match score\""""
+
+        matches = cls(right[rightColumn], ngramSize).match(left[leftColumn], minScore)
+        matches = matches.rename(columns={cls.NAME_COLUMN: "__leftName", cls.MATCH_COLUMN: "__rightName"})
+
+        joined = left.merge(matches, how=how, left_on=leftColumn, right_on="__leftName")
+        joined = joined.merge(right, how=how, left_on="__rightName", right_on=rightColumn,
+                              suffixes=("", "_right"))
+        return joined.drop(columns=["__leftName", "__rightName"])
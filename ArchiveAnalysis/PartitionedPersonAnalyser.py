@@ -0,0 +1,162 @@
+from concurrent.futures import ProcessPoolExecutor
+import pandas as pd
+from ArchiveAnalysis.GroupedStatistics import GroupedStatistics
+from ArchiveAnalysis.GroupedQuantiles import GroupedQuantiles
+from ArchiveAnalysis.GroupedDistinctCounts import GroupedDistinctCounts
+from ArchiveAnalysis.PersonAnalyser import PersonAnalyser
+from ArchiveAnalysis.AggregatedPersonAnalyser import AggregatedPersonAnalyser
+
+"""This class performs the same statistical calculations as the PersonAnalyser, for appearances that are split over
+several csv files, e.g. one file per broadcast week. Each file (partition) is aggregated separately in a worker process,
+into statistics that can be merged (e.g. an average is kept as a sum and a count). The statistics of the partitions are
+then combined, which gives the same results as running the PersonAnalyser on all the appearances together.
+
+As the data is never loaded as a single data frame, methods that need the whole data frame (e.g. query, buildCube and
+calculateTimeSeriesPerColumnValue) raise a NotImplementedError, see AggregatedPersonAnalyser.
+"""
+
+class PartitionedPersonAnalyser(AggregatedPersonAnalyser):
+
+    DESCRIPTION = "a partitioned analyser"
+
+    def __init__(self, filenames, separator=PersonAnalyser.CSV_SEPARATOR, dtypes=None,
+                 chunkSize=PersonAnalyser.CSV_CHUNK_SIZE, processes=None):
+        """Initialises the analyser for a list of csv files with the same columns. Each file is read chunkSize rows
+        at a time, using the given dtypes (by default those of the PersonAnalyser).
+        processes is the number of worker processes, by default one per processor. With 1 process, the files are
+        aggregated one after another in the current process"""
+        if not filenames:
+            raise ValueError("No partition files given")
+
+        self.filenames = list(filenames)
+        self.separator = separator
+        self.dtypes = dtypes if dtypes is not None else self.CSV_DTYPES
+        self.chunkSize = chunkSize
+        self.processes = processes
+
+    @staticmethod
+    def countPartitionRows(filename, separator, chunkSize):
+        """Counts the rows of one partition file, reading only its first column. Runs in a worker process
+        Returns the number of rows"""
+        return sum(len(chunk.index) for chunk in pd.read_csv(filename, sep=separator, usecols=[0],
+                                                              chunksize=chunkSize))
+
+    def countRowsInDataframe(self):
+        """Counts how many rows there are in all the partitions together, for each partition in parallel"""
+
+        numberOfFiles = len(self.filenames)
+        arguments = [self.filenames, [self.separator] * numberOfFiles, [self.chunkSize] * numberOfFiles]
+
+        if self.processes == 1 or numberOfFiles == 1:
+            return sum(map(self.countPartitionRows, *arguments))
+
+        with ProcessPoolExecutor(max_workers=self.processes) as executor:
+            return sum(executor.map(self.countPartitionRows, *arguments))
+
+    @staticmethod
+    def aggregatePartition(filename, columnName, valueColumns, excludeZeros, statistics, separator, dtypes, chunkSize):
+        """Calculates the grouped statistics of one partition file. Runs in a worker process
+        Returns the GroupedStatistics of the partition"""
+        return GroupedStatistics.fromCsv(filename, columnName, valueColumns, excludeZeros, statistics, separator,
+                                         dtypes, chunkSize)
+
+    def calculateGroupedStatistics(self, columnName, valueColumns, excludeZeros=False, statistics=None):
+        """Calculates the statistics of the value columns for each value in columnName, for each partition in
+        parallel, and merges the results
+        Returns the GroupedStatistics of all partitions together"""
+
+        numberOfFiles = len(self.filenames)
+        arguments = [self.filenames, [columnName] * numberOfFiles, [valueColumns] * numberOfFiles,
+                     [excludeZeros] * numberOfFiles, [statistics] * numberOfFiles, [self.separator] * numberOfFiles,
+                     [self.dtypes] * numberOfFiles, [self.chunkSize] * numberOfFiles]
+
+        if self.processes == 1 or numberOfFiles == 1:
+            partitionStatistics = map(self.aggregatePartition, *arguments)
+            return self.__mergePartitions(partitionStatistics)
+
+        with ProcessPoolExecutor(max_workers=self.processes) as executor:
+            return self.__mergePartitions(executor.map(self.aggregatePartition, *arguments))
+
+    @staticmethod
+    def aggregatePartitionQuantiles(filename, columnName, valueColumns, exact, relativeAccuracy, excludeZeros,
+                                    separator, dtypes, chunkSize):
+        """Calculates the distributions of one partition file. Runs in a worker process
+        Returns the GroupedQuantiles of the partition"""
+        return GroupedQuantiles.fromCsv(filename, columnName, valueColumns, exact, relativeAccuracy, excludeZeros,
+                                        separator, dtypes, chunkSize)
+
+    def calculateGroupedQuantiles(self, columnName, valueColumns, exact=False,
+                                  relativeAccuracy=GroupedQuantiles.DEFAULT_ACCURACY, excludeZeros=False):
+        """Calculates the distributions of the value columns for each value in columnName, for each partition in
+        parallel, and merges them
+        Returns the GroupedQuantiles of all partitions together"""
+
+        numberOfFiles = len(self.filenames)
+        arguments = [self.filenames, [columnName] * numberOfFiles, [valueColumns] * numberOfFiles,
+                     [exact] * numberOfFiles, [relativeAccuracy] * numberOfFiles, [excludeZeros] * numberOfFiles,
+                     [self.separator] * numberOfFiles, [self.dtypes] * numberOfFiles, [self.chunkSize] * numberOfFiles]
+
+        if self.processes == 1 or numberOfFiles == 1:
+            return self.__mergePartitions(map(self.aggregatePartitionQuantiles, *arguments))
+
+        with ProcessPoolExecutor(max_workers=self.processes) as executor:
+            return self.__mergePartitions(executor.map(self.aggregatePartitionQuantiles, *arguments))
+
+    @staticmethod
+    def countPartitionDistinctValues(filename, columnNames, distinctColumn, approximate, precision, separator, dtypes,
+                                     chunkSize):
+        """Calculates the distinct values per group of one partition file. Runs in a worker process
+        Returns the GroupedDistinctCounts of the partition"""
+        return GroupedDistinctCounts.fromCsv(filename, columnNames, distinctColumn, approximate, precision, separator,
+                                             dtypes, chunkSize)
+
+    def calculateGroupedDistinctCounts(self, columnNames, distinctColumn, approximate=False,
+                                       precision=GroupedDistinctCounts.DEFAULT_PRECISION):
+        """Calculates the distinct values of distinctColumn for each group of the columns, for each partition in
+        parallel, and merges them. A value that occurs in more than one partition is counted once
+        Returns the GroupedDistinctCounts of all partitions together"""
+
+        numberOfFiles = len(self.filenames)
+        arguments = [self.filenames, [columnNames] * numberOfFiles, [distinctColumn] * numberOfFiles,
+                     [approximate] * numberOfFiles, [precision] * numberOfFiles, [self.separator] * numberOfFiles,
+                     [self.dtypes] * numberOfFiles, [self.chunkSize] * numberOfFiles]
+
+        if self.processes == 1 or numberOfFiles == 1:
+            return self.__mergePartitions(map(self.countPartitionDistinctValues, *arguments))
+
+        with ProcessPoolExecutor(max_workers=self.processes) as executor:
+            return self.__mergePartitions(executor.map(self.countPartitionDistinctValues, *arguments))
+
+    @staticmethod
+    def findPartitionBroadcasts(filename, programmeColumn, dateColumn, separator, dtypes, chunkSize):
+        """Finds the distinct (programme, date) pairs in one partition file. Runs in a worker process
+        Returns a data frame with the pairs"""
+        columns = [programmeColumn, dateColumn]
+        if dtypes:
+            dtypes = {column: dtype for column, dtype in dtypes.items() if column in columns}
+        broadcasts = [chunk.dropna().drop_duplicates().astype(object)
+                      for chunk in pd.read_csv(filename, sep=separator, usecols=columns, dtype=dtypes,
+                                               chunksize=chunkSize)]
+        return pd.concat(broadcasts).drop_duplicates() if broadcasts else pd.DataFrame(columns=columns)
+
+    def countProgrammeBroadcasts(self, programmeColumn, dateColumn):
+        """Counts the number of broadcasts per programme, over all partitions. A programme broadcast on the same
+        date is counted once, even if it occurs in more than one partition"""
+
+        numberOfFiles = len(self.filenames)
+        arguments = [self.filenames, [programmeColumn] * numberOfFiles, [dateColumn] * numberOfFiles,
+                     [self.separator] * numberOfFiles, [self.dtypes] * numberOfFiles, [self.chunkSize] * numberOfFiles]
+
+        if self.processes == 1 or numberOfFiles == 1:
+            broadcasts = list(map(self.findPartitionBroadcasts, *arguments))
+        else:
+            with ProcessPoolExecutor(max_workers=self.processes) as executor:
+                broadcasts = list(executor.map(self.findPartitionBroadcasts, *arguments))
+
+        return PersonAnalyser(pd.concat(broadcasts)).countProgrammeBroadcasts(programmeColumn, dateColumn)
+
+    def __mergePartitions(self, partitionResults):
+        merged = None
+        for result in partitionResults:
+            merged = result if merged is None else merged.merge(result)
+        return merged
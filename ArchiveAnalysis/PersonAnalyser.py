@@ -1,4 +1,10 @@
 from ArchiveAnalysis.DataframeAnalyser import DataframeAnalyser
+from ArchiveAnalysis.AppearanceCube import AppearanceCube
+from ArchiveAnalysis.SegmentOverlap import SegmentOverlap
+from ArchiveAnalysis.CoAppearanceMatrix import CoAppearanceMatrix
+from ArchiveAnalysis.GroupedDistinctCounts import GroupedDistinctCounts
+from ArchiveAnalysis.WeekParser import WeekParser
+import numpy as np
 import pandas as pd
 
 """This class accepts a pandas dataframe with data about the appearances of persons in a set of programmes. It
@@ -20,80 +26,208 @@ Optional additional columns could be e.g.:
 
 class PersonAnalyser(DataframeAnalyser):
 
-    def countAppearancesPerColumnValue(self, columnName, dateColumnName, sortColumn=None):
+    PERIOD_DAY = "day"
+    PERIOD_WEEK = "week"
+    PERIOD_MONTH = "month"
+
+    TIME_COLUMNS = ["Time face recognised (s)", "Time voice recognised (s)", "Total time recognised (s)"]
+    CUBE_DIMENSIONS = ["Gender", "Party", "Party ideology", "Programme", "Type"]
+    SEGMENT_STREAM_COLUMNS = ["Programme", "Date"]
+
+    # the columns of the appearances csv files, text columns with few distinct values are read as categories
+    CSV_DTYPES = {"Name": "category",
+                  "Gender": "category",
+                  "Party": "category",
+                  "Party ideology": "category",
+                  "Party role": "category",
+                  "Programme": "category",
+                  "Date": "category",
+                  "Week": "category",
+                  "Time face recognised (s)": "float64",
+                  "Time voice recognised (s)": "float64",
+                  "Total time recognised (s)": "float64",
+                  "Type": "category"}
+
+    def countAppearancesPerColumnValue(self, columnName, dateColumnName, sortColumn=None, topN=None, otherLabel=None):
         """Counts the appearances per value in the given column. E.g. to count the appearances per person, use the
         column containing the person's name.
+        topN optionally keeps only the topN values with the most appearances (this needs a sortColumn), and if
+        otherLabel is given the appearances of the remaining values are added up under that label
         Returns a list of the column values, and a list of the corresponding counts, sorted in descending order"""
 
-        appearances_dates = self.dataframe[[columnName, dateColumnName]]
-        appearance_counts = pd.pivot_table(appearances_dates, values=[dateColumnName], index=columnName,
-                                           aggfunc=[self.PANDAS_COUNT])
-        appearance_counts.columns = appearance_counts.columns.droplevel(0)
+        columnValues, appearance_counts = self.calculateMultipleStatisticsPerColumnValue(
+            columnName, [dateColumnName], [self.PANDAS_COUNT], sortColumn=sortColumn, topN=topN, otherLabel=otherLabel)
 
-        if sortColumn:
-            appearance_counts = appearance_counts.reindex(appearance_counts[sortColumn].sort_values(ascending=False).index)
+        return columnValues, appearance_counts[self.PANDAS_COUNT][0]
 
-        return list(appearance_counts.index.values), list(appearance_counts[dateColumnName])
+    def countDistinctPersonsPerColumnValue(self, columnNames, personColumn="Name", approximate=False,
+                                           precision=GroupedDistinctCounts.DEFAULT_PRECISION, sort=False):
+        """Counts how many different persons appeared per value in the given column, or per combination of values for
+        a list of columns, e.g. ["Programme", "Week"] for the number of persons per programme per week.
+        If approximate is true, the counts are HyperLogLog estimates, see countDistinctValuesPerColumnValue
+        Returns a list of the column values, and a list of the corresponding counts"""
+        return self.countDistinctValuesPerColumnValue(columnNames, personColumn, approximate, precision, sort)
 
 
-    def calculateTimeBreakdownPerColumnValue(self, columnName, timeColumns, sortColumn=None):
+    def calculateTimeBreakdownPerColumnValue(self, columnName, timeColumns, sortColumn=None, topN=None, otherLabel=None):
         """Calculates the totals of each time column per value in columnName. E.g. to get the total speaking time
         and total onscreen time per person, columnsToTotal would be the columns with those times, and columnName would
         be the column containing the person's name.
         sortColumn is an optional column on which the breakdowns are sorted. E.g. this could be the total time
+        topN optionally keeps only the first topN values after sorting, and if otherLabel is given the remaining
+        values are combined into one extra value with that label
         Returns a list of the column values, and a list of lists of the corresponding totals
         """
 
-        values = []
-        values.extend(timeColumns)
-        if sortColumn and sortColumn not in timeColumns:
-            values.append(sortColumn)
+        columnValues, appearances_times_totals = self.calculateMultipleStatisticsPerColumnValue(
+            columnName, timeColumns, [self.PANDAS_SUM], sortColumn=sortColumn, topN=topN, otherLabel=otherLabel)
 
-        appearances_times = self.dataframe[values + [columnName]]
-
-        appearances_times_totals = pd.pivot_table(appearances_times,
-                                                  values=values, index=columnName,
-                                                  aggfunc=[self.PANDAS_SUM])
-
-        appearances_times_totals.columns = appearances_times_totals.columns.droplevel(0)
-
-        if sortColumn:
-            appearances_times_totals = appearances_times_totals.reindex(
-            appearances_times_totals[sortColumn].sort_values(ascending=False).index)
-
-        output_totals = []
-
-        for column in timeColumns:
-            output_totals.append(list(appearances_times_totals[column]))
-
-        return list(appearances_times_totals.index.values), output_totals
+        return columnValues, appearances_times_totals[self.PANDAS_SUM]
 
 
     def countProgrammeBroadcasts(self, programmeColumn, dateColumn):
-        """Counts the number of broadcasts per programme"""
+        """Counts the number of broadcasts per programme, where a broadcast is a distinct combination of programme
+        and date
+        Returns a list of the programmes, and a list of the corresponding numbers of broadcasts"""
 
-        programme_counts = pd.pivot_table(self.dataframe, index=[programmeColumn, dateColumn],
-                                           aggfunc=[self.PANDAS_COUNT])
+        def calculateResult():
+            programmeCodes, programmes = self.groupKeyIndex.getCodes(programmeColumn)
+            dateCodes, dates = self.groupKeyIndex.getCodes(dateColumn)
 
-        programme_counts = pd.pivot_table(programme_counts, index=[programmeColumn],
-                                           aggfunc=[self.PANDAS_COUNT])
-        programme_counts.columns = programme_counts.columns.droplevel(0)
-        programme_counts = programme_counts.reset_index()
+            # combine the two codes into one code per (programme, date) pair, and keep each pair once
+            hasBroadcast = (programmeCodes >= 0) & (dateCodes >= 0)
+            broadcastCodes = np.unique(programmeCodes[hasBroadcast].astype(np.int64) * len(dates)
+                                       + dateCodes[hasBroadcast])
+            broadcastCounts = np.bincount(broadcastCodes // max(len(dates), 1), minlength=len(programmes))
 
-        return list(programme_counts[programmeColumn]), list(programme_counts[self.PANDAS_COUNT]["Name"])
+            present = broadcastCounts > 0
+            return list(programmes[present]), broadcastCounts[present].tolist()
 
+        return self._getCachedResult(("countProgrammeBroadcasts", programmeColumn, dateColumn), calculateResult)
 
-    def calculateAverageTimePerColumnValue(self, columnName, timeColumns, excludeZeros=False, sortColumn=None):
+
+    def calculateAverageTimePerColumnValue(self, columnName, timeColumns, excludeZeros=False, sortColumn=None, topN=None,
+                                           otherLabel=None):
         """Calculates the averages of the times in the time columns, for each value in the column columnName.
         E.g. if columnName contains the names of the persons, then the average of each time will be calculated
         per person"""
 
-        return self.calculateAveragesPerColumnValue(columnName, timeColumns, excludeZeros, sortColumn)
+        return self.calculateAveragesPerColumnValue(columnName, timeColumns, excludeZeros, sortColumn, topN, otherLabel)
 
 
-    def calculateTotalTimePerColumnValue(self, columnName, timeColumns, excludeZeros=False, sortColumn=None):
+    def calculateTotalTimePerColumnValue(self, columnName, timeColumns, excludeZeros=False, sortColumn=None, topN=None,
+                                         otherLabel=None):
         """Calculates the totals of the times in the time columns, for each value in the column columnName.
         E.g. if columnName contains the names of the persons, then the average of each time will be calculated
         per person"""
 
-        return self.calculateTotalsPerColumnValue(columnName, timeColumns, excludeZeros, sortColumn)
+        return self.calculateTotalsPerColumnValue(columnName, timeColumns, excludeZeros, sortColumn, topN, otherLabel)
+
+    def calculateTimeSeriesPerColumnValue(self, columnName, dateColumnName, timeColumns, period=PERIOD_WEEK):
+        """Counts the appearances and totals the times in the time columns per value in columnName, for each day,
+        week or month (set by period), in one pass over the data frame. E.g. to follow the speaking time of each
+        party over an election campaign, columnName would be the column with the party.
+        Weeks start on Monday. The periods run from the first to the last date without gaps, so periods without
+        appearances have a count and total of zero, and the series of all values are aligned, ready for plotting
+        Returns a list of the column values, an array with the start date of each period, an array with the counts
+        (a row per column value and a column per period), and a dictionary with a similar array of totals for each
+        time column"""
+
+        if period not in (self.PERIOD_DAY, self.PERIOD_WEEK, self.PERIOD_MONTH):
+            raise ValueError("Invalid period %s, must be \"%s\", \"%s\" or \"%s\""
+                             % (period, self.PERIOD_DAY, self.PERIOD_WEEK, self.PERIOD_MONTH))
+
+        groupCodes, groupValues = self.groupKeyIndex.getCodes(columnName)
+        dateCodes, dates = self.groupKeyIndex.getCodes(dateColumnName)
+
+        # only the distinct dates are parsed and assigned to a period
+        days = pd.to_datetime(dates).values.astype("datetime64[D]")
+        if len(days) == 0:
+            return [], np.zeros(0, dtype="datetime64[D]"), np.zeros((0, 0), dtype=np.int64), \
+                   {column: np.zeros((0, 0)) for column in timeColumns}
+        if period == self.PERIOD_DAY:
+            periodStarts = days
+        elif period == self.PERIOD_WEEK:  # 1 January 1970 was a Thursday, so day 0 is 3 days after a Monday
+            dayNumbers = days.astype(np.int64)
+            periodStarts = days - ((dayNumbers + 3) % 7).astype("timedelta64[D]")
+        else:
+            periodStarts = days.astype("datetime64[M]")
+
+        firstPeriod = periodStarts.min()
+        step = 7 if period == self.PERIOD_WEEK else 1
+        periodOfDate = ((periodStarts - firstPeriod).astype(np.int64) // step).astype(np.intp)
+        numberOfPeriods = int(periodOfDate.max()) + 1
+        periods = np.arange(numberOfPeriods) * step + firstPeriod
+        if period == self.PERIOD_MONTH:
+            periods = periods.astype("datetime64[D]")
+
+        rowPeriods = np.where(dateCodes >= 0, periodOfDate[dateCodes], -1)
+        hasCell = (groupCodes >= 0) & (rowPeriods >= 0)
+        cells = np.where(hasCell, groupCodes.astype(np.int64) * numberOfPeriods + rowPeriods, 0)
+        numberOfCells = len(groupValues) * numberOfPeriods
+
+        counts = np.bincount(cells, weights=hasCell, minlength=numberOfCells).astype(np.int64)
+        counts = counts.reshape(len(groupValues), numberOfPeriods)
+        totals = {}
+        for column in timeColumns:
+            times = self.dataframe[column].to_numpy()
+            weights = np.where(hasCell & ~np.isnan(times), times, 0)
+            totals[column] = np.bincount(cells, weights=weights, minlength=numberOfCells).reshape(
+                len(groupValues), numberOfPeriods)
+
+        present = counts.sum(axis=1) > 0
+        return list(groupValues[present]), periods, counts[present], \
+            {column: total[present] for column, total in totals.items()}
+
+
+    def addWeekColumns(self, weekColumn="Week", dateColumn="Date", year=None):
+        """Adds the start date, end date and period key of the week descriptions in weekColumn (e.g. "woensdag 03
+        februari t/m dinsdag 9 februari") as the columns "Week start", "Week end" and "Week period". The period key
+        sorts chronologically, so grouping by it gives the weeks in order. See WeekParser
+        Returns no values"""
+        self.dataframe = WeekParser.addColumns(self.dataframe, weekColumn, dateColumn, year)
+
+    def buildCube(self, dimensions=None, valueColumns=None, rollups=None):
+        """Builds an OLAP cube with the statistics of the value columns (by default the time columns) for every
+        combination of values of the dimension columns (by default gender, party, party ideology, programme and
+        type), and the rollups to fewer dimensions. Breakdowns and slices can then be calculated with the query
+        method of the cube, without going through the data frame again. See AppearanceCube
+        Returns the AppearanceCube"""
+        if dimensions is None:
+            dimensions = self.CUBE_DIMENSIONS
+        if valueColumns is None:
+            valueColumns = self.TIME_COLUMNS
+
+        return AppearanceCube.fromDataframe(self.dataframe, dimensions, valueColumns, rollups, self.groupKeyIndex)
+
+    def buildCoAppearanceMatrix(self, personColumn="Name", programmeColumn="Programme", dateColumn="Date",
+                                timeColumn=None):
+        """Calculates for every pair of persons in how many broadcasts (programmes on the same date) they both
+        appeared, and if a time column is given (e.g. "Total time recognised (s)"), how much time each was
+        recognised in these broadcasts. Top partners per person can then be found with the getTopPartners method of
+        the matrix. See CoAppearanceMatrix
+        Returns the CoAppearanceMatrix"""
+        return CoAppearanceMatrix.fromDataframe(self.dataframe, personColumn, programmeColumn, dateColumn, timeColumn,
+                                                self.groupKeyIndex)
+
+    def calculateSegmentTimesPerPerson(self, segments, personColumn="Name", streamColumns=None, startColumn="Start",
+                                       endColumn="End", modalityColumn="Modality", faceModality=SegmentOverlap.FACE,
+                                       voiceModality=SegmentOverlap.VOICE, sortMeasure=None):
+        """Calculates per person how long they were seen, heard, seen or heard, seen and heard at the same time, only
+        seen and only heard, from a data frame of raw detection segments with a row per segment (person, programme,
+        date, start, end and modality). Overlapping segments are only counted once. streamColumns identify the
+        recording the start and end times refer to (by default programme and date). A ValueError is raised for
+        segments with a missing start or end time, or that end before they start.
+        if sortMeasure is given (e.g. SegmentOverlap.BOTH), then the persons are sorted by that measure, descending
+        Returns a list of the persons, and a dictionary with a list of times (in seconds) per measure"""
+        if streamColumns is None:
+            streamColumns = self.SEGMENT_STREAM_COLUMNS
+
+        persons, times = SegmentOverlap.calculateTimesPerPerson(segments, personColumn, streamColumns, startColumn,
+                                                                endColumn, modalityColumn, faceModality,
+                                                                voiceModality)
+        order = np.arange(len(persons))
+        if sortMeasure:
+            order = np.argsort(-times[sortMeasure], kind="stable")
+
+        return [persons[i] for i in order], {measure: values[order].tolist() for measure, values in times.items()}
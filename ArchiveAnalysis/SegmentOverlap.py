@@ -0,0 +1,135 @@
+import numpy as np
+import pandas as pd
+from ArchiveAnalysis.GroupedStatistics import GroupedStatistics
+
+"""This class calculates how long persons were seen and heard from the raw face and voice detection segments, rather
+than from pre-summed times. Segments of the same modality can overlap, so the time a person was seen is the length of
+the union of their face segments. The time a person was seen and heard at the same time is the length of the
+intersection of the face and voice unions, which follows from the union of all their segments:
+both = face + voice - (face or voice).
+
+Segments are only compared with other segments of the same person in the same stream (e.g. the same programme on the
+same date). All calculations are done with a single sort of the segments and cumulative operations over NumPy arrays.
+"""
+
+class SegmentOverlap():
+
+    FACE = "face"
+    VOICE = "voice"
+    UNION = "face or voice"
+    BOTH = "face and voice"
+    FACE_ONLY = "face only"
+    VOICE_ONLY = "voice only"
+
+    @staticmethod
+    def toSeconds(values):
+        """Converts segment times to seconds. Times can be numbers of seconds, time deltas or date times. Date times
+        with a time zone are converted to UTC first, so segments in different time zones can be compared. Missing
+        times (NaN or NaT) become NaN
+        Returns an array of floats"""
+        if isinstance(getattr(values, "dtype", None), pd.DatetimeTZDtype):
+            values = values.tz_convert(None) if isinstance(values, pd.DatetimeIndex) else values.dt.tz_convert(None)
+        values = np.asarray(values)
+        if values.dtype.kind == "O" and len(values) and isinstance(values[0], pd.Timestamp):
+            values = pd.to_datetime(values, utc=True).tz_convert(None).to_numpy()  # e.g. from tz-aware .to_numpy()
+        if values.dtype.kind == "M":
+            values = values.astype("datetime64[ns]")
+            return np.where(np.isnat(values), np.nan, values.astype(np.int64) / 1e9)
+        if values.dtype.kind == "m":
+            values = values.astype("timedelta64[ns]")
+            return np.where(np.isnat(values), np.nan, values.astype(np.int64) / 1e9)
+        return values.astype(np.float64)
+
+    @staticmethod
+    def calculateUnionLengths(streams, starts, ends, numberOfStreams):
+        """Calculates the total length of the union of the segments in each stream. streams gives the stream
+        (0 to numberOfStreams - 1) of each segment
+        Returns an array with the covered length per stream"""
+
+        if len(streams) == 0:
+            return np.zeros(numberOfStreams)
+
+        order = np.lexsort((starts, streams))
+        streams = streams[order]
+        starts = starts[order]
+        ends = ends[order]
+
+        # shift every stream to its own range of times, so one running maximum over all the segments never carries
+        # the end of a segment over into the next stream
+        streamStarts = np.flatnonzero(np.concatenate(([True], streams[1:] != streams[:-1])))
+        streamLengths = np.diff(np.concatenate((streamStarts, [len(streams)])))
+        streamBegin = np.repeat(starts[streamStarts], streamLengths)
+        starts = starts - streamBegin
+        ends = ends - streamBegin
+        span = ends.max() + 1
+        offsets = np.repeat(np.arange(len(streamStarts)) * span, streamLengths)
+        starts = starts + offsets
+        ends = ends + offsets
+
+        # each segment adds the part of it that lies after the furthest end of the segments before it
+        furthestEnds = np.maximum.accumulate(ends)
+        previousEnds = np.concatenate(([-np.inf], furthestEnds[:-1]))
+        addedLengths = np.maximum(ends - np.maximum(starts, previousEnds), 0)
+
+        return np.bincount(streams, weights=addedLengths, minlength=numberOfStreams)
+
+    @classmethod
+    def calculateTimesPerPerson(cls, segments, personColumn, streamColumns, startColumn, endColumn, modalityColumn,
+                                faceModality=FACE, voiceModality=VOICE):
+        """Calculates per person the time they were seen (face), heard (voice), seen or heard, seen and heard, only
+        seen and only heard, from a data frame with a row per detection segment. streamColumns are the columns
+        that identify a stream, e.g. the programme and date. Segments of other modalities are ignored
+        Returns a list of the persons, and a dictionary with an array of times (in seconds) for each of the
+        measures"""
+
+        starts = cls.toSeconds(segments[startColumn])
+        ends = cls.toSeconds(segments[endColumn])
+        isMissing = np.isnan(starts) | np.isnan(ends)
+        if isMissing.any():
+            raise ValueError("Segments must have a start and end time, %d segments have a missing time"
+                             % np.count_nonzero(isMissing))
+        if (ends < starts).any():
+            raise ValueError("Segments must not end before they start")
+
+        modalities = segments[modalityColumn].to_numpy()
+        isFace = modalities == faceModality
+        isVoice = modalities == voiceModality
+        isSegment = isFace | isVoice
+
+        # one code per (person, stream), and the person of each of these codes
+        personCodes, persons = GroupedStatistics.factorizeValues(segments[personColumn])
+        combined = personCodes.astype(np.int64)
+        isSegment &= personCodes >= 0
+        for column in streamColumns:
+            codes, values = GroupedStatistics.factorizeValues(segments[column])
+            isSegment &= codes >= 0
+            combined = combined * (len(values) + 1) + codes
+        combined = combined[isSegment]
+        streamCodes, streams = np.unique(combined, return_inverse=True)
+        streams = streams.reshape(-1)
+        streamPersons = np.zeros(len(streamCodes), dtype=np.intp)
+        streamPersons[streams] = personCodes[isSegment]
+
+        starts = starts[isSegment]
+        ends = ends[isSegment]
+        isFace = isFace[isSegment]
+        isVoice = isVoice[isSegment]
+        numberOfStreams = len(streamCodes)
+
+        face = cls.calculateUnionLengths(streams[isFace], starts[isFace], ends[isFace], numberOfStreams)
+        voice = cls.calculateUnionLengths(streams[isVoice], starts[isVoice], ends[isVoice], numberOfStreams)
+        union = cls.calculateUnionLengths(streams, starts, ends, numberOfStreams)
+
+        times = {cls.FACE: face,
+                 cls.VOICE: voice,
+                 cls.UNION: union,
+                 cls.BOTH: face + voice - union,
+                 cls.FACE_ONLY: union - voice,
+                 cls.VOICE_ONLY: union - face}
+
+        present = np.bincount(streamPersons, minlength=len(persons)) > 0
+        output = {}
+        for measure, streamTimes in times.items():
+            output[measure] = np.bincount(streamPersons, weights=streamTimes, minlength=len(persons))[present]
+
+        return list(persons[present]), output
@@ -0,0 +1,108 @@
+import pandas as pd
+import numpy as np
+from ArchiveAnalysis.GroupedStatistics import GroupedStatistics
+
+"""This class keeps grouped statistics up to date while batches of rows are added, e.g. for the
+IncrementalPersonAnalyser. The sums, counts, minimums and maximums are kept in arrays with a row per group, which grow
+as new groups appear, and a dictionary gives the row of each group value. Adding the statistics of a batch only
+updates the rows of the groups in that batch, so it takes time in proportion to the batch, not to all the groups
+seen before.
+"""
+
+class StatisticsAccumulator():
+
+    INITIAL_CAPACITY = 64
+
+    def __init__(self, valueColumns):
+        """Initialises the accumulator for the value columns, without any groups"""
+        self.valueColumns = list(valueColumns)
+        self.groupValues = []
+        self.groupPositions = {}
+        self.columnKinds = None
+
+        numberOfColumns = len(self.valueColumns)
+        self.rowCounts = np.zeros(self.INITIAL_CAPACITY, dtype=np.int64)
+        self.sums = np.zeros((self.INITIAL_CAPACITY, numberOfColumns))
+        self.counts = np.zeros((self.INITIAL_CAPACITY, numberOfColumns), dtype=np.int64)
+        self.nonzeroCounts = np.zeros((self.INITIAL_CAPACITY, numberOfColumns), dtype=np.int64)
+        self.minimums = np.full((self.INITIAL_CAPACITY, numberOfColumns), np.nan)
+        self.maximums = np.full((self.INITIAL_CAPACITY, numberOfColumns), np.nan)
+
+    def __len__(self):
+        return len(self.groupValues)
+
+    def add(self, groupedStatistics):
+        """Adds the statistics of a batch of rows. They must be for the same value columns, calculated with zeros and
+        with the minimums and maximums
+        Returns no values"""
+
+        if groupedStatistics.valueColumns != self.valueColumns:
+            raise ValueError("Can't add statistics for different value columns")
+        if groupedStatistics.excludeZeros or groupedStatistics.minimums is None:
+            raise ValueError("Only statistics with zeros, minimums and maximums can be added")
+
+        positions = np.fromiter((self.__getPosition(value) for value in groupedStatistics.groupValues),
+                                dtype=np.intp, count=len(groupedStatistics.groupValues))
+        self.__reserve(len(self.groupValues))
+
+        # the group values of a batch are unique, so each row is updated once
+        self.rowCounts[positions] += groupedStatistics.rowCounts
+        self.sums[positions] += groupedStatistics.sums
+        self.counts[positions] += groupedStatistics.counts
+        self.nonzeroCounts[positions] += groupedStatistics.nonzeroCounts
+        self.minimums[positions] = np.fmin(self.minimums[positions], groupedStatistics.minimums)
+        self.maximums[positions] = np.fmax(self.maximums[positions], groupedStatistics.maximums)
+
+        if self.columnKinds is None:
+            self.columnKinds = list(groupedStatistics.columnKinds)
+        else:
+            self.columnKinds = [kind if kind == otherKind else "f"
+                                for kind, otherKind in zip(self.columnKinds, groupedStatistics.columnKinds)]
+
+    def __getPosition(self, value):
+        position = self.groupPositions.get(value)
+        if position is None:
+            position = self.groupPositions[value] = len(self.groupValues)
+            self.groupValues.append(value)
+        return position
+
+    def __reserve(self, numberOfGroups):
+        capacity = len(self.rowCounts)
+        if numberOfGroups <= capacity:
+            return
+        while capacity < numberOfGroups:
+            capacity *= 2
+
+        def grow(values, fillValue):
+            grown = np.full((capacity,) + values.shape[1:], fillValue, dtype=values.dtype)
+            grown[:len(values)] = values
+            return grown
+
+        self.rowCounts = grow(self.rowCounts, 0)
+        self.sums = grow(self.sums, 0)
+        self.counts = grow(self.counts, 0)
+        self.nonzeroCounts = grow(self.nonzeroCounts, 0)
+        self.minimums = grow(self.minimums, np.nan)
+        self.maximums = grow(self.maximums, np.nan)
+
+    def toGroupedStatistics(self):
+        """Converts the accumulated statistics into grouped statistics, with the groups in sorted order like those
+        of GroupedStatistics.merge. This takes time in proportion to the number of groups
+        Returns the GroupedStatistics"""
+
+        numberOfGroups = len(self.groupValues)
+        groupValues = pd.Index(self.groupValues, tupleize_cols=False)
+        try:
+            order = np.asarray(groupValues.argsort())
+        except TypeError:
+            order = np.arange(numberOfGroups)
+
+        columnKinds = self.columnKinds if self.columnKinds is not None else ["f"] * len(self.valueColumns)
+        return GroupedStatistics(np.asarray(groupValues)[order], self.valueColumns,
+                                 self.rowCounts[:numberOfGroups][order],
+                                 self.sums[:numberOfGroups][order],
+                                 self.counts[:numberOfGroups][order],
+                                 self.nonzeroCounts[:numberOfGroups][order],
+                                 self.minimums[:numberOfGroups][order],
+                                 self.maximums[:numberOfGroups][order],
+                                 columnKinds)
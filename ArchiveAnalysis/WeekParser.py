@@ -0,0 +1,138 @@
+import functools
+import re
+import numpy as np
+import pandas as pd
+from ArchiveAnalysis.GroupedStatistics import GroupedStatistics
+
+"""This class converts the descriptions of broadcast weeks in the Week column, e.g.
+"woensdag 03 februari t/m dinsdag 9 februari", "woensdag 03 t/m dinsdag 9 maart" or
+"woensdag 24 februari t/m dinsdag 02 maart", into the start and end date of the week, and a period key that sorts
+chronologically and is the same for every description of the same week, so weeks can be grouped by and joined on.
+
+The descriptions don't contain the year. It is taken from a year in the description if there is one, otherwise from
+the date of the row (e.g. the Date column), otherwise from a given year. A week from December to January gets the year
+before for its start.
+
+Each distinct description is parsed only once, and the results are copied to the rows through the factorised codes of
+the week and date columns, so a column of millions of rows costs about as much as its few hundred distinct weeks.
+"""
+
+class WeekParser():
+
+    START_COLUMN = "Week start"
+    END_COLUMN = "Week end"
+    PERIOD_COLUMN = "Week period"
+
+    MONTHS = {"januari": 1, "februari": 2, "maart": 3, "april": 4, "mei": 5, "juni": 6, "juli": 7, "augustus": 8,
+              "september": 9, "oktober": 10, "november": 11, "december": 12}
+
+    # [day name] day [month] [year] t/m [day name] day month [year]
+    WEEK_PATTERN = re.compile(r"^\s*(?:[a-z]+\s+)?(\d{1,2})(?:\s+([a-z]+))?(?:\s+(\d{4}))?\s+(?:t/m|tot en met|-)\s+"
+                              r"(?:[a-z]+\s+)?(\d{1,2})\s+([a-z]+)(?:\s+(\d{4}))?\s*$")
+
+    @classmethod
+    @functools.lru_cache(maxsize=4096)
+    def parseWeekString(cls, weekString):
+        """Parses the days, months and years of the start and end of a week description. Kept in a cache, so a
+        description is only parsed once even over several columns or chunks
+        Returns a tuple of the start day, start month, start year, end day, end month and end year, where the years
+        are None if the description has none"""
+        match = cls.WEEK_PATTERN.match(weekString.lower())
+        if match is None:
+            raise ValueError("Can't parse the week %r" % weekString)
+        startDay, startMonth, startYear, endDay, endMonth, endYear = match.groups()
+
+        if endMonth not in cls.MONTHS or (startMonth is not None and startMonth not in cls.MONTHS):
+            raise ValueError("Can't parse the month of the week %r" % weekString)
+        endMonth = cls.MONTHS[endMonth]
+        startMonth = cls.MONTHS[startMonth] if startMonth is not None else endMonth
+
+        return (int(startDay), startMonth, int(startYear) if startYear else None,
+                int(endDay), endMonth, int(endYear) if endYear else None)
+
+    @classmethod
+    def getWeekDates(cls, weekString, referenceDate=None, year=None):
+        """Gets the start and end date of a week description. Without a year in the description, the year is the
+        one that puts the week closest to referenceDate (a date in the week), or else the given year of the start
+        of the week
+        Returns the start date and the end date as timestamps"""
+        startDay, startMonth, startYear, endDay, endMonth, endYear = cls.parseWeekString(weekString)
+        yearOffset = 1 if startMonth > endMonth else 0  # the week runs from December into January
+
+        def getDates(endYear, startYear=None):
+            try:
+                return pd.Timestamp(startYear or endYear - yearOffset, startMonth, startDay), \
+                    pd.Timestamp(endYear, endMonth, endDay)
+            except ValueError:
+                raise ValueError("The week %r has a date that doesn't exist" % weekString)
+
+        if endYear is not None or startYear is not None:
+            return getDates(endYear or startYear + yearOffset, startYear)
+        if referenceDate is not None and not pd.isna(referenceDate):
+            referenceDate = pd.Timestamp(referenceDate)
+
+            def getDistance(dates):
+                return max(dates[0] - referenceDate, referenceDate - dates[1], pd.Timedelta(0))
+
+            return min((getDates(candidate) for candidate in range(referenceDate.year - 1, referenceDate.year + 2)),
+                       key=getDistance)
+        if year is not None:
+            return getDates(year + yearOffset)
+        raise ValueError("The year of the week %r is unknown, give a date column or a year" % weekString)
+
+    @classmethod
+    def parseColumn(cls, weeks, dates=None, year=None):
+        """Converts a column of week descriptions into start dates, end dates and period keys. dates is an optional
+        column of dates of the same rows, from which the year of each row's week is taken, so a description that
+        occurs in several years gets the right year in each. year is used for rows without a date. Missing
+        descriptions give missing dates and keys
+        Returns a data frame with the start, end and period columns, with the same index as weeks"""
+        weekCodes, weekStrings = GroupedStatistics.factorizeValues(weeks)
+        dateCodes, dateValues = cls.__factorizeDates(dates, len(weekCodes))
+
+        # each distinct (week, date) pair is converted once, dates that can't be read count as missing
+        present = weekCodes >= 0
+        pairCodes = weekCodes.astype(np.int64) * (len(dateValues) + 1) + dateCodes + 1
+        uniquePairs, inverse = np.unique(pairCodes[present], return_inverse=True)
+
+        starts = np.empty(len(uniquePairs), dtype="datetime64[ns]")
+        ends = np.empty(len(uniquePairs), dtype="datetime64[ns]")
+        for position, pair in enumerate(uniquePairs):
+            weekCode, dateCode = divmod(int(pair), len(dateValues) + 1)
+            referenceDate = dateValues[dateCode - 1] if dateCode > 0 else None
+            start, end = cls.getWeekDates(str(weekStrings[weekCode]), referenceDate, year)
+            starts[position], ends[position] = start.to_datetime64(), end.to_datetime64()
+
+        # the same week can be described in more than one way (e.g. "03" and "3"), these get the same period key
+        periods = pd.Series(starts).dt.strftime("%Y-%m-%d") + "/" + pd.Series(ends).dt.strftime("%Y-%m-%d")
+        periodCodes, periodLabels = GroupedStatistics.factorizeValues(periods)
+        periodCategories = pd.CategoricalDtype(periodLabels, ordered=True)  # ISO dates sort chronologically
+
+        rowStarts = np.full(len(weekCodes), np.datetime64("NaT"), dtype="datetime64[ns]")
+        rowEnds = rowStarts.copy()
+        rowPeriodCodes = np.full(len(weekCodes), -1, dtype=np.intp)
+        inverse = inverse.reshape(-1)
+        rowStarts[present], rowEnds[present], rowPeriodCodes[present] = \
+            starts[inverse], ends[inverse], periodCodes[inverse]
+
+        return pd.DataFrame({cls.START_COLUMN: rowStarts, cls.END_COLUMN: rowEnds,
+                             cls.PERIOD_COLUMN: pd.Categorical.from_codes(rowPeriodCodes, dtype=periodCategories)},
+                            index=getattr(weeks, "index", None))
+
+    @classmethod
+    def addColumns(cls, dataframe, weekColumn="Week", dateColumn="Date", year=None):
+        """Adds the start, end and period columns of the weeks in weekColumn to a copy of the data frame. The years
+        are taken from dateColumn if the data frame has it, otherwise year is used
+        Returns the new data frame"""
+        dates = dataframe[dateColumn] if dateColumn and dateColumn in dataframe.columns else None
+        return dataframe.assign(**cls.parseColumn(dataframe[weekColumn], dates, year))
+
+    @staticmethod
+    def __factorizeDates(dates, numberOfRows):
+        if dates is None:
+            return np.full(numberOfRows, -1, dtype=np.intp), np.zeros(0, dtype="datetime64[ns]")
+        dateCodes, dateValues = GroupedStatistics.factorizeValues(dates)
+        dateValues = pd.to_datetime(pd.Series(dateValues, dtype=object), errors="coerce")
+        dateValues = dateValues.to_numpy(dtype="datetime64[ns]")
+        isUnreadable = np.isnat(dateValues)
+        return np.where((dateCodes >= 0) & ~isUnreadable[np.maximum(dateCodes, 0)], dateCodes, -1), dateValues
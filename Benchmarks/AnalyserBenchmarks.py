@@ -0,0 +1,185 @@
+import os
+import shutil
+import tempfile
+import pandas as pd
+from ArchiveAnalysis.PersonAnalyser import PersonAnalyser
+from ArchiveAnalysis.IncrementalPersonAnalyser import IncrementalPersonAnalyser
+from ArchiveAnalysis.PartitionedPersonAnalyser import PartitionedPersonAnalyser
+
+"""The benchmarks of the DataframeAnalyser and PersonAnalyser methods, and of the IncrementalPersonAnalyser and
+PartitionedPersonAnalyser. Every benchmark gets a new analyser for the data frame, so the factorised columns and cached
+results of one run are not reused by the next, except for the benchmarks named "(warm)", which measure exactly that
+reuse. The partitioned analyser reads csv files, so it is benchmarked with the csv benchmarks.
+"""
+
+TIME_COLUMNS = PersonAnalyser.TIME_COLUMNS
+TOTAL_TIME = "Total time recognised (s)"
+INCREMENTAL_BATCHES = 10
+PARTITIONS = 4
+
+
+def getAnalyserBenchmarks(dataframe, segments=None):
+    """Gets the analyser benchmarks for a data frame of appearances, and optionally a data frame of detection
+    segments
+    Returns a list of (name, function, setup) tuples, where setup creates the analyser that is passed to the
+    function"""
+
+    def newAnalyser():
+        return PersonAnalyser(dataframe)
+
+    def newIncrementalAnalyser():
+        return IncrementalPersonAnalyser(["Name", "Party"], TIME_COLUMNS,
+                                         distinctCounts=[(["Programme", "Week"], "Name")])
+
+    batchSize = -(-len(dataframe.index) // INCREMENTAL_BATCHES)
+    batches = [dataframe.iloc[start:start + batchSize] for start in range(0, len(dataframe.index), batchSize)]
+
+    def appendBatches(analyser):
+        for batch in batches:
+            analyser.appendRows(batch)
+        analyser.calculateTotalTimePerColumnValue("Name", TIME_COLUMNS, sortColumn=TOTAL_TIME)
+
+    def warmAnalyser():
+        analyser = PersonAnalyser(dataframe)
+        analyser.calculateTotalTimePerColumnValue("Name", TIME_COLUMNS)
+        return analyser
+
+    benchmarks = [
+        ("countRowsInDataframe", lambda analyser: analyser.countRowsInDataframe()),
+        ("getColumnTotal", lambda analyser: analyser.getColumnTotal(TOTAL_TIME)),
+        ("getColumnCount with value", lambda analyser: analyser.getColumnCount("Type", "video")),
+        ("summarizeColumns", lambda analyser: analyser.summarizeColumns(TIME_COLUMNS)),
+        ("pivotDataFrame Name sum", lambda analyser: analyser.pivotDataFrame(["Name"], TIME_COLUMNS, "sum")),
+        ("calculateMultipleStatisticsPerColumnValue Name",
+         lambda analyser: analyser.calculateMultipleStatisticsPerColumnValue(
+             "Name", TIME_COLUMNS, ["sum", "mean", "count", "min", "max"], sortColumn=TOTAL_TIME)),
+        ("calculateStatisticsPerColumnValue Party max",
+         lambda analyser: analyser.calculateStatisticsPerColumnValue("Party", TIME_COLUMNS, "max",
+                                                                     sortColumn=TOTAL_TIME)),
+        ("calculateStatisticsPerColumnValue Party first",
+         lambda analyser: analyser.calculateStatisticsPerColumnValue("Party", TIME_COLUMNS, "first")),
+        ("calculateTotalsPerColumnValue Name top 20",
+         lambda analyser: analyser.calculateTotalsPerColumnValue("Name", TIME_COLUMNS, sortColumn=TOTAL_TIME,
+                                                                 topN=20, otherLabel="other")),
+        ("calculateAveragesPerColumnValue Programme",
+         lambda analyser: analyser.calculateAveragesPerColumnValue("Programme", TIME_COLUMNS, excludeZeros=True,
+                                                                   sortColumn=TOTAL_TIME)),
+        ("countAppearancesPerColumnValue Name",
+         lambda analyser: analyser.countAppearancesPerColumnValue("Name", "Date", sortColumn="Date")),
+        ("calculateTimeBreakdownPerColumnValue Party",
+         lambda analyser: analyser.calculateTimeBreakdownPerColumnValue("Party", TIME_COLUMNS, sortColumn=TOTAL_TIME)),
+        ("countProgrammeBroadcasts", lambda analyser: analyser.countProgrammeBroadcasts("Programme", "Date")),
+        ("calculateAverageTimePerColumnValue Gender",
+         lambda analyser: analyser.calculateAverageTimePerColumnValue("Gender", TIME_COLUMNS, excludeZeros=True)),
+        ("calculateTotalTimePerColumnValue Name",
+         lambda analyser: analyser.calculateTotalTimePerColumnValue("Name", TIME_COLUMNS, sortColumn=TOTAL_TIME)),
+        ("calculateQuantilesPerColumnValue Party median and 90%",
+         lambda analyser: analyser.calculateQuantilesPerColumnValue("Party", TIME_COLUMNS, [0.5, 0.9],
+                                                                    sortColumn=TOTAL_TIME)),
+        ("calculateQuantilesPerColumnValue Party median and 90% (exact)",
+         lambda analyser: analyser.calculateQuantilesPerColumnValue("Party", TIME_COLUMNS, [0.5, 0.9], exact=True,
+                                                                    sortColumn=TOTAL_TIME)),
+        ("countDistinctPersonsPerColumnValue Programme, Week",
+         lambda analyser: analyser.countDistinctPersonsPerColumnValue(["Programme", "Week"])),
+        ("countDistinctPersonsPerColumnValue Programme, Week (approximate)",
+         lambda analyser: analyser.countDistinctPersonsPerColumnValue(["Programme", "Week"], approximate=True)),
+        ("addWeekColumns", lambda analyser: analyser.addWeekColumns()),
+        ("calculateTimeSeriesPerColumnValue Party week",
+         lambda analyser: analyser.calculateTimeSeriesPerColumnValue("Party", "Date", TIME_COLUMNS)),
+        ("buildCube", lambda analyser: analyser.buildCube()),
+        ("buildCoAppearanceMatrix", lambda analyser: analyser.buildCoAppearanceMatrix(timeColumn=TOTAL_TIME)),
+        ("query filter Party role and Type",
+         lambda analyser: analyser.query().filter("Party role", "government").filter("Type", "audio")
+         .groupBy("Name").aggregate(TIME_COLUMNS, "sum").sort(TOTAL_TIME).limit(20).execute()),
+    ]
+    benchmarks = [(name, function, newAnalyser) for name, function in benchmarks]
+
+    benchmarks.append(("distinct count sketches smaller than exact (Programme, Date)",
+                       checkDistinctCountMemory, newAnalyser))
+
+    benchmarks.append(("IncrementalPersonAnalyser appendRows %d batches" % INCREMENTAL_BATCHES, appendBatches,
+                       newIncrementalAnalyser))
+
+    benchmarks.append(("calculateTotalTimePerColumnValue Name (warm)",
+                       lambda analyser: analyser.calculateTotalTimePerColumnValue("Name", TIME_COLUMNS,
+                                                                                  sortColumn=TOTAL_TIME),
+                       warmAnalyser))
+
+    if segments is not None:
+        benchmarks.append(("calculateSegmentTimesPerPerson",
+                           lambda analyser: analyser.calculateSegmentTimesPerPerson(segments), newAnalyser))
+
+    return benchmarks
+
+
+def checkDistinctCountMemory(analyser):
+    """Counts the distinct persons per programme and date, a grouping with many small groups, exactly and with
+    HyperLogLog sketches, and checks that the sketches take no more memory than the exact hashes
+    Returns no values"""
+    exact = analyser.calculateGroupedDistinctCounts(["Programme", "Date"], "Name")
+    approximate = analyser.calculateGroupedDistinctCounts(["Programme", "Date"], "Name", approximate=True)
+    if approximate.getMemoryUsage() > exact.getMemoryUsage():
+        raise ValueError("The sketches take %d bytes, more than the %d bytes of the exact hashes"
+                         % (approximate.getMemoryUsage(), exact.getMemoryUsage()))
+
+
+def getCsvBenchmarks(generator, numberOfRows, folder=None):
+    """Gets the benchmarks of reading appearances from a csv file, which is generated with numberOfRows rows by the
+    SyntheticAppearances generator, and of the PartitionedPersonAnalyser on the same rows split over PARTITIONS
+    files. The files are written to folder, by default a temporary folder
+    Returns a list of (name, function, setup) tuples, and a function that removes the generated files"""
+
+    folder = folder or tempfile.mkdtemp(prefix="appearances-benchmark-")
+    filename = os.path.join(folder, "appearances-%d.csv" % numberOfRows)
+    generator.writeCsv(filename, numberOfRows)
+
+    # the partitions are copied from the file a chunk at a time, so they don't need to fit in memory either
+    partitionSize = max(-(-numberOfRows // PARTITIONS), 1)
+    partitionFilenames = []
+    for partition, chunk in enumerate(pd.read_csv(filename, sep=PersonAnalyser.CSV_SEPARATOR,
+                                                  chunksize=partitionSize)):
+        partitionFilenames.append(os.path.join(folder, "appearances-%d-part%d.csv" % (numberOfRows, partition)))
+        chunk.to_csv(partitionFilenames[-1], sep=PersonAnalyser.CSV_SEPARATOR, index=False)
+
+    # each setup returns the file name, after removing or writing the columnar cache where needed
+    def getFilename():
+        return filename
+
+    def removeCache():
+        shutil.rmtree(filename + ".cache", ignore_errors=True)
+        return filename
+
+    def newPartitionedAnalyser():
+        return PartitionedPersonAnalyser(partitionFilenames)
+
+    def writeCache():
+        PersonAnalyser.fromCachedCsv(filename)
+        return filename
+
+    benchmarks = [
+        ("fromCsv", PersonAnalyser.fromCsv, getFilename),
+        ("fromCachedCsv (cold)", PersonAnalyser.fromCachedCsv, removeCache),
+        ("fromCachedCsv (warm)", PersonAnalyser.fromCachedCsv, writeCache),
+        ("streamStatisticsPerColumnValue Name",
+         lambda filename: PersonAnalyser.streamStatisticsPerColumnValue(filename, "Name", TIME_COLUMNS,
+                                                                        ["sum", "mean"], sortColumn=TOTAL_TIME),
+         getFilename),
+    ]
+
+    partitionedBenchmarks = [
+        ("countRowsInDataframe", lambda analyser: analyser.countRowsInDataframe()),
+        ("calculateTotalTimePerColumnValue Name",
+         lambda analyser: analyser.calculateTotalTimePerColumnValue("Name", TIME_COLUMNS, sortColumn=TOTAL_TIME)),
+        ("calculateQuantilesPerColumnValue Party median",
+         lambda analyser: analyser.calculateQuantilesPerColumnValue("Party", TIME_COLUMNS, [0.5])),
+        ("countDistinctPersonsPerColumnValue Programme, Week (approximate)",
+         lambda analyser: analyser.countDistinctPersonsPerColumnValue(["Programme", "Week"], approximate=True)),
+        ("countProgrammeBroadcasts", lambda analyser: analyser.countProgrammeBroadcasts("Programme", "Date")),
+    ]
+    benchmarks.extend(("PartitionedPersonAnalyser %s" % name, function, newPartitionedAnalyser)
+                      for name, function in partitionedBenchmarks)
+
+    def cleanUp():
+        shutil.rmtree(folder, ignore_errors=True)
+
+    return benchmarks, cleanUp
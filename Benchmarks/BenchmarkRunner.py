@@ -0,0 +1,127 @@
+import gc
+import json
+import platform
+import time
+import tracemalloc
+
+"""This class times benchmarks and records their peak memory use, and compares the results with a baseline from an
+earlier run, e.g. from before an upgrade of pandas or a change to the analysers.
+
+Each benchmark is run a number of times, and the fastest time is kept, as it is the least disturbed by other
+processes. The peak memory is measured in a separate run with tracemalloc, which would slow down the timed runs.
+"""
+
+class BenchmarkRunner():
+
+    NAME = "name"
+    SECONDS = "seconds"
+    MEAN_SECONDS = "mean seconds"
+    PEAK_MEMORY = "peak memory (bytes)"
+
+    def __init__(self, repeats=3, measureMemory=True):
+        self.repeats = repeats
+        self.measureMemory = measureMemory
+        self.results = []
+
+    def measure(self, name, function, setup=None):
+        """Times the function, and records its peak memory use. If setup is given, it is called before every run
+        without being timed, and its return value is passed to the function (e.g. a new analyser, so that no
+        cached results are reused between runs)
+        Returns the result of the benchmark as a dictionary"""
+
+        def prepare():
+            arguments = (setup(),) if setup else ()
+            gc.collect()
+            return arguments
+
+        times = []
+        for i in range(self.repeats):
+            arguments = prepare()
+            start = time.perf_counter()
+            function(*arguments)
+            times.append(time.perf_counter() - start)
+
+        peakMemory = None
+        if self.measureMemory:
+            arguments = prepare()
+            tracemalloc.start()
+            try:
+                function(*arguments)
+                peakMemory = tracemalloc.get_traced_memory()[1]
+            finally:
+                tracemalloc.stop()
+
+        result = {self.NAME: name, self.SECONDS: min(times), self.MEAN_SECONDS: sum(times) / len(times),
+                  self.PEAK_MEMORY: peakMemory}
+        self.results.append(result)
+        return result
+
+    def saveResults(self, filename, settings=None):
+        """Writes the results to a JSON file, which can be used as a baseline later. settings is an optional
+        dictionary describing the run, e.g. the number of rows
+        Returns no values"""
+        with open(filename, "w") as file:
+            json.dump({"settings": settings or {}, "python": platform.python_version(), "results": self.results},
+                      file, indent=2)
+
+    @classmethod
+    def loadResults(cls, filename):
+        """Reads results written by saveResults
+        Returns a dictionary with the results per benchmark name"""
+        with open(filename) as file:
+            return {result[cls.NAME]: result for result in json.load(file)["results"]}
+
+    def compareWithBaseline(self, baselineFilename, tolerance=0.2, minimumSeconds=0.005):
+        """Compares the results with those in a baseline file. A benchmark is a regression when it takes more than
+        (1 + tolerance) times as long as in the baseline, or uses that much more memory. Differences in time of less
+        than minimumSeconds are ignored, as they are mostly noise
+        Returns a list with a dictionary per benchmark, with the baseline and current values, their ratios and
+        whether it is a regression"""
+
+        baseline = self.loadResults(baselineFilename)
+        comparisons = []
+        for result in self.results:
+            if result[self.NAME] not in baseline:
+                continue
+            baselineResult = baseline[result[self.NAME]]
+            comparison = {self.NAME: result[self.NAME]}
+            isRegression = False
+            for measurement in [self.SECONDS, self.PEAK_MEMORY]:
+                current, previous = result[measurement], baselineResult.get(measurement)
+                ratio = current / previous if current is not None and previous else None
+                comparison[measurement] = (previous, current, ratio)
+                if measurement == self.SECONDS and ratio is not None and current - previous < minimumSeconds:
+                    continue
+                isRegression |= ratio is not None and ratio > 1 + tolerance
+            comparison["regression"] = isRegression
+            comparisons.append(comparison)
+        return comparisons
+
+    @classmethod
+    def formatComparisons(cls, comparisons):
+        """Formats the comparisons with a baseline as a table
+        Returns the table as a string"""
+
+        def formatRatio(ratio):
+            return "%.2fx" % ratio if ratio is not None else "-"
+
+        lines = ["%-90s %12s %12s %8s %8s" % ("benchmark", "baseline s", "current s", "time", "memory")]
+        for comparison in comparisons:
+            previous, current, timeRatio = comparison[cls.SECONDS]
+            memoryRatio = comparison[cls.PEAK_MEMORY][2]
+            lines.append("%-90s %12.4f %12.4f %8s %8s%s" % (comparison[cls.NAME], previous, current,
+                                                            formatRatio(timeRatio), formatRatio(memoryRatio),
+                                                            "  REGRESSION" if comparison["regression"] else ""))
+        return "\n".join(lines)
+
+    @classmethod
+    def formatResults(cls, results):
+        """Formats results as a table
+        Returns the table as a string"""
+        lines = ["%-90s %12s %12s %14s" % ("benchmark", "best s", "mean s", "peak MB")]
+        for result in results:
+            peakMemory = result[cls.PEAK_MEMORY]
+            lines.append("%-90s %12.4f %12.4f %14s" % (result[cls.NAME], result[cls.SECONDS], result[cls.MEAN_SECONDS],
+                                                       "%.1f" % (peakMemory / 2 ** 20) if peakMemory is not None
+                                                       else "-"))
+        return "\n".join(lines)
@@ -0,0 +1,135 @@
+import collections
+import numpy as np
+from ArchiveAnalysis.PersonAnalyser import PersonAnalyser
+from Visualisation import NISVHouseStyle
+from Visualisation.PlotlyViz import PlotlyViz
+
+"""The benchmarks of the PlotlyViz create*Figure builders. The figures are built from the results of the analysers on
+the synthetic appearances, in the way the notebooks use them, so the number of bars, lines and points grows with the
+cardinalities of the data. Only building the figures is timed, not writing them to a file.
+"""
+
+TIME_COLUMNS = PersonAnalyser.TIME_COLUMNS
+TOTAL_TIME = "Total time recognised (s)"
+COLOURS = [NISVHouseStyle.BLUE, NISVHouseStyle.PINK, NISVHouseStyle.GREEN, NISVHouseStyle.ORANGE,
+           NISVHouseStyle.GREY, NISVHouseStyle.YELLOW, NISVHouseStyle.PURPLE, NISVHouseStyle.LILAC]
+MARGIN = dict(l=150, b=150)
+
+
+def getFigureBenchmarks(dataframe, segments=None):
+    """Gets the figure benchmarks for a data frame of appearances, and optionally a data frame of detection segments
+    (for the clip timelines)
+    Returns a list of (name, function, setup) tuples, where setup creates the PlotlyViz that is passed to the
+    function"""
+
+    analyser = PersonAnalyser(dataframe)
+    names, nameTotals = analyser.calculateTotalTimePerColumnValue("Name", [TOTAL_TIME], sortColumn=TOTAL_TIME)
+    parties, partyTimes = analyser.calculateTotalTimePerColumnValue("Party", TIME_COLUMNS, sortColumn=TOTAL_TIME)
+    programmes, programmeTotals = analyser.calculateTotalTimePerColumnValue("Programme", [TOTAL_TIME],
+                                                                            sortColumn=TOTAL_TIME)
+    genders, genderTotals = analyser.calculateTotalTimePerColumnValue("Gender", [TOTAL_TIME])
+    types, typeTotals = analyser.calculateTotalTimePerColumnValue("Type", [TOTAL_TIME])
+    ideologies, ideologyTotals = analyser.calculateTotalTimePerColumnValue("Party ideology", [TOTAL_TIME])
+    roles, roleTotals = analyser.calculateTotalTimePerColumnValue("Party role", [TOTAL_TIME])
+
+    seriesParties, days, counts, seriesTotals = analyser.calculateTimeSeriesPerColumnValue(
+        "Party", "Date", [TOTAL_TIME], PersonAnalyser.PERIOD_DAY)
+    dayStrings = [str(day) for day in days]
+    topSeries = np.argsort(-seriesTotals[TOTAL_TIME].sum(axis=1), kind="stable")[:len(COLOURS)]
+
+    monthCounts, videoMonthCounts = getItemsPerMonth(analyser)
+
+    partyValues = np.array(partyTimes, dtype=float)
+    pieLabels = [list(genders), list(types), list(ideologies), list(roles)]
+    pieValues = [list(np.array(values, dtype=float)[0]) for values in
+                 [genderTotals, typeTotals, ideologyTotals, roleTotals]]
+
+    timelines = getClipTimelines(segments) if segments is not None else []
+    programmeTimelines = [{"name": programme, "startDate": str(days[0]), "endDate": str(days[-1]),
+                           "description": programme} for programme in programmes]
+
+    benchmarks = [
+        ("createTopXKeyValuesFigure",
+         lambda viz: viz.createTopXKeyValuesFigure(dict(zip(names, nameTotals[0])), 20, "Top persons", "Name",
+                                                   "Time (s)", MARGIN)),
+        ("createMultipleVariablesOverTimeAsLineGraphsFigure",
+         lambda viz: viz.createMultipleVariablesOverTimeAsLineGraphsFigure(
+             [list(seriesTotals[TOTAL_TIME][i]) for i in topSeries], [seriesParties[i] for i in topSeries],
+             [dayStrings] * len(topSeries), "Time per party", "Date", "Time (s)", MARGIN)),
+        ("createYAgainstXAsBarChartFigure",
+         lambda viz: viz.createYAgainstXAsBarChartFigure(programmes, programmeTotals[0], "Time per programme",
+                                                         "Programme", "Time (s)", MARGIN)),
+        ("createMultipleYsAgainstXAsBarChartFigure",
+         lambda viz: viz.createMultipleYsAgainstXAsBarChartFigure(parties, [list(partyValues[0]),
+                                                                            list(partyValues[1])],
+                                                                  ["Face", "Voice"], "Time per party", "Party",
+                                                                  "Time (s)", MARGIN)),
+        ("createStackedBarChartFigure",
+         lambda viz: viz.createStackedBarChartFigure([list(partyValues[0]), list(partyValues[1])],
+                                                     [parties, parties], ["Face", "Voice"], "Time per party",
+                                                     "Party", "Time (s)", MARGIN, COLOURS)),
+        ("createOverlayBarChartFigureForTwoSetsItemsPerYear",
+         lambda viz: viz.createOverlayBarChartFigureForTwoSetsItemsPerYear(
+             monthCounts, videoMonthCounts, "Without video", "With video", "Appearances per month", "Month",
+             "Appearances")),
+        ("createOverlayBarChartFigureForThreeSetsItemsPerYear",
+         lambda viz: viz.createOverlayBarChartFigureForThreeSetsItemsPerYear(
+             monthCounts, videoMonthCounts, collections.OrderedDict((month, value // 2)
+                                                                    for month, value in videoMonthCounts.items()),
+             "Without video", "Video without face", "Video with face", "Appearances per month", "Month",
+             "Appearances")),
+        ("createPieChartFigure",
+         lambda viz: viz.createPieChartFigure(list(parties), list(partyValues[2]), "Time per party", MARGIN)),
+        ("createFourPieChartsFigure",
+         lambda viz: viz.createFourPieChartsFigure(pieLabels, pieValues, ["Gender", "Type", "Ideology", "Role"],
+                                                   "Time per characteristic", MARGIN)),
+        ("createSimpleTimelinesFigure",
+         lambda viz: viz.createSimpleTimelinesFigure(programmeTimelines, 800, 1000, "Programmes", dict(l=150))),
+        ("createUpdateTimeFigure", lambda viz: viz.createUpdateTimeFigure(dayStrings[-1])),
+        ("createFunnelChart",
+         lambda viz: viz.createFunnelChart(list(parties[:6]), list(partyValues[2][:6]),
+                                           COLOURS[:6], "Time per party")),
+    ]
+    if timelines:
+        benchmarks.append(("createClipLocationsInTimeLinesFigure",
+                           lambda viz: viz.createClipLocationsInTimeLinesFigure(timelines, [], "Clips", "2021-01-01")))
+
+    return [(name, function, newPlotlyViz) for name, function in benchmarks]
+
+
+def newPlotlyViz():
+    return PlotlyViz("OFFLINE")
+
+
+def getItemsPerMonth(analyser):
+    """Counts all appearances, and the appearances in video programmes, per month
+    Returns an ordered dictionary with the count per month for each"""
+    types, months, counts = analyser.calculateTimeSeriesPerColumnValue("Type", "Date", [],
+                                                                       PersonAnalyser.PERIOD_MONTH)[:3]
+    monthStrings = [str(month)[:7] for month in months]
+    videoCounts = counts[types.index("video")] if "video" in types else np.zeros(len(months), dtype=np.int64)
+    return collections.OrderedDict(zip(monthStrings, (int(count) for count in counts.sum(axis=0)))), \
+        collections.OrderedDict(zip(monthStrings, (int(count) for count in videoCounts)))
+
+
+def getClipTimelines(segments, numberOfTimelines=20, clipsPerTimeline=6):
+    """Turns the first detection segments of the first programmes into timelines with clips, for the clip location
+    figure. Clips are made consecutive so they don't overlap
+    Returns a list of timelines"""
+    timelines = []
+    for (programme, date), programmeSegments in segments.groupby(["Programme", "Date"], sort=False):
+        if len(timelines) == numberOfTimelines:
+            break
+        clips = []
+        start = 0
+        for length in programmeSegments["End"].to_numpy()[:clipsPerTimeline] - \
+                programmeSegments["Start"].to_numpy()[:clipsPerTimeline]:
+            clips.append({"startTime": formatTime(start), "endTime": formatTime(start + max(int(length), 1))})
+            start += max(int(length), 1) + 60
+        timelines.append({"name": "%s %s" % (programme, date), "startTime": formatTime(0),
+                          "endTime": formatTime(start), "clips": clips})
+    return timelines
+
+
+def formatTime(seconds):
+    return "%02d:%02d:%02d" % (seconds // 3600, seconds // 60 % 60, seconds % 60)
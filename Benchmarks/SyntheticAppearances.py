@@ -0,0 +1,122 @@
+import numpy as np
+import pandas as pd
+
+"""This class generates synthetic appearance data with the same columns as appearances.csv, for benchmarking the
+analysers and visualisations at sizes far beyond the real data. The data is generated from a seed, so the same
+settings always give the same rows.
+
+The number of persons, parties, programmes and days can be set, to benchmark with different cardinalities of the
+grouping columns. Each person belongs to one party, each party has one ideology and role, and each programme has one
+type. Large data sets can be generated and written in chunks, so they never have to fit in memory.
+"""
+
+class SyntheticAppearances():
+
+    COLUMNS = ["Name", "Gender", "Party", "Party ideology", "Party role", "Programme", "Date", "Week",
+               "Time face recognised (s)", "Time voice recognised (s)", "Total time recognised (s)", "Type"]
+
+    IDEOLOGIES = ["left-wing", "centre-left", "centrism", "centre-right", "right-wing", "right-wing (populist)",
+                  "unknown"]
+    ROLES = ["government", "leftwing opposition", "populist opposition", "other"]
+    TYPES = ["audio", "video"]
+    GENDERS = ["M", "V"]
+
+    MONTH_NAMES = ["januari", "februari", "maart", "april", "mei", "juni", "juli", "augustus", "september", "oktober",
+                   "november", "december"]
+
+    def __init__(self, numberOfPersons=500, numberOfParties=15, numberOfProgrammes=40, numberOfDays=365,
+                 startDate="2021-01-06", seed=0):
+        """Initialises the generator with the cardinalities of the data: how many different persons, parties,
+        programmes and dates there are. The dates are consecutive days from startDate"""
+        self.seed = seed
+        random = np.random.default_rng(seed)
+
+        self.persons = np.array(["Person%d, Voornaam%d" % (i, i) for i in range(numberOfPersons)], dtype=object)
+        self.parties = np.array(["Party%d" % i for i in range(numberOfParties)], dtype=object)
+        self.programmes = np.array(["Programme %d" % i for i in range(numberOfProgrammes)], dtype=object)
+        self.dates = pd.date_range(startDate, periods=numberOfDays, freq="D")
+
+        # fixed characteristics per person, party and programme
+        self.personParties = random.integers(0, numberOfParties, numberOfPersons)
+        self.personGenders = random.integers(0, len(self.GENDERS), numberOfPersons)
+        self.partyIdeologies = random.integers(0, len(self.IDEOLOGIES), numberOfParties)
+        self.partyRoles = random.integers(0, len(self.ROLES), numberOfParties)
+        self.programmeTypes = random.integers(0, len(self.TYPES), numberOfProgrammes)
+
+        # a few persons appear far more often than the rest, as in the real data
+        popularity = 1.0 / np.arange(1, numberOfPersons + 1)
+        self.personProbabilities = popularity / popularity.sum()
+
+        self.dateStrings = np.array(self.dates.strftime("%Y-%m-%d"), dtype=object)
+        self.weekStrings = np.array([self.getWeekString(date) for date in self.dates], dtype=object)
+
+    @classmethod
+    def getWeekString(cls, date):
+        """Gets the description of the broadcast week (Wednesday to Tuesday) of a date, in the form used in
+        appearances.csv, e.g. "woensdag 24 februari t/m dinsdag 02 maart"
+        Returns the description"""
+        start = date - pd.Timedelta(days=(date.dayofweek - 2) % 7)
+        end = start + pd.Timedelta(days=6)
+        if start.month == end.month:
+            return "woensdag %02d t/m dinsdag %d %s" % (start.day, end.day, cls.MONTH_NAMES[end.month - 1])
+        return "woensdag %02d %s t/m dinsdag %02d %s" % (start.day, cls.MONTH_NAMES[start.month - 1], end.day,
+                                                         cls.MONTH_NAMES[end.month - 1])
+
+    def generate(self, numberOfRows, chunkNumber=0):
+        """Generates a data frame with numberOfRows appearances. Different chunk numbers give different rows
+        Returns the data frame"""
+        random = np.random.default_rng([self.seed, chunkNumber])
+
+        persons = random.choice(len(self.persons), numberOfRows, p=self.personProbabilities)
+        programmes = random.integers(0, len(self.programmes), numberOfRows)
+        dates = random.integers(0, len(self.dates), numberOfRows)
+        parties = self.personParties[persons]
+        types = self.programmeTypes[programmes]
+
+        # audio only has voice time, video has face time and usually voice time as well
+        isVideo = types == self.TYPES.index("video")
+        voiceTimes = np.round(random.exponential(300, numberOfRows), 2) * (random.random(numberOfRows) < 0.7)
+        faceTimes = np.where(isVideo, np.round(random.exponential(200, numberOfRows), 2), 0.0)
+
+        return pd.DataFrame({"Name": self.persons[persons],
+                             "Gender": np.array(self.GENDERS, dtype=object)[self.personGenders[persons]],
+                             "Party": self.parties[parties],
+                             "Party ideology": np.array(self.IDEOLOGIES, dtype=object)[self.partyIdeologies[parties]],
+                             "Party role": np.array(self.ROLES, dtype=object)[self.partyRoles[parties]],
+                             "Programme": self.programmes[programmes],
+                             "Date": self.dateStrings[dates],
+                             "Week": self.weekStrings[dates],
+                             "Time face recognised (s)": faceTimes,
+                             "Time voice recognised (s)": voiceTimes,
+                             "Total time recognised (s)": faceTimes + voiceTimes,
+                             "Type": np.array(self.TYPES, dtype=object)[types]}, columns=self.COLUMNS)
+
+    def generateSegments(self, numberOfSegments, chunkNumber=0):
+        """Generates raw face and voice detection segments, with a person, programme, date, start and end time (in
+        seconds from the start of the programme) and modality per segment
+        Returns a data frame with a row per segment"""
+        random = np.random.default_rng([self.seed, chunkNumber, 1])
+
+        persons = random.choice(len(self.persons), numberOfSegments, p=self.personProbabilities)
+        starts = np.round(random.uniform(0, 3600, numberOfSegments), 2)
+        return pd.DataFrame({"Name": self.persons[persons],
+                             "Programme": self.programmes[random.integers(0, len(self.programmes), numberOfSegments)],
+                             "Date": self.dateStrings[random.integers(0, len(self.dates), numberOfSegments)],
+                             "Start": starts,
+                             "End": starts + np.round(random.exponential(20, numberOfSegments), 2),
+                             "Modality": np.array(["face", "voice"], dtype=object)[
+                                 random.integers(0, 2, numberOfSegments)]})
+
+    def generateChunks(self, numberOfRows, chunkSize=1000000):
+        """Generates numberOfRows appearances as data frames of at most chunkSize rows
+        Returns a generator of data frames"""
+        for chunkNumber, start in enumerate(range(0, numberOfRows, chunkSize)):
+            chunk = self.generate(min(chunkSize, numberOfRows - start), chunkNumber)
+            chunk.index = pd.RangeIndex(start, start + len(chunk.index))
+            yield chunk
+
+    def writeCsv(self, filename, numberOfRows, separator=";", chunkSize=1000000):
+        """Writes numberOfRows appearances to a csv file in the format of appearances.csv, one chunk at a time
+        Returns no values"""
+        for chunkNumber, chunk in enumerate(self.generateChunks(numberOfRows, chunkSize)):
+            chunk.to_csv(filename, sep=separator, mode="w" if chunkNumber == 0 else "a", header=chunkNumber == 0)
@@ -0,0 +1,92 @@
+import argparse
+import sys
+from Benchmarks.BenchmarkRunner import BenchmarkRunner
+from Benchmarks.SyntheticAppearances import SyntheticAppearances
+from Benchmarks import AnalyserBenchmarks
+
+"""Runs the benchmarks of the analysers and figure builders on synthetic appearances, e.g.
+
+    python -m Benchmarks.runBenchmarks --rows 10000 1000000 --output results.json --baseline baseline.json
+
+Each size is generated in memory from the same seed. For sizes that don't fit in memory, use --csv-rows, which writes a
+csv file in chunks and only runs the benchmarks that read or stream the file, including the PartitionedPersonAnalyser
+on the same rows split over several files. With --baseline the results are
+compared with an earlier output file. The exit code is 1 if any benchmark failed, or got slower or uses more memory
+than the tolerance allows.
+"""
+
+
+def parseArguments(arguments):
+    parser = argparse.ArgumentParser(description="Benchmarks the analysers and figure builders")
+    parser.add_argument("--rows", type=int, nargs="*", default=[10000, 100000, 1000000],
+                        help="numbers of rows of the in-memory benchmarks")
+    parser.add_argument("--csv-rows", type=int, nargs="*", default=[],
+                        help="numbers of rows of the csv file benchmarks")
+    parser.add_argument("--persons", type=int, default=500)
+    parser.add_argument("--parties", type=int, default=15)
+    parser.add_argument("--programmes", type=int, default=40)
+    parser.add_argument("--days", type=int, default=365)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--repeats", type=int, default=3)
+    parser.add_argument("--no-memory", action="store_true", help="don't measure the peak memory")
+    parser.add_argument("--no-figures", action="store_true", help="don't benchmark the figure builders")
+    parser.add_argument("--output", help="file to write the results to, for use as a baseline later")
+    parser.add_argument("--baseline", help="results of an earlier run to compare with")
+    parser.add_argument("--tolerance", type=float, default=0.2,
+                        help="allowed slowdown or memory growth relative to the baseline, e.g. 0.2 for 20%%")
+    return parser.parse_args(arguments)
+
+
+def main(arguments=None):
+    arguments = parseArguments(arguments)
+    generator = SyntheticAppearances(arguments.persons, arguments.parties, arguments.programmes, arguments.days,
+                                     seed=arguments.seed)
+    runner = BenchmarkRunner(arguments.repeats, not arguments.no_memory)
+
+    failures = []
+
+    def runAll(benchmarks, label):
+        for name, function, setup in benchmarks:
+            name = "%s [%s]" % (name, label)
+            try:
+                result = runner.measure(name, function, setup)
+            except Exception as error:  # report the failure, and go on with the other benchmarks
+                failures.append(name)
+                print("%-90s FAILED: %s" % (name, str(error).splitlines()[0] if str(error) else repr(error)),
+                      flush=True)
+                continue
+            print(BenchmarkRunner.formatResults([result]).splitlines()[1], flush=True)
+
+    print(BenchmarkRunner.formatResults([]))
+    for numberOfRows in arguments.rows:
+        dataframe = generator.generate(numberOfRows)
+        segments = generator.generateSegments(numberOfRows)
+        label = "%d rows" % numberOfRows
+        runAll(AnalyserBenchmarks.getAnalyserBenchmarks(dataframe, segments), label)
+        if not arguments.no_figures:
+            from Benchmarks import FigureBenchmarks  # only needs plotly and chart-studio when figures are benchmarked
+            runAll(FigureBenchmarks.getFigureBenchmarks(dataframe, segments), label)
+
+    for numberOfRows in arguments.csv_rows:
+        benchmarks, cleanUp = AnalyserBenchmarks.getCsvBenchmarks(generator, numberOfRows)
+        try:
+            runAll(benchmarks, "%d rows csv" % numberOfRows)
+        finally:
+            cleanUp()
+
+    settings = {key: value for key, value in vars(arguments).items() if key not in ("output", "baseline")}
+    if arguments.output:
+        runner.saveResults(arguments.output, settings)
+
+    exitCode = 1 if failures else 0
+    if arguments.baseline:
+        comparisons = runner.compareWithBaseline(arguments.baseline, arguments.tolerance)
+        print()
+        print(BenchmarkRunner.formatComparisons(comparisons))
+        if any(comparison["regression"] for comparison in comparisons):
+            exitCode = 1
+    return exitCode
+
+
+if __name__ == "__main__":
+    sys.exit(main())
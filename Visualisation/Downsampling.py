@@ -0,0 +1,123 @@
+"""This class reduces a series of points to the points needed to draw it at a given resolution, so line graphs of
+very long series (e.g. per day over decades) stay small and responsive in the browser.
+
+Two methods are available:
+- LTTB (Largest-Triangle-Three-Buckets): divides the points into buckets of equal size and keeps from each bucket the
+  point that forms the largest triangle with the point kept from the previous bucket and the average of the next
+  bucket. This keeps the visual shape of the line, with exactly the requested number of points.
+- MINMAX: divides the x axis into buckets of equal width (e.g. one per pixel), and keeps the lowest and highest point
+  of each bucket, so no peak or dip is lost.
+
+The methods return the positions of the points to keep, in their original order, so any values that belong to the
+points (such as the x values in their original form, or labels) can be selected with them.
+"""
+import warnings
+import numpy as np
+import pandas as pd
+
+class Downsampling:
+
+	LTTB = "lttb"
+	MINMAX = "minmax"
+	METHODS = [LTTB, MINMAX]
+
+	@staticmethod
+	def toNumbers(values):
+		"""Converts x values to numbers for the calculations: numbers stay as they are, and dates (as dates or as
+		strings) become nanoseconds. Other values are replaced by their position
+		Returns a float array"""
+		values = pd.Series(values) if not isinstance(values, pd.Series) else values  # keeps numbers and dates as they are
+		if values.dtype.kind in "biuf":
+			return values.to_numpy(dtype=np.float64)
+		if values.dtype.kind == "M":
+			return values.to_numpy(dtype="datetime64[ns]").astype(np.int64).astype(np.float64)
+		try:
+			with warnings.catch_warnings():
+				warnings.simplefilter("ignore")  # pandas warns when it has to guess the date format
+				dates = pd.to_datetime(values)
+			return dates.to_numpy(dtype="datetime64[ns]").astype(np.int64).astype(np.float64)
+		except (ValueError, TypeError, OverflowError):
+			return np.arange(len(values), dtype=np.float64)
+
+	@classmethod
+	def downsampleLttb(cls, x, y, numberOfPoints):
+		"""Selects numberOfPoints points (at least 3) with Largest-Triangle-Three-Buckets. The first and last point are
+		always kept. x must be in ascending order
+		The bucket averages are calculated for all buckets at once, but the point of each bucket depends on the point
+		chosen in the bucket before, so the buckets are gone through in a Python loop. The cost is one pass over the
+		values plus a small NumPy step per kept point, so it grows with the number of points kept as well as the input
+		Returns an array with the positions of the points to keep"""
+		x = cls.toNumbers(x)
+		y = np.asarray(y, dtype=np.float64)
+		length = len(y)
+		if numberOfPoints < 3:
+			raise ValueError("LTTB needs to keep at least 3 points")
+		if numberOfPoints >= length:
+			return np.arange(length)
+
+		# the points between the first and last are divided into numberOfPoints - 2 buckets
+		edges = np.arange(numberOfPoints - 1, dtype=np.int64) * (length - 2) // (numberOfPoints - 2) + 1
+		# (the last edge is the last point, which reduceat adds up on its own, so its total is left out)
+		isNumber = ~np.isnan(y)
+		counts = np.maximum(np.add.reduceat(isNumber, edges)[:-1], 1)
+		averageX = np.add.reduceat(x, edges)[:-1] / np.diff(edges)
+		averageY = np.add.reduceat(np.where(isNumber, y, 0), edges)[:-1] / counts
+
+		selected = np.empty(numberOfPoints, dtype=np.intp)
+		selected[0], selected[-1] = 0, length - 1
+		previous = 0
+		for bucket in range(numberOfPoints - 2):
+			start, end = edges[bucket], edges[bucket + 1]
+			if bucket + 1 < numberOfPoints - 2:
+				nextX, nextY = averageX[bucket + 1], averageY[bucket + 1]
+			else:
+				nextX, nextY = x[-1], y[-1]
+			areas = np.abs((x[previous] - nextX) * (y[start:end] - y[previous])
+						   - (x[previous] - x[start:end]) * (nextY - y[previous]))
+			areas = np.where(np.isnan(areas), -1, areas)
+			previous = start + int(np.argmax(areas))
+			selected[bucket + 1] = previous
+		return selected
+
+	@classmethod
+	def downsampleMinMax(cls, x, y, numberOfPoints):
+		"""Divides the x axis into numberOfPoints / 2 buckets of equal width, and selects the points with the lowest and
+		highest y value of each bucket, plus the first and last point. Points without a y value are left out
+		Returns an array with the positions of the points to keep, in their original order"""
+		x = cls.toNumbers(x)
+		y = np.asarray(y, dtype=np.float64)
+		length = len(y)
+		numberOfBuckets = max(numberOfPoints // 2, 1)
+		if numberOfPoints >= length:
+			return np.arange(length)
+
+		positions = np.flatnonzero(~np.isnan(y))
+		if len(positions) == 0:
+			return np.array([0, length - 1], dtype=np.intp)
+		minimum, maximum = np.nanmin(x), np.nanmax(x)
+		width = (maximum - minimum) / numberOfBuckets if maximum > minimum else 1.0
+		buckets = np.clip(((x[positions] - minimum) // width).astype(np.int64), 0, numberOfBuckets - 1)
+
+		bucketValues = pd.Series(y[positions]).groupby(buckets)
+		selected = positions[np.concatenate((bucketValues.idxmin().to_numpy(), bucketValues.idxmax().to_numpy()))]
+		return np.unique(np.concatenate(([0, length - 1], selected)))
+
+	@classmethod
+	def downsample(cls, x, y, numberOfPoints, method=LTTB):
+		"""Selects at most about numberOfPoints points of a series with the given method, LTTB or MINMAX
+		Returns an array with the positions of the points to keep, in their original order"""
+		if method == cls.LTTB:
+			return cls.downsampleLttb(x, y, numberOfPoints)
+		if method == cls.MINMAX:
+			return cls.downsampleMinMax(x, y, numberOfPoints)
+		raise ValueError("Invalid downsampling method %s, must be one of %s" % (method, ", ".join(cls.METHODS)))
+
+	@staticmethod
+	def selectPoints(values, positions):
+		"""Selects the values at the positions, keeping the values as they are (e.g. dates as strings)
+		Returns a list of the selected values"""
+		if isinstance(values, (pd.Series, pd.Index)):
+			values = values.to_numpy()
+		array = np.empty(len(values), dtype=object)
+		array[:] = list(values) if not isinstance(values, np.ndarray) else values
+		return array[positions].tolist()
@@ -0,0 +1,56 @@
+"""This class exports plotly figures to static images (PNG, JPEG or SVG) on this machine, with kaleido, instead of
+through the chart studio website. No network access is needed, and the images are written as kaleido renders them,
+without decoding and encoding them again.
+
+Kaleido renders in a browser process that takes a while to start. start (or the first export) renders an empty
+figure, so the process is started before the first real figure. The pinned kaleido 0.2.1 keeps that process running
+until Python exits, so the next figures don't have to wait for it, and stop can't end it.
+
+kaleido must be installed for the export, e.g. pip install kaleido
+"""
+import plotly.io as pio
+import plotly.graph_objects as go
+
+class LocalImageExporter:
+
+	FORMATS = ["png", "jpg", "svg"]
+
+	def __init__(self, scale=1, width=None, height=None):
+		"""Initialises the exporter. scale multiplies the size of the images (e.g. 2 for high resolution screens),
+		and width and height (in pixels) are used for figures that don't set their own size"""
+		self.scale = scale
+		self.width = width
+		self.height = height
+		self.__started = False
+
+	def start(self):
+		"""Starts the renderer, unless it is already running, by rendering an empty figure
+		Returns no values"""
+		if self.__started:
+			return
+		try:
+			import kaleido
+		except ImportError:
+			raise ValueError("Local image export needs kaleido, install it with: pip install kaleido")
+
+		pio.to_image(go.Figure(), format="png", width=10, height=10)
+		self.__started = True
+
+	def stop(self):
+		"""Marks the renderer as stopped, so the next export renders an empty figure first again. kaleido 0.2.1 keeps
+		its browser process running until Python exits
+		Returns no values"""
+		self.__started = False
+
+	def __checkFormat(self, fileFormat):
+		if fileFormat not in self.FORMATS:
+			raise ValueError("Invalid image format %s, must be one of %s" % (fileFormat, ", ".join(self.FORMATS)))
+
+	def writeImage(self, fig, filename, fileFormat="png", validate=True):
+		"""Renders a figure and writes it to an image file. validate can be set to False for a figure dictionary that
+		was made from a checked figure
+		Returns no values"""
+		self.__checkFormat(fileFormat)
+		self.start()
+		pio.write_image(fig, filename, format=fileFormat, scale=self.scale, width=self.width, height=self.height,
+						validate=validate)
@@ -1,6 +1,9 @@
 import collections
 import os
+from concurrent.futures import ProcessPoolExecutor
+import tempfile
 import plotly.io as pio
+import plotly.offline
 import chart_studio
 from chart_studio import plotly as py
 import plotly.graph_objects as go
@@ -9,25 +12,42 @@ from chart_studio.plotly import image as PlotlyImage
 from PIL import Image as PILImage
 import io
 from Visualisation import NISVHouseStyle
+from Visualisation.LocalImageExporter import LocalImageExporter
+from Visualisation.RenderCache import RenderCache
+from Visualisation.Downsampling import Downsampling
 
 
 class PlotlyViz:
 	"""A class for carrying out Plotly visualisations (e.g. in a Jupyter notebook)
 	Works in either online mode (writes plots to the website) or offline (shows plots in the notebook)"""
 
-	def __init__(self, mode, config = {}, saveAsFile= False, saveInFormat = [], saveInFolder = None):
+	__workerImageExporters = {}  # the image exporters of a worker process of renderBatch, per image scale
+
+	def __init__(self, mode, config = {}, saveAsFile= False, saveInFormat = [], saveInFolder = None, sharePlotlyJs = False, localImageExport = False, imageScale = 1, useRenderCache = False):
 		"""Initialises the PlotlyViz class in online or offline mode. In online mode, plots are written to the Plotly
 		website under the user account. In offline mode, they are either plotted in a notebook of saved to HTML
 		For online mode, a config with a valid Plotly username and apiKey is necessary.
 		For offline mode, no config is needed. You can optionally set saveAsFile to True, then instead of viewing graphs
 		in a Jupyter Notebook, they will be saved as files. You must then specify a list with the format(s) you want to save
 		the graph in: "html" for interactive html files,
-		"png" for static PNG, "jpg" for static JPEG."""
+		"png" for static PNG, "jpg" for static JPEG.
+		By default each html file contains the whole plotly.js library (about 3 MB). If sharePlotlyJs is True, the
+		library is written once to saveInFolder (or the folder of the html file), as plotly-<version>.min.js, and every
+		html file refers to it, so the folder must be published with the html files.
+		By default png and jpg files are made by the Plotly website. If localImageExport is True, they are made on this
+		machine with kaleido, which also allows "svg" for vector images, see LocalImageExporter. imageScale multiplies the
+		size of the images made locally.
+		If useRenderCache is True, a file is only written if its figure, format or config has changed since it was last
+		written, which is recorded in a manifest in saveInFolder, see RenderCache."""
 
 		self.__MODE = mode
 		self.__saveAsFile = saveAsFile
 		self.__saveInFormat = saveInFormat
 		self.__saveInFolder = saveInFolder
+		self.__sharePlotlyJs = sharePlotlyJs
+		self.__imageExporter = LocalImageExporter(imageScale) if localImageExport else None
+		self.__batch = None
+		self.__renderCache = RenderCache(saveInFolder) if useRenderCache else None
 
 		self.__ONLINE = "ONLINE"
 		self.__OFFLINE = "OFFLINE"
@@ -49,36 +69,214 @@ class PlotlyViz:
 		Plotly website (in online mode)
 		In offline mode, you can also supply a config file to finetune how the graph is displayed, for example to hide
 		the 'Export to Plotly' link
+		Between startBatch and renderBatch, the graph is queued instead, see startBatch
 		Returns no values
 		"""
 
-		if self.__MODE == self.__ONLINE:
+		if self.__batch is not None:
+			self.queueFigure(fig, filename, config)
+		elif self.__MODE == self.__ONLINE:
 			py.plotly.plot(fig, filename=filename, auto_open=False)
 		elif self.__MODE == self.__OFFLINE:
 			if self.__saveAsFile:	
-				for fileFormat in self.__saveInFormat: 
-					if fileFormat not in ["html", "png", "jpg"]:
-						raise ValueError("Invalid file format, must be one or more of \"html\", \"png\", \"jpg\"")
-					if self.__saveInFolder:
-						if filename.endswith(fileFormat):
-							saveFilename = self.__saveInFolder + os.sep + filename
-						else:
-							saveFilename = self.__saveInFolder + os.sep + filename + "." + fileFormat
-					else:
-						if filename.endswith(fileFormat):
-							saveFilename = filename
-						else:
-							saveFilename = filename + "." + fileFormat
-					if fileFormat == "html":                                       
-						pio.write_html(fig, saveFilename, auto_open=False, config=config)  # write it to a file
-					else:
-						img_bytes = PlotlyImage.get(fig)
-						image = PILImage.open(io.BytesIO(img_bytes))
-						image.save(saveFilename)
+				saveFiles, skippedFiles, fileKeys = self.__selectChangedFiles(fig, self.__getSaveFiles(filename), config)
+				self.writeFigureFiles(fig, saveFiles, config, self.__imageExporter)
+				self.__updateRenderCache(saveFiles, fileKeys)
 			else:
 				pio.show(fig, filename=filename, config=config)
 		else:
 			raise ValueError("Unknown mode %s, should be %s or %s"%(self.__MODE, self.__ONLINE, self.__OFFLINE) )
+
+	def __getSaveFiles(self, filename):
+		"""Gets the file to write for each of the formats to save in. For html files, this also writes the shared
+		plotly.js library if needed
+		Returns a list of (format, file name, include_plotlyjs setting) tuples"""
+
+		saveFiles = []
+		for fileFormat in self.__saveInFormat: 
+			if self.__imageExporter and fileFormat not in ["html"] + LocalImageExporter.FORMATS:
+				raise ValueError("Invalid file format, must be one or more of \"html\", \"png\", \"jpg\", \"svg\"")
+			if not self.__imageExporter and fileFormat not in ["html", "png", "jpg"]:
+				raise ValueError("Invalid file format, must be one or more of \"html\", \"png\", \"jpg\"")
+			if self.__saveInFolder:
+				if filename.endswith(fileFormat):
+					saveFilename = self.__saveInFolder + os.sep + filename
+				else:
+					saveFilename = self.__saveInFolder + os.sep + filename + "." + fileFormat
+			else:
+				if filename.endswith(fileFormat):
+					saveFilename = filename
+				else:
+					saveFilename = filename + "." + fileFormat
+			includePlotlyJs = None
+			if fileFormat == "html":
+				includePlotlyJs = self.__getSharedPlotlyJs(saveFilename) if self.__sharePlotlyJs else True
+			saveFiles.append((fileFormat, saveFilename, includePlotlyJs))
+		return saveFiles
+
+	def __selectChangedFiles(self, fig, saveFiles, config):
+		"""Leaves out the files that are up to date according to the render cache, if it is used
+		Returns the files to write, the file names of the files that are up to date, and a dictionary with the cache
+		key of each file to write"""
+
+		if not self.__renderCache:
+			return saveFiles, [], {}
+
+		figureHash = RenderCache.getFigureHash(fig, config)
+		imageSettings = ("local", self.__imageExporter.scale) if self.__imageExporter else "online"
+		changedFiles, skippedFiles, fileKeys = [], [], {}
+		for fileFormat, saveFilename, includePlotlyJs in saveFiles:
+			fileKey = RenderCache.getFileKey(figureHash, fileFormat,
+											 includePlotlyJs if fileFormat == "html" else imageSettings)
+			if self.__renderCache.isUpToDate(saveFilename, fileKey):
+				skippedFiles.append(saveFilename)
+			else:
+				changedFiles.append((fileFormat, saveFilename, includePlotlyJs))
+				fileKeys[saveFilename] = fileKey
+		return changedFiles, skippedFiles, fileKeys
+
+	def __updateRenderCache(self, writtenFiles, fileKeys):
+		"""Records the files that were written in the render cache, and saves its manifest
+		Returns no values"""
+
+		if self.__renderCache and writtenFiles:
+			for fileFormat, saveFilename, includePlotlyJs in writtenFiles:
+				self.__renderCache.update(saveFilename, fileKeys[saveFilename])
+			self.__renderCache.save()
+
+	@staticmethod
+	def writeFigureFiles(fig, saveFiles, config=None, imageExporter=None, validate=True):
+		"""Writes a figure to each of the files in saveFiles, a list of (format, file name, include_plotlyjs setting)
+		tuples. Images are made by the imageExporter if one is given (see LocalImageExporter), or else by the Plotly
+		website. validate can be set to False for a figure dictionary that was made from a checked figure
+		Returns no values"""
+
+		for fileFormat, saveFilename, includePlotlyJs in saveFiles:
+			if fileFormat == "html":
+				pio.write_html(fig, saveFilename, auto_open=False, config=config, include_plotlyjs=includePlotlyJs,
+							   validate=validate)  # write it to a file
+			elif imageExporter:
+				imageExporter.writeImage(fig, saveFilename, fileFormat, validate)  # rendered on this machine
+			else:
+				img_bytes = PlotlyImage.get(fig)
+				image = PILImage.open(io.BytesIO(img_bytes))
+				image.save(saveFilename)
+
+	def startBatch(self):
+		"""Starts a batch: from now on the plot and visualise methods (and queueFigure) don't write their graphs
+		straight away, but queue them, until renderBatch writes them all in parallel. Only for offline mode with
+		saveAsFile set
+		Returns no values"""
+
+		if self.__MODE != self.__OFFLINE or not self.__saveAsFile:
+			raise ValueError("Batches can only be used in offline mode, with saveAsFile set")
+		if self.__batch is None:
+			self.__batch = []
+
+	def queueFigure(self, fig, filename, config=None):
+		"""Adds a figure (e.g. made by one of the create...Figure methods) to the batch, to be written to filename in
+		each of the formats to save in. Starts a batch if none was started
+		Returns no values"""
+
+		self.startBatch()
+		self.__batch.append((fig, filename, config))
+
+	def renderBatch(self, workers=None):
+		"""Writes all figures in the batch, in every format to save in, using a pool of workers processes (by default
+		one per processor; with 1 worker, the figures are written one after another in this process). A figure that
+		fails doesn't stop the others. Ends the batch
+		Returns a list with a dictionary per figure, in the order they were queued, with the "filename", the "files"
+		that were written, the files that were "skipped" as they were up to date (see useRenderCache), and the "error"
+		(None if the figure was written)"""
+
+		batch, self.__batch = self.__batch or [], None
+		results = []
+		tasks = []
+		fileKeys = {}
+		for fig, filename, config in batch:
+			result = {"filename": filename, "files": [], "skipped": [], "error": None}
+			results.append(result)
+			try:
+				saveFiles, result["skipped"], figureFileKeys = self.__selectChangedFiles(
+					fig, self.__getSaveFiles(filename), config)
+			except Exception as error:
+				result["error"] = str(error)
+				continue
+			if saveFiles:
+				fileKeys.update(figureFileKeys)
+				tasks.append((result, fig, saveFiles, config))
+
+		def setOutcome(result, saveFiles, error):
+			result["error"] = error
+			if error is None:
+				result["files"] = [saveFilename for fileFormat, saveFilename, includePlotlyJs in saveFiles]
+
+		if workers == 1 or len(tasks) <= 1:
+			for result, fig, saveFiles, config in tasks:
+				setOutcome(result, saveFiles, self.renderBatchFigure(fig, saveFiles, config, self.__imageExporter))
+		else:
+			imageScale = self.__imageExporter.scale if self.__imageExporter else None
+			with ProcessPoolExecutor(max_workers=workers) as executor:
+				futures = []
+				for result, fig, saveFiles, config in tasks:
+					if isinstance(fig, go.Figure):
+						# sent as a dictionary, which unpickles much faster as it isn't checked again
+						futures.append(executor.submit(self.renderBatchFigure, fig.to_dict(), saveFiles, config, None,
+													   imageScale, False))
+					else:
+						futures.append(executor.submit(self.renderBatchFigure, fig, saveFiles, config, None, imageScale))
+
+				for (result, fig, saveFiles, config), future in zip(tasks, futures):
+					try:
+						setOutcome(result, saveFiles, future.result())
+					except Exception as error:  # e.g. a figure that can't be sent to the worker process
+						setOutcome(result, saveFiles, str(error) or repr(error))
+
+		self.__updateRenderCache([saveFile for result, fig, saveFiles, config in tasks if result["error"] is None
+								  for saveFile in saveFiles], fileKeys)
+		return results
+
+	@staticmethod
+	def renderBatchFigure(fig, saveFiles, config=None, imageExporter=None, imageScale=None, validate=True):
+		"""Writes one figure of a batch, see writeFigureFiles. Runs in a worker process, where images are made with a
+		LocalImageExporter per process if imageScale is given, which stays running for the next figures
+		Returns None if the figure was written, or else the error"""
+
+		if imageExporter is None and imageScale is not None:
+			if imageScale not in PlotlyViz.__workerImageExporters:
+				PlotlyViz.__workerImageExporters[imageScale] = LocalImageExporter(imageScale)
+			imageExporter = PlotlyViz.__workerImageExporters[imageScale]
+		try:
+			PlotlyViz.writeFigureFiles(fig, saveFiles, config, imageExporter, validate)
+		except Exception as error:
+			return str(error) or repr(error)
+		return None
+
+	def stopImageExport(self):
+		"""Stops the renderer of the local image export, so the next export starts it again. kaleido 0.2.1 keeps its
+		browser process running until Python exits, see LocalImageExporter
+		Returns no values"""
+		if self.__imageExporter:
+			self.__imageExporter.stop()
+
+	def __getSharedPlotlyJs(self, htmlFilename):
+		"""Writes the plotly.js library to the save folder, unless it is already there. The version is in the file
+		name, so html files made with another version of plotly keep working
+		Returns the path of the library relative to the html file, to use in its script tag"""
+
+		htmlFolder = os.path.dirname(os.path.abspath(htmlFilename))
+		libraryFolder = os.path.abspath(self.__saveInFolder) if self.__saveInFolder else htmlFolder
+		libraryFilename = os.path.join(libraryFolder, "plotly-%s.min.js" % plotly.offline.get_plotlyjs_version())
+
+		if not os.path.exists(libraryFilename):
+			# write to a temporary file first, so no html file can refer to a half-written library
+			fileDescriptor, temporaryFilename = tempfile.mkstemp(suffix=".js", dir=libraryFolder)
+			with os.fdopen(fileDescriptor, "w", encoding="utf-8") as libraryFile:
+				libraryFile.write(plotly.offline.get_plotlyjs())
+			os.chmod(temporaryFilename, 0o644)  # readable by a web server, like the html files
+			os.replace(temporaryFilename, libraryFilename)
+
+		return os.path.relpath(libraryFilename, htmlFolder).replace(os.sep, "/")
 			
 	def combineRemainingSegmentsIntoOtherCategory(self, pieSegments, numberOfValuesToShow):
 		"""Given a dictionary of pie segments (key is segment label, value is segment value), keeps the top
@@ -184,13 +382,17 @@ class PlotlyViz:
 		
 		self.__plotGraph(fig, filename)
 
-	def createMultipleVariablesOverTimeAsLineGraphsFigure(self, variableValues, labels, timelines, plotTitle, xAxisTitle, yAxisTitle, margin,colours=[NISVHouseStyle.BLUE, NISVHouseStyle.PINK,NISVHouseStyle.GREEN,NISVHouseStyle.ORANGE, NISVHouseStyle.GREY,NISVHouseStyle.YELLOW,NISVHouseStyle.PURPLE,NISVHouseStyle.LILAC], width=600, height=500):
+	def createMultipleVariablesOverTimeAsLineGraphsFigure(self, variableValues, labels, timelines, plotTitle, xAxisTitle, yAxisTitle, margin,colours=[NISVHouseStyle.BLUE, NISVHouseStyle.PINK,NISVHouseStyle.GREEN,NISVHouseStyle.ORANGE, NISVHouseStyle.GREY,NISVHouseStyle.YELLOW,NISVHouseStyle.PURPLE,NISVHouseStyle.LILAC], width=600, height=500, useWebGL=False, maxPoints=None, downsamplingMethod=Downsampling.LTTB):
 		"""Creates a figure with each variable over time as a line.  'variableValues' should be a list containing lists
 		of each value over time, 'labels' a list with the name for each variable, timelines a list containing lists of
 		the time values for each variable (it is not assumed that these are the same for all series.  The figure and
 		axis titles must also be specified.
 		Optionally, you can enter a dict as the margin, to set the size of the graph margins (useful if text is
 		overlapping). See plotly documentation for more information
+		For long series, useWebGL draws the lines with WebGL (Scattergl), which stays fast with many points, and
+		maxPoints reduces each series with more points to about that many, with downsamplingMethod
+		Downsampling.LTTB (keeps the shape of the line) or Downsampling.MINMAX (keeps the lowest and highest point per
+		maxPoints / 2 wide section of the x axis), see Downsampling
 		Returns a Plotly figure as a dictionary"""
 		
 		# check that we have the right number of labels and data series
@@ -200,12 +402,18 @@ class PlotlyViz:
 		data = []
 		i = 0
 				
+		traceType = go.Scattergl if useWebGL else go.Scatter
 		for variableValue in variableValues:  # add each variable value as a line, with its label
-			trace = go.Scatter(
+			timeline = timelines[i]
+			if maxPoints and len(variableValue) > maxPoints:
+				positions = Downsampling.downsample(timeline, variableValue, maxPoints, downsamplingMethod)
+				timeline = Downsampling.selectPoints(timeline, positions)
+				variableValue = Downsampling.selectPoints(variableValue, positions)
+			trace = traceType(
 						
-						x=timelines[i], 
+						x=timeline, 
 						y=variableValue, 
-						text=self.formatOverlayHoverInfo(timelines[i], variableValue, labels[i]),
+						text=self.formatOverlayHoverInfo(timeline, variableValue, labels[i]),
 						hoverinfo='text',
 						mode='lines', 
 						name=labels[i],
@@ -245,17 +453,18 @@ class PlotlyViz:
 		
 		return fig
 
-	def plotMultipleVariablesOverTimeAsLineGraphs(self, variableValues, labels, timelines, plotTitle, xAxisTitle, yAxisTitle, margin,filename, colours = [NISVHouseStyle.BLUE, NISVHouseStyle.PINK,NISVHouseStyle.GREEN,NISVHouseStyle.ORANGE, NISVHouseStyle.GREY,NISVHouseStyle.YELLOW,NISVHouseStyle.PURPLE,NISVHouseStyle.LILAC], width=600, height=500):
+	def plotMultipleVariablesOverTimeAsLineGraphs(self, variableValues, labels, timelines, plotTitle, xAxisTitle, yAxisTitle, margin,filename, colours = [NISVHouseStyle.BLUE, NISVHouseStyle.PINK,NISVHouseStyle.GREEN,NISVHouseStyle.ORANGE, NISVHouseStyle.GREY,NISVHouseStyle.YELLOW,NISVHouseStyle.PURPLE,NISVHouseStyle.LILAC], width=600, height=500, useWebGL=False, maxPoints=None, downsamplingMethod=Downsampling.LTTB):
 		"""Plots each variable over time as a line.  'variableValues' should be a list containing lists of each value
 		over time,'labels' a list with the label for each variable, timelines a list containing lists of the time values
 		for each variable (it is not assumed that these are the same for all series.  The plot and axis titles must
 		also be specified.  The plot is plotted under the given filename
 		Optionally, you can enter a dict as the margin, to set the size of the graph margins (useful if text is
 		overlapping). See plotly documentation for more information
+		useWebGL, maxPoints and downsamplingMethod are for long series, see createMultipleVariablesOverTimeAsLineGraphsFigure
 		Returns no values, the graph is written to the Plotly website, to a HTML file, or displayed depending on the mode
 		"""
 
-		fig = self.createMultipleVariablesOverTimeAsLineGraphsFigure(variableValues, labels, timelines, plotTitle, xAxisTitle, yAxisTitle, margin,colours, width, height)
+		fig = self.createMultipleVariablesOverTimeAsLineGraphsFigure(variableValues, labels, timelines, plotTitle, xAxisTitle, yAxisTitle, margin,colours, width, height, useWebGL, maxPoints, downsamplingMethod)
 		
 		self.__plotGraph(fig, filename)
 		
@@ -0,0 +1,76 @@
+"""This class remembers which figures have already been written to which files, so that a figure that hasn't changed
+is not rendered and written again, e.g. when a notebook or report is run again and only some of the data has changed.
+
+A figure is identified by a hash of its JSON and config, and each file by the hash of the figure together with the
+format and the settings the file is written with (e.g. the image scale). The hashes of the files written are kept
+in a small manifest file, render-cache.json, in the folder. A file is up to date if it still exists with the size it
+was written with, and its hash is the same as the new one.
+"""
+import hashlib
+import json
+import os
+import tempfile
+import plotly
+from plotly.utils import PlotlyJSONEncoder
+
+class RenderCache:
+
+	MANIFEST_FILENAME = "render-cache.json"
+
+	def __init__(self, folder=None):
+		"""Initialises the cache for the files in a folder (by default the working folder), reading its manifest if
+		there is one"""
+		self.folder = folder or "."
+		self.manifestFilename = os.path.join(self.folder, self.MANIFEST_FILENAME)
+		self.__entries = {}
+		if os.path.exists(self.manifestFilename):
+			try:
+				with open(self.manifestFilename, encoding="utf-8") as manifestFile:
+					self.__entries = json.load(manifestFile)
+			except ValueError:  # a damaged manifest means everything is written again
+				self.__entries = {}
+
+	@staticmethod
+	def getFigureHash(fig, config=None):
+		"""Calculates a hash of the figure (a plotly figure or dictionary) and config, which doesn't depend on the
+		order of the keys
+		Returns the hash as a hexadecimal string"""
+		if hasattr(fig, "to_plotly_json"):
+			fig = fig.to_plotly_json()
+		content = json.dumps([fig, config], cls=PlotlyJSONEncoder, sort_keys=True)
+		return hashlib.sha256(content.encode("utf-8")).hexdigest()
+
+	@staticmethod
+	def getFileKey(figureHash, fileFormat, settings=None):
+		"""Combines the hash of a figure with the format and the other settings of the file, e.g. the image scale.
+		The version of plotly is included, as a new version can write the same figure differently
+		Returns the key as a hexadecimal string"""
+		content = json.dumps([figureHash, fileFormat, settings, plotly.__version__], sort_keys=True, default=str)
+		return hashlib.sha256(content.encode("utf-8")).hexdigest()
+
+	def __getEntryName(self, filename):
+		return os.path.relpath(os.path.abspath(filename), os.path.abspath(self.folder)).replace(os.sep, "/")
+
+	def isUpToDate(self, filename, key):
+		"""Checks whether the file was written with this key, and hasn't been changed or removed since"""
+		entry = self.__entries.get(self.__getEntryName(filename))
+		if entry is None or entry["key"] != key:
+			return False
+		try:
+			return os.path.getsize(filename) == entry["size"]
+		except OSError:
+			return False
+
+	def update(self, filename, key):
+		"""Records that the file has been written with this key. The manifest is only written by save
+		Returns no values"""
+		self.__entries[self.__getEntryName(filename)] = {"key": key, "size": os.path.getsize(filename)}
+
+	def save(self):
+		"""Writes the manifest, via a temporary file so an interrupted write doesn't damage it
+		Returns no values"""
+		fileDescriptor, temporaryFilename = tempfile.mkstemp(suffix=".json", dir=self.folder)
+		with os.fdopen(fileDescriptor, "w", encoding="utf-8") as manifestFile:
+			json.dump(self.__entries, manifestFile, indent=1, sort_keys=True)
+		os.chmod(temporaryFilename, 0o644)
+		os.replace(temporaryFilename, self.manifestFilename)